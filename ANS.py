@@ -0,0 +1,235 @@
+"""
+Compression with asymmetric numeral systems (rANS), a static order-0 entropy coder like Huffman coding that is not
+limited to codes of a whole number of bits, so it gets as close to the order-0 entropy as arithmetic coding, while
+decoding every byte with a few table lookups. In order to run the code please do the following:
+
+To compress dickens text file please run in the terminal:
+    python ANS.py compress dickens.txt [--scale-bits N]
+You will get the file 'dickens_compressed.ans'. This is the compressed file. Moreover, you will get a calculation of
+how long the compression was taking and how many percents the size of the compressed file is from the original file.
+
+To decompress dickens text file please run in the terminal:
+    python ANS.py decompress dickens_compressed.ans
+You will get the file 'dickens_decompressed.txt'. This is the file after decompression.
+
+The bytes are counted in a first pass and their counts are normalized to a total of 2^scale-bits (2^12 by default)
+like in static_arithmetic.py. The decoding table gives, for every slot from 0 to that total, the byte whose range of
+slots holds it, its frequency and its offset in that range, so a byte is decoded from the low bits of the state with
+a single lookup. The encoder codes the bytes backwards, so that the decoder reads them forwards. LANES states are
+interleaved, byte i being coded with state i % LANES, which keeps their dependency chains apart. A state stays in
+[STATE_LOW, STATE_LOW * 256) and is renormalized a byte at a time.
+
+Both the input and the output files are memory-mapped (see mmapio.py).
+
+The compressed file starts with a header:
+    magic "ANSC", version (1 byte), scale bits (1 byte), original size (8 bytes), CRC-32 of the original data (4
+    bytes), the normalized frequencies (a bitmap of the byte values that occur and 2 bytes for each of them, see
+    static_arithmetic.py)
+followed by blocks of BLOCK_SIZE original bytes (the last one may be shorter). Every block is its coded size (4
+bytes), the initial states of the decoder (4 bytes each) and the renormalization bytes. All the numbers are big endian.
+"""
+
+import argparse
+import functools
+import struct
+import sys
+import time
+import zlib
+import mmapio
+import static_arithmetic
+import summary
+
+# Default number of bits of the total of the normalized frequencies.
+SCALE_BITS = 12
+MIN_SCALE_BITS = static_arithmetic.MIN_SCALE_BITS
+MAX_SCALE_BITS = static_arithmetic.MAX_SCALE_BITS
+
+# Number of interleaved states, and the lower bound of a state.
+LANES = 4
+STATE_LOW = 1 << 23
+
+# Number of original bytes in every block, the encoder holds a whole block in memory.
+BLOCK_SIZE = 1 << 20
+
+MAGIC = b"ANSC"
+VERSION = 1
+HEADER = struct.Struct(">4sBBQI{}s".format(static_arithmetic.NUM_SYMBOLS // 8))
+BLOCK_LENGTH = struct.Struct(">I")
+STATES = struct.Struct(">{}I".format(LANES))
+
+
+class ANSTables:
+    """
+    Class to hold the encoding and decoding tables of a normalized histogram
+    """
+    def __init__(self, freqs, scale_bits):
+        self.freqs = freqs
+        self.scale_bits = scale_bits
+        # encoding: the start of the range of slots of every byte, and the bound above which a state must be
+        # renormalized before coding that byte, so that it is back in range afterwards
+        self.starts = []
+        self.bounds = []
+        start = 0
+        for freq in freqs:
+            self.starts.append(start)
+            self.bounds.append(((STATE_LOW >> scale_bits) << 8) * freq)
+            start += freq
+        # decoding: for every slot, the byte, its frequency and the offset of the slot in its range
+        self.symbols = bytearray()
+        self.slot_freqs = []
+        self.slot_offsets = []
+        for symbol, freq in enumerate(freqs):
+            self.symbols += bytes([symbol]) * freq
+            self.slot_freqs += [freq] * freq
+            self.slot_offsets += range(freq)
+
+
+def encode_block(data, tables):
+    """
+    Code the given bytes, backwards, and return the coded block: the final states, which the decoder starts from,
+    and the renormalization bytes in the order the decoder reads them
+    """
+    freqs = tables.freqs
+    starts = tables.starts
+    bounds = tables.bounds
+    scale_bits = tables.scale_bits
+    states = [STATE_LOW] * LANES
+    emitted = bytearray()
+    for i in range(len(data) - 1, -1, -1):
+        symbol = data[i]
+        lane = i % LANES
+        state = states[lane]
+        bound = bounds[symbol]
+        while state >= bound:
+            emitted.append(state & 0xFF)
+            state >>= 8
+        quotient, remainder = divmod(state, freqs[symbol])
+        states[lane] = (quotient << scale_bits) + remainder + starts[symbol]
+    emitted.reverse()
+    return STATES.pack(*states) + emitted
+
+
+def decode_block(block, decoded_size, tables):
+    """
+    Decode a block coded by encode_block back to its decoded_size bytes
+    """
+    if len(block) < STATES.size:
+        raise ValueError("Truncated ANS block")
+    states = list(STATES.unpack_from(block))
+    position = STATES.size
+    symbols = tables.symbols
+    slot_freqs = tables.slot_freqs
+    slot_offsets = tables.slot_offsets
+    scale_bits = tables.scale_bits
+    mask = (1 << scale_bits) - 1
+    decoded = bytearray(decoded_size)
+    try:
+        for i in range(decoded_size):
+            lane = i % LANES
+            state = states[lane]
+            slot = state & mask
+            decoded[i] = symbols[slot]
+            state = slot_freqs[slot] * (state >> scale_bits) + slot_offsets[slot]
+            while state < STATE_LOW:
+                state = (state << 8) | block[position]
+                position += 1
+            states[lane] = state
+    except IndexError:
+        raise ValueError("Truncated ANS block")
+    if position != len(block) or states != [STATE_LOW] * LANES:
+        raise ValueError("Corrupt ANS block")
+    return decoded
+
+
+class ANSCoding:
+    """
+    Main class of rANS coding, with the same entry points as HuffmanCoding
+    """
+    def __init__(self, scale_bits=SCALE_BITS):
+        if not (MIN_SCALE_BITS <= scale_bits <= MAX_SCALE_BITS):
+            raise ValueError("Scale bits must be between {} and {}".format(MIN_SCALE_BITS, MAX_SCALE_BITS))
+        self.scale_bits = scale_bits
+
+    def compress(self, filename):
+        """
+        final function to compress our text file
+        """
+        start = time.time()
+        # first pass: count the bytes
+        file_text = mmapio.open_input(filename)
+        counts, original_size, crc = static_arithmetic.count_bytes(file_text)
+        freqs = static_arithmetic.scale_counts(counts, self.scale_bits)
+        tables = ANSTables(freqs, self.scale_bits)
+
+        # second pass: write the header and then the blocks
+        filename_split = filename.split('.')
+        f = mmapio.open_output(filename_split[0] + "_compressed.ans")
+        bitmap, packed = static_arithmetic.pack_frequencies(freqs)
+        f.write(HEADER.pack(MAGIC, VERSION, self.scale_bits, original_size, crc, bitmap) + packed)
+        file_text.seek(0)
+        for data in iter(functools.partial(file_text.read, BLOCK_SIZE), b''):
+            encoded = encode_block(data, tables)
+            f.write(BLOCK_LENGTH.pack(len(encoded)) + encoded)
+        f.close()
+        file_text.close()
+
+        # MISC
+        print('Compression Done!')
+        summary.print_summary(filename, filename_split[0] + "_compressed.ans", start)
+
+    def decompress(self, compressedfile):
+        """
+        Final function for decompression
+        """
+        start = time.time()
+        filename_split = compressedfile.split('_')
+        f = mmapio.open_input(compressedfile)
+        header = f.read(HEADER.size)
+        if len(header) != HEADER.size:
+            raise ValueError("File is too short to be ANS compressed")
+        magic, version, scale_bits, original_size, crc, bitmap = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError("Not an ANS compressed file")
+        if version != VERSION:
+            raise ValueError("Unsupported ANS format version {}".format(version))
+        freqs = static_arithmetic.read_frequencies(f, bitmap)
+        if not (MIN_SCALE_BITS <= scale_bits <= MAX_SCALE_BITS) or \
+                sum(freqs) != (1 << scale_bits if original_size else 0):
+            raise ValueError("Header of the ANS compressed file is corrupt")
+        tables = ANSTables(freqs, scale_bits)
+
+        # decompress start here, block by block
+        write = mmapio.open_output(filename_split[0] + "_decompressed.txt", original_size)
+        remaining = original_size
+        decoded_crc = 0
+        while remaining > 0:
+            length = f.read(BLOCK_LENGTH.size)
+            if len(length) != BLOCK_LENGTH.size:
+                raise ValueError("Truncated ANS compressed file")
+            block = f.read(BLOCK_LENGTH.unpack(length)[0])
+            count = min(remaining, BLOCK_SIZE)
+            decoded = decode_block(block, count, tables)
+            decoded_crc = zlib.crc32(decoded, decoded_crc)
+            write.write(decoded)
+            remaining -= count
+        write.close()
+        f.close()
+        if decoded_crc != crc:
+            raise ValueError("Decompressed data does not match its CRC-32")
+        print('Decompression Done!')
+        end = time.time()
+        print(round((end - start), 3), "s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="rANS compression and decompression")
+    parser.add_argument('command', choices=['compress', 'decompress'])
+    parser.add_argument('file')
+    parser.add_argument('--scale-bits', type=int, default=SCALE_BITS,
+                        help="number of bits of the total of the normalized frequencies ({} to {})".format(
+                            MIN_SCALE_BITS, MAX_SCALE_BITS))
+    args = parser.parse_args(sys.argv[1:])
+    if args.command == 'compress':
+        ANSCoding(args.scale_bits).compress(args.file)
+    else:
+        ANSCoding().decompress(args.file)
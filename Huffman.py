@@ -11,15 +11,103 @@ To decompress dickens text file please run in the terminal:
 You will get the file 'dickens_decompressed.txt'. This is the file after decompression. Moreover, you will get a
 calculation of how long the decompression was taking. You can also check and see the decompressed file is equal to
 the original one.
+
+To compress a big file in parallel, in independently coded blocks, please run in the terminal:
+    python Huffman.py compress dickens.txt --blocks [--block-size BYTES] [--block-tables] [--workers N]
+Such a file is decompressed in parallel too, with the same decompress command (and optionally --workers N).
+
+The file is compressed byte by byte with canonical Huffman codes, so only the code length of every byte value has to
+be stored. The compressed file starts with a fixed binary header:
+    magic "HUFC", version (1 byte), flags (1 byte), original size (8 bytes, big endian)
+followed by the 256 code lengths, packed two per byte when they all fit in a nibble (flag FLAG_NIBBLES) and one per
+byte otherwise, and then the codes of all the bytes, packed from the most significant bit and padded with zeros.
+In block mode (flag FLAG_BLOCKS) the body is a sequence of blocks, each one padded to a whole byte and optionally
+starting with code lengths of its own (flag FLAG_BLOCK_TABLES), followed by an index of the blocks and a footer.
+
+To read a range of the original bytes without decompressing the whole file, compress it with checkpoints:
+    python Huffman.py compress dickens.txt --checkpoints BYTES
+    python Huffman.py read dickens_compressed.bin --offset N --length N
+With --checkpoints (flag FLAG_CHECKPOINTS), the bit offset in the body of the code of every BYTES-th original byte is
+written after the body, in a checkpoint index and a footer like the block index. read_range(path, offset, length)
+decodes from the last checkpoint at or before the offset, so a read decodes at most BYTES bytes more than it returns.
+Block mode files are read from the start of the block that holds the offset, and other files from their start.
+
+The files are memory-mapped (see mmapio.py). When NumPy is installed, the bytes are counted and their codes are packed
+with NumPy array operations instead of one byte at a time, which is much faster. The compressed file is exactly the
+same either way.
 """
 
 import os
 import heapq
+import argparse
 import collections
+import concurrent.futures
+import functools
 import operator
-import ast
+import struct
 import sys
 import time
+import mmapio
+import parallel
+import summary
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Number of bits that index the first level decoding table. Longer codes continue in a second level table.
+LOOKUP_BITS = 11
+
+# Number of different symbols, the code length of each one is stored in the header.
+NUM_SYMBOLS = 256
+
+# Number of bytes read or decoded at a time, so the memory used does not depend on the size of the file.
+CHUNK_SIZE = 1 << 20
+
+# Magic number, format version, flags and original size at the start of every compressed file.
+MAGIC = b"HUFC"
+VERSION = 1
+HEADER = struct.Struct(">4sBBQ")
+
+# Header flag: the code lengths are packed two per byte.
+FLAG_NIBBLES = 0x01
+# Header flag: the file is made of independently coded blocks, listed in an index at its end.
+FLAG_BLOCKS = 0x02
+# Header flag: every block starts with its own code lengths (a flags byte and the lengths) instead of sharing the
+# code lengths that follow the header.
+FLAG_BLOCK_TABLES = 0x04
+# Header flag: the body is followed by a checkpoint index and a footer.
+FLAG_CHECKPOINTS = 0x08
+
+# Default number of original bytes in every block of a block mode file.
+BLOCK_SIZE = 1 << 22
+
+# Block index entry (offset of the block in the file, its compressed size and its decoded size), and the footer at
+# the very end of a block mode file (offset of the index, number of blocks and a magic number).
+INDEX_ENTRY = struct.Struct(">QQQ")
+FOOTER = struct.Struct(">QI4s")
+INDEX_MAGIC = b"HUFI"
+
+# Checkpoint index: the number of original bytes between checkpoints, and then the bit offset in the body of the code
+# of every checkpoint's byte (bytes 0, interval, 2 * interval, ...). It is followed by a footer like the block index,
+# with its own magic number.
+CHECKPOINT_INTERVAL = struct.Struct(">Q")
+CHECKPOINT_ENTRY = struct.Struct(">Q")
+CHECKPOINT_MAGIC = b"HUFX"
+
+# Whether the bytes are counted and packed with NumPy. It is used when it is installed, set to False to use the pure
+# Python code.
+USE_NUMPY = numpy is not None
+
+# Longest code that the NumPy packer handles, the codes are held in 64 bit integers. Longer codes need counts of
+# astronomical sizes, but such codes are still packed by BitPacker.
+NUMPY_MAX_CODE_LENGTH = 64
+
+# Number of bytes the NumPy packer codes at a time. Its arrays take a few bytes for every bit of the codes, so the
+# chunks are split to keep them small.
+NUMPY_PACK_SIZE = 1 << 16
 
 
 class HeapNode:
@@ -36,20 +124,186 @@ class HeapNode:
         return other.freq > self.freq
 
 
+class BitPacker:
+    """
+    Class to pack codes into bytes chunk by chunk. The bits that do not fill a whole 64 bit word yet are kept in an
+    integer bit buffer until the next chunk.
+    """
+    def __init__(self, code_values):
+        self.code_values = code_values
+        # translation table from a byte to its code length, to count the bits of a chunk at C speed
+        self.length_table = bytes(code[1] if code is not None else 0 for code in code_values)
+        self.buffer = 0
+        self.buffered = 0
+
+    def pack(self, text):
+        """
+        Encode the bytes of text and return the whole 64 bit words that are ready, in a bytearray that is allocated
+        once with its final size
+        """
+        if isinstance(text, memoryview):  # read from a mapped file, see mmapio.py
+            text = text.tobytes()
+        code_values = self.code_values
+        buffer = self.buffer
+        buffered = self.buffered
+        total_bits = buffered + sum(text.translate(self.length_table))
+        encoded = bytearray(total_bits // 64 * 8)
+
+        position = 0
+        for char in text:
+            value, length = code_values[char]
+            buffer = (buffer << length) | value
+            buffered += length
+            if buffered >= 64:
+                buffered -= 64
+                encoded[position:position + 8] = (buffer >> buffered).to_bytes(8, 'big')
+                position += 8
+                buffer &= (1 << buffered) - 1
+
+        self.buffer = buffer
+        self.buffered = buffered
+        return encoded
+
+    def flush(self):
+        """
+        Return the remaining bits, padded with zeros up to a whole byte
+        """
+        num_bytes = (self.buffered + 7) // 8
+        flushed = (self.buffer << (8 * num_bytes - self.buffered)).to_bytes(num_bytes, 'big')
+        self.buffer = 0
+        self.buffered = 0
+        return flushed
+
+
+class NumpyBitPacker:
+    """
+    Class to pack codes into bytes chunk by chunk with NumPy, giving the same bytes as BitPacker. The bit offset of
+    every code is the running sum of the code lengths, and every code is spread to one byte per bit at its offset
+    before the bits are packed into bytes. The bits that do not fill a whole byte yet are kept until the next chunk.
+    """
+    def __init__(self, code_values):
+        self.values = numpy.zeros(NUM_SYMBOLS, dtype=numpy.uint64)
+        self.lengths = numpy.zeros(NUM_SYMBOLS, dtype=numpy.int64)
+        for char, code in enumerate(code_values):
+            if code is not None:
+                self.values[char], self.lengths[char] = code
+        self.pending = numpy.zeros(0, dtype=numpy.uint8)  # the bits that were not packed yet, one per byte
+
+    def pack(self, text):
+        """
+        Encode the bytes of text and return the whole bytes that are ready
+        """
+        symbols = numpy.frombuffer(text, dtype=numpy.uint8)
+        return b''.join(self.pack_symbols(symbols[start:start + NUMPY_PACK_SIZE])
+                        for start in range(0, len(symbols), NUMPY_PACK_SIZE))
+
+    def pack_symbols(self, symbols):
+        """
+        Encode the bytes of the given array and return the whole bytes that are ready
+        """
+        lengths = self.lengths[symbols]
+        ends = numpy.cumsum(lengths)
+        total_bits = int(ends[-1])
+
+        # for every bit of the output: the code it belongs to and how many bits of that code follow it
+        owner = numpy.repeat(numpy.arange(len(symbols)), lengths)
+        shift = ends[owner] - 1 - numpy.arange(total_bits)
+        bits = numpy.empty(len(self.pending) + total_bits, dtype=numpy.uint8)
+        bits[:len(self.pending)] = self.pending
+        bits[len(self.pending):] = (self.values[symbols[owner]] >> shift.astype(numpy.uint64)) & numpy.uint64(1)
+
+        ready = len(bits) // 8 * 8
+        self.pending = bits[ready:]
+        return numpy.packbits(bits[:ready]).tobytes()
+
+    def flush(self):
+        """
+        Return the remaining bits, padded with zeros up to a whole byte
+        """
+        flushed = numpy.packbits(self.pending).tobytes()
+        self.pending = numpy.zeros(0, dtype=numpy.uint8)
+        return flushed
+
+
+def new_bit_packer(code_values):
+    """
+    Return the packer for the given codes, NumpyBitPacker when NumPy is used and the codes fit in its integers and
+    BitPacker otherwise
+    """
+    if USE_NUMPY and all(code is None or code[1] <= NUMPY_MAX_CODE_LENGTH for code in code_values):
+        return NumpyBitPacker(code_values)
+    return BitPacker(code_values)
+
+
+class CheckpointCounter:
+    """
+    Class to find the bit offsets of the checkpoints chunk by chunk, by adding up the code lengths of the bytes
+    between them, in the same order as the packer codes them
+    """
+    def __init__(self, code_lengths, interval):
+        # translation table from a byte to its code length, to count the bits at C speed
+        self.length_table = bytes(code_lengths)
+        self.interval = interval
+        self.position = 0  # number of bytes counted
+        self.bits = 0  # number of bits of their codes
+        self.offsets = []
+
+    def count(self, text):
+        """
+        Count the bits of the codes of text, recording the bit offset of every checkpoint it holds
+        """
+        if isinstance(text, memoryview):  # read from a mapped file, see mmapio.py
+            text = text.tobytes()
+        start = 0
+        while start < len(text):
+            if self.position % self.interval == 0:
+                self.offsets.append(self.bits)
+            end = min(len(text), start + self.interval - self.position % self.interval)
+            self.bits += sum(text[start:end].translate(self.length_table))
+            self.position += end - start
+            start = end
+
+
+class BitReader:
+    """
+    Class to hold the reading position in the packed codes and the decoder's bit buffer between calls, so the body
+    can be decoded chunk by chunk. The bytes come from 'block' first and then from the input file, if there is one.
+    """
+    def __init__(self, inp, block=b''):
+        self.input = inp
+        self.block = block
+        self.position = 0
+        self.buffer = 0  # the lowest 'buffered' bits are the next bits of the input
+        self.buffered = 0
+
+    def read_block(self):
+        """
+        Return the next block of the input file, or an empty block at its end
+        """
+        if self.input is None:
+            return b''
+        return self.input.read(CHUNK_SIZE)
+
+
 class HuffmanCoding:
     """
     Main class of Huffman coding
     """
     def __init__(self):
         self.heap = []
-        self.codes = {}
-        self.reverse_mapping = {}
+        self.code_lengths = [0] * NUM_SYMBOLS
+        self.code_values = [None] * NUM_SYMBOLS
 
-    def make_frequency_dict(self, text):
+    def make_frequency_dict(self, chunks):
         """
-        make frequency dictionaries with sorted value from low to high
+        make frequency dictionaries with sorted value from low to high, counting the given chunks one by one
         """
-        counted = dict(collections.Counter(text))
+        if USE_NUMPY:
+            return self.make_frequency_dict_numpy(chunks)
+        counter = collections.Counter()
+        for chunk in chunks:
+            counter.update(chunk)
+        counted = dict(counter)
         sort = collections.OrderedDict(
             sorted(
                 counted.items(),
@@ -57,6 +311,25 @@ class HuffmanCoding:
                 reverse=False))
         return sort
 
+    def make_frequency_dict_numpy(self, chunks):
+        """
+        make_frequency_dict with NumPy. Bytes with equal counts stay in the order they first appear in, like in the
+        Counter, so the codes do not change
+        """
+        counts = numpy.zeros(NUM_SYMBOLS, dtype=numpy.int64)
+        first_seen = numpy.full(NUM_SYMBOLS, -1, dtype=numpy.int64)
+        position = 0
+        for chunk in chunks:
+            symbols = numpy.frombuffer(chunk, dtype=numpy.uint8)
+            counts += numpy.bincount(symbols, minlength=NUM_SYMBOLS)
+            present, first = numpy.unique(symbols, return_index=True)
+            new = first_seen[present] < 0
+            first_seen[present[new]] = first[new] + position
+            position += len(symbols)
+        seen = numpy.flatnonzero(counts)
+        order = numpy.lexsort((first_seen[seen], counts[seen]))
+        return collections.OrderedDict((int(char), int(counts[char])) for char in seen[order])
+
     def make_heap_node(self, freq_dict):
         """
         make a heap queue from node
@@ -79,190 +352,537 @@ class HuffmanCoding:
 
     # from here we have the actual huffman coding
 
-    def encode_helper(self, root, current_code):
+    def encode_helper(self, root, current_length):
         """
-        Helper function for encoding
+        Helper function for encoding, only the depth of every leaf (its code length) is recorded
         """
         if root is None:
             return
 
         if root.char is not None:
-            self.codes[root.char] = current_code
+            self.code_lengths[root.char] = current_length
             return
 
-        self.encode_helper(root.left, current_code + "0")
-        self.encode_helper(root.right, current_code + "1")
+        self.encode_helper(root.left, current_length + 1)
+        self.encode_helper(root.right, current_length + 1)
 
     def encode(self):
         """
         Main Function of encoding
         """
-        root = heapq.heappop(self.heap)
-        current_code = ""
-        self.encode_helper(root, current_code)
-
-    def get_encoded_text(self, text):
+        self.code_lengths = [0] * NUM_SYMBOLS
+        if self.heap:
+            root = heapq.heappop(self.heap)
+            # a text with a single distinct byte still needs a one bit code for it
+            current_length = 0 if root.char is None else 1
+            self.encode_helper(root, current_length)
+        self.make_canonical_codes()
+
+    def make_canonical_codes(self):
         """
-        Function to create and get the encoded text
+        Assign canonical codes from the code lengths: the codes are handed out in increasing order of (length, byte),
+        every code being the previous one plus 1 and shifted left when the length grows. The decoder can rebuild the
+        very same codes from the lengths alone.
         """
-        encoded_text = ""
-        for char in text:
-            encoded_text += self.codes[char]
-        return encoded_text
-
-    def pad_encoded_text(self, encoded_text):
+        self.code_values = [None] * NUM_SYMBOLS
+        code = 0
+        previous_length = 0
+        for length, symbol in sorted((length, symbol) for symbol, length in enumerate(self.code_lengths) if length):
+            code <<= length - previous_length
+            self.code_values[symbol] = (code, length)
+            code += 1
+            previous_length = length
+
+    def pack_code_lengths(self):
         """
-        Padding the encoded text
+        Pack the code lengths, two per byte if they all fit in a nibble. Return the flag to record and the bytes
         """
-        # get the extra padding of encoded text
-        extra_padding = 8 - len(encoded_text) % 8
-        for i in range(extra_padding):
-            encoded_text += "0"
-        # merge the "info" of extra padding in "string/bit" with encoded text
-        # so we know how to truncate it later
-        padded_info = "{0:08b}".format(extra_padding)
-        new_text = padded_info + encoded_text
+        lengths = self.code_lengths
+        if max(lengths) <= 0x0F:
+            return FLAG_NIBBLES, bytes((lengths[i] << 4) | lengths[i + 1] for i in range(0, NUM_SYMBOLS, 2))
+        return 0, bytes(lengths)
 
-        return new_text
-
-    def to_byte_array(self, padded_encoded_text):
+    def read_code_lengths(self, data, position, flags):
         """
-        Convert to bytes
+        Unpack the code lengths that start at the given position of data and return the position after them
         """
-        if len(padded_encoded_text) % 8 != 0:
-            print('not padded properly')
-            exit(0)
-        b = bytearray()
-        for i in range(
-                0, len(padded_encoded_text), 8):  # loop every 8 character
-            byte = padded_encoded_text[i:i + 8]
-            b.append(int(byte, 2))  # base 2
-        return b
-
-    def compress(self, filename):
+        if flags & FLAG_NIBBLES:
+            packed = data[position:position + NUM_SYMBOLS // 2]
+            position += NUM_SYMBOLS // 2
+            lengths = []
+            for byte in packed:
+                lengths.append(byte >> 4)
+                lengths.append(byte & 0x0F)
+        else:
+            lengths = list(data[position:position + NUM_SYMBOLS])
+            position += NUM_SYMBOLS
+        if len(lengths) != NUM_SYMBOLS:
+            raise ValueError("Truncated Huffman code lengths")
+        self.code_lengths = lengths
+        return position
+
+    def make_header(self, original_size, flags=0):
         """
-        final function to compress our text file
+        Pack the fixed binary header together with the code lengths, unless every block has its own code lengths
         """
-        start = time.time()
-        file_text = open(filename, 'r')
-        lipsum = file_text.read()
-        # lipsum = lipsum.rstrip()
-        file_text.close()
+        if flags & FLAG_BLOCK_TABLES:
+            return HEADER.pack(MAGIC, VERSION, flags, original_size)
+        nibbles, packed = self.pack_code_lengths()
+        return HEADER.pack(MAGIC, VERSION, flags | nibbles, original_size) + packed
 
-        freq = self.make_frequency_dict(lipsum)
+    def read_header(self, data):
+        """
+        Unpack the header at the start of data, set the code lengths (if they are stored there) and return the
+        flags, the original size and the position where the body starts
+        """
+        if len(data) < HEADER.size:
+            raise ValueError("File is too short to be Huffman compressed")
+        magic, version, flags, original_size = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a Huffman compressed file")
+        if version != VERSION:
+            raise ValueError("Unsupported Huffman format version {}".format(version))
+
+        position = HEADER.size
+        if not flags & FLAG_BLOCK_TABLES:
+            position = self.read_code_lengths(data, position, flags)
+        return flags, original_size, position
+
+    def build_codes(self, chunks):
+        """
+        Count the bytes of the given chunks and build their canonical codes. Return the number of bytes counted
+        """
+        freq = self.make_frequency_dict(chunks)
+        self.heap = []
         self.make_heap_node(freq)
         self.merge_nodes()
         self.encode()
-        encoded_text = self.get_encoded_text(lipsum)
-        padded_encoded_text = self.pad_encoded_text(encoded_text)
-        byte_array_huff = self.to_byte_array(padded_encoded_text)
+        return sum(freq.values())
+
+    def compress(self, filename, checkpoint_interval=None):
+        """
+        final function to compress our text file. With a checkpoint_interval, a checkpoint index is written after the
+        body, so that read_range can start decoding every checkpoint_interval bytes.
+        """
+        start = time.time()
+        if checkpoint_interval is not None and checkpoint_interval < 1:
+            raise ValueError("Checkpoint interval must be positive")
+        # first pass: count the bytes
+        file_text = mmapio.open_input(filename)
+        original_size = self.build_codes(iter(functools.partial(file_text.read, CHUNK_SIZE), b''))
 
-        # write header
+        # second pass: write header and then the codes chunk by chunk
         filename_split = filename.split('.')
-        js = open(filename_split[0] + "_compressed.bin", 'wb')
-        strcode = str(self.codes)
-        js.write(strcode.encode())
-        js.close()
-
-        # append new line for separation
-        append = open(filename_split[0] + "_compressed.bin", 'a')
-        append.write('\n')
-        append.close()
-
-        # append the rest of the "byte array"
-        f = open(filename_split[0] + "_compressed.bin", 'ab')
-        f.write(bytes(byte_array_huff))
+        file_text.seek(0)
+        f = mmapio.open_output(filename_split[0] + "_compressed.bin")
+        f.write(self.make_header(original_size, 0 if checkpoint_interval is None else FLAG_CHECKPOINTS))
+        packer = new_bit_packer(self.code_values)
+        counter = None if checkpoint_interval is None else CheckpointCounter(self.code_lengths, checkpoint_interval)
+        for chunk in iter(functools.partial(file_text.read, CHUNK_SIZE), b''):
+            f.write(packer.pack(chunk))
+            if counter is not None:
+                counter.count(chunk)
+        f.write(packer.flush())
+
+        # write the checkpoint index and the footer that points to it
+        if counter is not None:
+            index_offset = f.tell()
+            f.write(CHECKPOINT_INTERVAL.pack(checkpoint_interval))
+            f.write(b''.join(CHECKPOINT_ENTRY.pack(bits) for bits in counter.offsets))
+            f.write(FOOTER.pack(index_offset, len(counter.offsets), CHECKPOINT_MAGIC))
         f.close()
+        file_text.close()
 
         # MISC
         print('Compression Done!')
-        get_original_filesize = os.path.getsize(filename)
-        get_compressed_filesize = os.path.getsize(
-            filename_split[0] + "_compressed.bin")
-        percentage = (get_compressed_filesize / get_original_filesize) * 100
-        print(round(percentage, 3), "%")
-        end = time.time()
-        print(round((end - start), 3), "s")
+        summary.print_summary(filename, filename_split[0] + "_compressed.bin", start)
 
-    def remove_padding(self, padded_encoded_text):
+    def compress_blocks(self, filename, workers=None, block_size=BLOCK_SIZE, block_tables=False):
         """
-        Function to remove the padding
+        final function to compress our text file in block mode. The file is split into blocks of block_size bytes
+        that are coded independently in a pool of worker processes, either with one set of codes for the whole file
+        or with codes of their own (block_tables). The offsets and sizes of the blocks are written in an index at
+        the end of the file, so they can be decoded in parallel as well.
         """
-        padded_info = padded_encoded_text[:8]
-        extra_padding = int(padded_info, 2)
-        padded_encoded_text = padded_encoded_text[8:]
-        encoded_text = padded_encoded_text[:-extra_padding]
-        return encoded_text
+        start = time.time()
+        if block_size < 1:
+            raise ValueError("Block size must be positive")
+        original_size = os.path.getsize(filename)
+        flags = FLAG_BLOCKS
+        if block_tables:
+            flags |= FLAG_BLOCK_TABLES
+            code_lengths = None
+        else:
+            # first pass: count the bytes of the whole file
+            file_text = mmapio.open_input(filename)
+            self.build_codes(iter(functools.partial(file_text.read, CHUNK_SIZE), b''))
+            file_text.close()
+            code_lengths = self.code_lengths
+
+        filename_split = filename.split('.')
+        f = open(filename_split[0] + "_compressed.bin", 'wb')
+        f.write(self.make_header(original_size, flags))
+        index = []
+        tasks = ((filename, offset, min(block_size, original_size - offset), code_lengths)
+                 for offset in range(0, original_size, block_size))
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            for decoded_size, encoded in parallel.map_in_order(executor, compress_block, tasks, workers):
+                index.append((f.tell(), len(encoded), decoded_size))
+                f.write(encoded)
+
+        # write the index and the footer that points to it
+        index_offset = f.tell()
+        for entry in index:
+            f.write(INDEX_ENTRY.pack(*entry))
+        f.write(FOOTER.pack(index_offset, len(index), INDEX_MAGIC))
+        f.close()
 
-    def decode_text(self, encoded_text):
+        print('Compression Done!')
+        summary.print_summary(filename, filename_split[0] + "_compressed.bin", start)
+
+    def make_decoding_tables(self):
+        """
+        Build the lookup tables for decoding from the canonical codes. The first level table is indexed by the next
+        'lookup_bits' bits of the input and gives the decoded byte and its code length directly. Codes that are
+        longer than that share a first level entry (with length 0) that points to a second level table, indexed by
+        the bits that follow.
+        """
+        max_length = max(self.code_lengths)
+        lookup_bits = min(LOOKUP_BITS, max_length)
+        symbols = [None] * (1 << lookup_bits)
+        lengths = [0] * (1 << lookup_bits)
+
+        long_codes = collections.defaultdict(list)
+        for char, code in enumerate(self.code_values):
+            if code is None:
+                continue
+            value, length = code
+            if length <= lookup_bits:
+                # every index that starts with this code decodes to this byte
+                free_bits = lookup_bits - length
+                first = value << free_bits
+                for i in range(first, first + (1 << free_bits)):
+                    symbols[i] = char
+                    lengths[i] = length
+            else:
+                rest_bits = length - lookup_bits
+                long_codes[value >> rest_bits].append((value & ((1 << rest_bits) - 1), rest_bits, char, length))
+
+        for prefix, codes in long_codes.items():
+            sub_bits = max(rest_bits for _, rest_bits, _, _ in codes)
+            sub_symbols = [None] * (1 << sub_bits)
+            sub_lengths = [0] * (1 << sub_bits)
+            for rest, rest_bits, char, length in codes:
+                free_bits = sub_bits - rest_bits
+                first = rest << free_bits
+                for i in range(first, first + (1 << free_bits)):
+                    sub_symbols[i] = char
+                    sub_lengths[i] = length
+            symbols[prefix] = (sub_bits, sub_symbols, sub_lengths)
+
+        self.lookup_bits = lookup_bits
+        self.max_code_length = max_length
+        self.decode_symbols = symbols
+        self.decode_lengths = lengths
+
+    def decode_text(self, reader, count):
         """
-        Helper function for decoding
+        Decode count bytes from the packed codes of the given BitReader, resolving a whole code with every table
+        lookup. The reader keeps its position and bit buffer for the next call.
         """
-        current_code = ""
-        decoded_text = ""
+        lookup_bits = self.lookup_bits
+        lookup_mask = (1 << lookup_bits) - 1
+        need_bits = self.max_code_length
+        symbols = self.decode_symbols
+        lengths = self.decode_lengths
+
+        decoded = bytearray(count)
+        block = reader.block
+        position = reader.position
+        buffer = reader.buffer
+        buffered = reader.buffered
+        for i in range(count):
+            while buffered < need_bits:
+                # refill up to 8 bytes at once
+                chunk = block[position:position + 8]
+                if not chunk:
+                    block = reader.read_block()
+                    position = 0
+                    if block:
+                        continue
+                    # the end of the body is treated as trailing zeros
+                    chunk = bytes(8)
+                position += len(chunk)
+                buffer = ((buffer & ((1 << buffered) - 1)) << (8 * len(chunk))) | int.from_bytes(chunk, 'big')
+                buffered += 8 * len(chunk)
+
+            index = (buffer >> (buffered - lookup_bits)) & lookup_mask
+            char = symbols[index]
+            length = lengths[index]
+            if length == 0:
+                if char is None:
+                    raise ValueError("Invalid Huffman code in compressed data")
+                sub_bits, sub_symbols, sub_lengths = char
+                index = (buffer >> (buffered - lookup_bits - sub_bits)) & ((1 << sub_bits) - 1)
+                char = sub_symbols[index]
+                length = sub_lengths[index]
+                if char is None:
+                    raise ValueError("Invalid Huffman code in compressed data")
+            decoded[i] = char
+            buffered -= length
+
+        reader.block = block
+        reader.position = position
+        reader.buffer = buffer
+        reader.buffered = buffered
+        return decoded
+
+    def decompress(self, compressedfile, workers=None):
+        """
+        Final function for decompression (using the helper functions above). Block mode files are decoded in
+        parallel by the given number of worker processes.
+        """
+        start = time.time()
+        filename_split = compressedfile.split('_')
+        f = mmapio.open_input(compressedfile)
+
+        # get "header" and rebuild the canonical codes from the code lengths, the rest of what was read is the start
+        # of the body
+        head = f.read(HEADER.size + NUM_SYMBOLS)
+        flags, original_size, body_start = self.read_header(head)
+        if flags & FLAG_BLOCKS:
+            self.decompress_blocks(f, filename_split[0] + "_decompressed.txt", flags, original_size, workers)
+            f.close()
+        else:
+            self.make_canonical_codes()
+            write = mmapio.open_output(filename_split[0] + "_decompressed.txt", original_size)
+
+            # decompress start here, chunk by chunk
+            if original_size > 0:
+                self.make_decoding_tables()
+                reader = BitReader(f, head[body_start:])
+                remaining = original_size
+                while remaining > 0:
+                    count = min(remaining, CHUNK_SIZE)
+                    write.write(self.decode_text(reader, count))
+                    remaining -= count
+
+            write.close()
+            f.close()
+        print('Decompression Done!')
+        end = time.time()
+        print(round((end - start), 3), "s")
 
-        for bit in encoded_text:
-            current_code += bit
-            if current_code in self.reverse_mapping:
-                character = self.reverse_mapping[current_code]
-                decoded_text += character
-                current_code = ""
+    def decompress_blocks(self, f, outputfile, flags, original_size, workers):
+        """
+        Decode the blocks of a block mode file in a pool of worker processes. The output file is created with its
+        final size first, and every worker writes its block directly at the block's offset in it.
+        """
+        index = self.read_block_index(f, original_size)
+        write = open(outputfile, 'wb')
+        write.truncate(original_size)
+        write.close()
 
-        return decoded_text
+        code_lengths = None if flags & FLAG_BLOCK_TABLES else self.code_lengths
+        tasks = []
+        output_offset = 0
+        for offset, length, decoded_size in index:
+            tasks.append((f.name, offset, length, outputfile, output_offset, decoded_size, code_lengths))
+            output_offset += decoded_size
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            for _ in parallel.map_in_order(executor, decompress_block, tasks, workers):
+                pass
+
+    def read_footer(self, f, magic, name):
+        """
+        Read the footer at the end of the file, check its magic number and move to the index it points to. Return
+        the number of entries of the index
+        """
+        f.seek(-FOOTER.size, os.SEEK_END)
+        footer = f.read(FOOTER.size)
+        if len(footer) != FOOTER.size:
+            raise ValueError("{} of the Huffman compressed file is missing".format(name))
+        index_offset, count, found = FOOTER.unpack(footer)
+        if found != magic:
+            raise ValueError("{} of the Huffman compressed file is missing".format(name))
+        f.seek(index_offset)
+        return count
+
+    def read_block_index(self, f, original_size):
+        """
+        Read the index of a block mode file and return its entries: the offset of every block, its compressed size
+        and its decoded size
+        """
+        count = self.read_footer(f, INDEX_MAGIC, "Block index")
+        index = list(INDEX_ENTRY.iter_unpack(f.read(count * INDEX_ENTRY.size)))
+        if len(index) != count or sum(entry[2] for entry in index) != original_size:
+            raise ValueError("Block index of the Huffman compressed file is corrupt")
+        return index
 
-    def decompress(self, compressedfile):
+    def read_checkpoints(self, f, original_size):
         """
-        Final function for decompression (using the helper function above)
+        Read the checkpoint index of a file compressed with checkpoints and return the interval and the bit offsets
+        of the checkpoints
         """
-        start = time.time()
-        filename_split = compressedfile.split('_')
-        # get "header"
-        header = open(compressedfile, 'rb').readline().decode()
-        # header as object literal
-        header = ast.literal_eval(header)
-        # reverse mapping for better performance
-        self.reverse_mapping = {v: k for k, v in header.items()}
-
-        # get body
-        f = open(compressedfile, 'rb')
-
-        # get "body" as list.  [1:] because header
-        body = f.readlines()[1:]
-        f.close()
+        count = self.read_footer(f, CHECKPOINT_MAGIC, "Checkpoint index")
+        data = f.read(CHECKPOINT_INTERVAL.size + count * CHECKPOINT_ENTRY.size)
+        if len(data) != CHECKPOINT_INTERVAL.size + count * CHECKPOINT_ENTRY.size:
+            raise ValueError("Checkpoint index of the Huffman compressed file is corrupt")
+        interval, = CHECKPOINT_INTERVAL.unpack_from(data)
+        offsets = [bits for bits, in CHECKPOINT_ENTRY.iter_unpack(data[CHECKPOINT_INTERVAL.size:])]
+        if interval < 1 or count != -(-original_size // interval):
+            raise ValueError("Checkpoint index of the Huffman compressed file is corrupt")
+        return interval, offsets
+
+    def read_range(self, compressedfile, offset, length):
+        """
+        Return the length original bytes that start at offset (fewer if the range ends after the end of the file),
+        decoding only from the nearest point where decoding can start: the last checkpoint at or before offset, the
+        start of the block that holds it in block mode, and the start of the body otherwise
+        """
+        if offset < 0 or length < 0:
+            raise ValueError("Offset and length must not be negative")
+        with mmapio.open_input(compressedfile) as f:
+            head = f.read(HEADER.size + NUM_SYMBOLS)
+            flags, original_size, body_start = self.read_header(head)
+            end = min(offset + length, original_size)
+            if offset >= end:
+                return b''
+
+            if flags & FLAG_BLOCKS:
+                code_lengths = None if flags & FLAG_BLOCK_TABLES else self.code_lengths
+                decoded = bytearray()
+                block_start = 0
+                for block_offset, block_length, decoded_size in self.read_block_index(f, original_size):
+                    if block_start < end and offset < block_start + decoded_size:
+                        f.seek(block_offset)
+                        block = f.read(block_length)
+                        count = min(decoded_size, end - block_start)
+                        decoded += decode_block(block, count, code_lengths)[max(offset - block_start, 0):]
+                    block_start += decoded_size
+                return bytes(decoded)
+
+            if flags & FLAG_CHECKPOINTS:
+                interval, offsets = self.read_checkpoints(f, original_size)
+            else:
+                interval, offsets = original_size, [0]
+            checkpoint = offset // interval
+            bits = offsets[checkpoint]
+            self.make_canonical_codes()
+            self.make_decoding_tables()
+
+            # start reading at the byte that holds the checkpoint's first bit, without the bits before it
+            f.seek(body_start + bits // 8)
+            reader = BitReader(f)
+            first = f.read(1)
+            if len(first) != 1:
+                raise ValueError("Checkpoint index of the Huffman compressed file is corrupt")
+            reader.buffered = 8 - bits % 8
+            reader.buffer = first[0] & ((1 << reader.buffered) - 1)
+            decoded = self.decode_text(reader, end - checkpoint * interval)
+            return bytes(decoded[offset - checkpoint * interval:])
+
+
+def read_range(path, offset, length):
+    """
+    Return the length original bytes that start at offset of the Huffman compressed file at path, see
+    HuffmanCoding.read_range
+    """
+    return HuffmanCoding().read_range(path, offset, length)
 
-        bit_string = ""
 
-        # merge list "body"
-        # flattened the byte array
-        join_body = [item for sub in body for item in sub]
-        for i in join_body:
-            bit_string += "{0:08b}".format(i)
+def encode_block(data, code_lengths=None):
+    """
+    Code the given bytes as one block, padded to a whole byte. Without code_lengths, the block gets its own codes and
+    they are written at its start
+    """
+    coding = HuffmanCoding()
+    table = b''
+    if code_lengths is None:
+        coding.build_codes([data])
+        nibbles, packed = coding.pack_code_lengths()
+        table = bytes((nibbles,)) + packed
+    else:
+        coding.code_lengths = code_lengths
+        coding.make_canonical_codes()
+    packer = new_bit_packer(coding.code_values)
+    return table + packer.pack(data) + packer.flush()
 
-        encoded_text = self.remove_padding(bit_string)
 
-        # decompress start here
-        current_code = ""
-        decoded_text = ""
-        for bit in encoded_text:
-            current_code += bit
-            if current_code in self.reverse_mapping:
-                decoded_text += self.reverse_mapping[current_code]
-                current_code = ""
+def decode_block(block, decoded_size, code_lengths=None):
+    """
+    Decode a block coded by encode_block back to its decoded_size bytes
+    """
+    block = memoryview(block)
+    coding = HuffmanCoding()
+    position = 0
+    if code_lengths is None:
+        position = coding.read_code_lengths(block, 1, block[0])
+    else:
+        coding.code_lengths = code_lengths
+    coding.make_canonical_codes()
+    coding.make_decoding_tables()
+    return coding.decode_text(BitReader(None, block[position:]), decoded_size)
 
-        write = open(filename_split[0] + "_decompressed.txt", 'w')
-        write.writelines(decoded_text)
-        write.close()
-        print('Decompression Done!')
-        end = time.time()
-        print(round((end - start), 3), "s")
+
+def compress_block(filename, offset, length, code_lengths):
+    """
+    Compress one block of the file in a worker process. Without code_lengths, the block gets its own codes and they
+    are written at its start. Return the number of original bytes and the coded block.
+    """
+    f = open(filename, 'rb')
+    f.seek(offset)
+    data = f.read(length)
+    f.close()
+    return len(data), encode_block(data, code_lengths)
+
+
+def decompress_block(compressedfile, offset, length, outputfile, output_offset, decoded_size, code_lengths):
+    """
+    Decode one block of a block mode file in a worker process and write it at its offset in the output file
+    """
+    f = open(compressedfile, 'rb')
+    f.seek(offset)
+    block = f.read(length)
+    f.close()
+
+    decoded = decode_block(block, decoded_size, code_lengths)
+
+    write = open(outputfile, 'r+b')
+    write.seek(output_offset)
+    write.write(decoded)
+    write.close()
 
 
 huffman = HuffmanCoding()
 if __name__ == '__main__':
-    if sys.argv[1] == 'compress':
-        huffman.compress(sys.argv[2])
-    elif sys.argv[1] == 'decompress':
-        huffman.decompress(sys.argv[2])
+    parser = argparse.ArgumentParser(description="Huffman compression and decompression")
+    parser.add_argument('command', choices=['compress', 'decompress', 'read'])
+    parser.add_argument('file')
+    parser.add_argument('--blocks', action='store_true',
+                        help="compress in independently coded blocks, in parallel")
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE,
+                        help="number of original bytes in every block (block mode)")
+    parser.add_argument('--block-tables', action='store_true',
+                        help="give every block codes of its own (block mode)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="number of worker processes (block mode, default: one per core)")
+    parser.add_argument('--checkpoints', type=int, default=None, metavar='BYTES',
+                        help="record a checkpoint every BYTES original bytes, for reading ranges (not in block mode)")
+    parser.add_argument('--offset', type=int, default=0,
+                        help="first original byte to read (read command)")
+    parser.add_argument('--length', type=int, default=None,
+                        help="number of original bytes to read (read command, default: to the end)")
+    args = parser.parse_args()
+    if args.command == 'compress':
+        if args.blocks:
+            if args.checkpoints is not None:
+                parser.error("--checkpoints is not supported in block mode")
+            huffman.compress_blocks(args.file, args.workers, args.block_size, args.block_tables)
+        else:
+            huffman.compress(args.file, args.checkpoints)
+    elif args.command == 'read':
+        length = args.length if args.length is not None else sys.maxsize
+        sys.stdout.buffer.write(read_range(args.file, args.offset, length))
     else:
-        print("command not found")
-        exit(0)
+        huffman.decompress(args.file, args.workers)
@@ -0,0 +1,93 @@
+"""
+Microbenchmark for the arithmetic coder. It encodes and decodes the same random symbols with both validation levels
+of arithmeticcoding.py (CHECKED and FAST), checks that they produce the same bit stream, and reports how many symbols
+per second each one codes. It does the same with the byte-oriented range coder, to compare the two engines.
+
+To run the benchmark please run in the terminal:
+    python arithmetic_benchmark.py [NumSymbols]
+"""
+
+import io
+import random
+import sys
+import time
+import arithmeticcoding
+
+
+def make_symbols(count, freqs):
+    """
+    Returns count random symbols drawn with the frequencies of the given table, always the same ones.
+    """
+    rand = random.Random(2019)
+    limit = freqs.get_symbol_limit()
+    weights = [freqs.get(symbol) for symbol in range(limit)]
+    return rand.choices(range(limit), weights, k=count)
+
+
+def encode(symbols, freqs, validation, coder=arithmeticcoding.ARITHMETIC):
+    """
+    Encodes the symbols with the given coder and returns the bit stream and the number of seconds it took.
+    """
+    out = io.BytesIO()
+    bitout = arithmeticcoding.BitOutputStream(out)
+    start = time.perf_counter()
+    if coder == arithmeticcoding.RANGE:
+        enc = arithmeticcoding.RangeEncoder(bitout, validation)
+    else:
+        enc = arithmeticcoding.ArithmeticEncoder(32, bitout, validation)
+    for symbol in symbols:
+        enc.write(freqs, symbol)
+    enc.finish()
+    bitout.flush()
+    return out.getvalue(), time.perf_counter() - start
+
+
+def decode(data, count, freqs, validation, coder=arithmeticcoding.ARITHMETIC):
+    """
+    Decodes count symbols from the bit stream with the given coder and returns them and the number of seconds it took.
+    """
+    start = time.perf_counter()
+    bitin = arithmeticcoding.BitInputStream(io.BytesIO(data))
+    if coder == arithmeticcoding.RANGE:
+        dec = arithmeticcoding.RangeDecoder(bitin, validation)
+    else:
+        dec = arithmeticcoding.ArithmeticDecoder(32, bitin, validation)
+    symbols = [dec.read(freqs) for _ in range(count)]
+    return symbols, time.perf_counter() - start
+
+
+def final_function(args):
+    """
+    Final function to run the microbenchmark.
+    """
+    if len(args) > 1:
+        sys.exit("Usage: python arithmetic_benchmark.py [NumSymbols]")
+    count = int(args[0]) if args else 200000
+
+    # A skewed table over 257 symbols, like the contexts of the PPM model
+    freqs = arithmeticcoding.FenwickFrequencyTable([1 + 1000 // (i + 1) for i in range(257)])
+    symbols = make_symbols(count, freqs)
+
+    streams = {}
+    for validation in (arithmeticcoding.CHECKED, arithmeticcoding.FAST):
+        data, enctime = encode(symbols, freqs, validation)
+        decoded, dectime = decode(data, count, freqs, validation)
+        if decoded != symbols:
+            raise AssertionError("Decoded symbols differ in {} mode".format(validation))
+        streams[validation] = data
+        print("{:>8}: encode {:>10.0f} symbols/s, decode {:>10.0f} symbols/s".format(
+            validation, count / enctime, count / dectime))
+    if streams[arithmeticcoding.CHECKED] != streams[arithmeticcoding.FAST]:
+        raise AssertionError("The validation levels produced different bit streams")
+    print("Both validation levels produced the same {} byte stream".format(len(streams[arithmeticcoding.FAST])))
+
+    data, enctime = encode(symbols, freqs, arithmeticcoding.FAST, arithmeticcoding.RANGE)
+    decoded, dectime = decode(data, count, freqs, arithmeticcoding.FAST, arithmeticcoding.RANGE)
+    if decoded != symbols:
+        raise AssertionError("Decoded symbols differ with the range coder")
+    print("{:>8}: encode {:>10.0f} symbols/s, decode {:>10.0f} symbols/s, {} byte stream".format(
+        "range", count / enctime, count / dectime, len(data)))
+
+
+if __name__ == "__main__":
+    final_function(sys.argv[1:])
@@ -3,12 +3,27 @@ This is an implementation of arithmetic coding to help us implement PPM model. F
 a separated pdf file (you can find it in our github page).
 """
 
+import array
+import bisect
 import sys
 
 # make sure your python version is more than 3
 python3 = sys.version_info.major >= 3
 
 
+# Validation levels of the arithmetic coders. CHECKED wraps every frequency table in a CheckedFrequencyTable and
+# verifies the coder state on every symbol, which helps finding faults. FAST skips those checks and keeps the coder
+# state in local variables while coding a symbol. Both produce the same bit stream.
+CHECKED = "checked"
+FAST = "fast"
+
+# Coding engines. ARITHMETIC is the bit-oriented coder of ArithmeticEncoder and ArithmeticDecoder, which renormalizes
+# a bit at a time. RANGE is the byte-oriented coder of RangeEncoder and RangeDecoder, which renormalizes a byte at a
+# time and accepts smaller frequency totals (see RANGE_MAX_TOTAL). Their streams are not compatible.
+ARITHMETIC = "arithmetic"
+RANGE = "range"
+
+
 # ---- Arithmetic coding core classes ----
 
 class ArithmeticCoderBase(object):
@@ -18,10 +33,14 @@ class ArithmeticCoderBase(object):
     """
 
     # Constructs an arithmetic coder, which initializes the code range.
-    def __init__(self, numbits):
+    def __init__(self, numbits, validation=CHECKED):
         # Number of bits for the 'low' and 'high' state variables. Must be at least 1.
         if numbits < 1:
             raise ValueError("State size out of range")
+        if validation not in (CHECKED, FAST):
+            raise ValueError("Unknown validation level")
+        # Whether the frequency tables and the state are checked on every symbol (see CHECKED and FAST).
+        self.checked = validation == CHECKED
         self.num_state_bits = numbits
         # Maximum range (high+1-low) during coding
         self.full_range = 1 << self.num_state_bits
@@ -96,8 +115,8 @@ class ArithmeticEncoder(ArithmeticCoderBase):
     """
 
     # Constructs an arithmetic coding encoder based on the given bit output stream.
-    def __init__(self, numbits, bitout):
-        super(ArithmeticEncoder, self).__init__(numbits)
+    def __init__(self, numbits, bitout, validation=CHECKED):
+        super(ArithmeticEncoder, self).__init__(numbits, validation)
         # The underlying bit output stream.
         self.output = bitout
         # Number of saved underflow bits
@@ -108,20 +127,58 @@ class ArithmeticEncoder(ArithmeticCoderBase):
         Encodes the given symbol based on the given frequency table. This updates this arithmetic coder's state
         and may write out some bits.
         """
+        if not self.checked:
+            self._write_fast(freqs, symbol)
+            return
         if not isinstance(freqs, CheckedFrequencyTable):
             freqs = CheckedFrequencyTable(freqs)
         self.update(freqs, symbol)
 
+    def _write_fast(self, freqs, symbol):
+        """
+        Same as update followed by the shifts and underflows, without the checks of the coder state and with the
+        state in local variables.
+        """
+        total = freqs.get_total()
+        symlow = freqs.get_low(symbol)
+        symhigh = freqs.get_high(symbol)
+        if symlow == symhigh:
+            raise ValueError("Symbol has zero frequency")
+        if total > self.maximum_total:
+            raise ValueError("Cannot code symbol because total is too large")
+
+        low = self.low
+        range = self.high - low + 1
+        high = low + symhigh * range // total - 1
+        low = low + symlow * range // total
+
+        half = self.half_range
+        mask = self.state_mask
+        while ((low ^ high) & half) == 0:
+            bit = 1 if low & half else 0
+            numunderflow = self.num_underflow
+            self.output.write_bits((bit << numunderflow) | ((bit ^ 1) * ((1 << numunderflow) - 1)),
+                                   numunderflow + 1)
+            self.num_underflow = 0
+            low = (low << 1) & mask
+            high = ((high << 1) & mask) | 1
+
+        quarter = self.quarter_range
+        while (low & ~high & quarter) != 0:
+            self.num_underflow += 1
+            low = (low << 1) ^ half
+            high = ((high ^ half) << 1) | half | 1
+        self.low = low
+        self.high = high
+
     def finish(self):
         self.output.write(1)
 
     def shift(self):
         bit = self.low >> (self.num_state_bits - 1)
-        self.output.write(bit)
-
-        # Write out the saved underflow bits
-        for _ in range(self.num_underflow):
-            self.output.write(bit ^ 1)
+        # Write out the bit followed by the saved underflow bits, which are its complement, in a single call
+        numunderflow = self.num_underflow
+        self.output.write_bits((bit << numunderflow) | ((bit ^ 1) * ((1 << numunderflow) - 1)), numunderflow + 1)
         self.num_underflow = 0
 
     def underflow(self):
@@ -134,20 +191,20 @@ class ArithmeticDecoder(ArithmeticCoderBase):
     """
 
     # Constructs an arithmetic coding decoder based on the given bit input stream, and fills the code bits.
-    def __init__(self, numbits, bitin):
-        super(ArithmeticDecoder, self).__init__(numbits)
+    def __init__(self, numbits, bitin, validation=CHECKED):
+        super(ArithmeticDecoder, self).__init__(numbits, validation)
         # The underlying bit input stream.
         self.input = bitin
         # The current raw code bits being buffered, which is always in the range [low, high].
-        self.code = 0
-        for _ in range(self.num_state_bits):
-            self.code = self.code << 1 | self.read_code_bit()
+        self.code = self.input.read_bits(self.num_state_bits)
 
     def read(self, freqs):
         """
         Decodes the next symbol based on the given frequency table and returns it. Also updates this arithmetic
         coder's state and may read in some bits.
         """
+        if not self.checked:
+            return self._read_fast(freqs)
         if not isinstance(freqs, CheckedFrequencyTable):
             freqs = CheckedFrequencyTable(freqs)
 
@@ -161,24 +218,51 @@ class ArithmeticDecoder(ArithmeticCoderBase):
         assert value * range // total <= offset
         assert 0 <= value < total
 
-        # A kind of binary search. Find highest symbol such that freqs.get_low(symbol) <= value.
-        start = 0
-        end = freqs.get_symbol_limit()
-        while end - start > 1:
-            middle = (start + end) >> 1
-            if freqs.get_low(middle) > value:
-                end = middle
-            else:
-                start = middle
-        assert start + 1 == end
-
-        symbol = start
+        # Find highest symbol such that freqs.get_low(symbol) <= value, using the table's own search.
+        symbol = freqs.find_symbol(value)
         assert freqs.get_low(symbol) * range // total <= offset < freqs.get_high(symbol) * range // total
         self.update(freqs, symbol)
         if not (self.low <= self.code <= self.high):
             raise AssertionError("Code out of range")
         return symbol
 
+    def _read_fast(self, freqs):
+        """
+        Same as read, without the assertions and the checks of the coder state, and with the state in local
+        variables.
+        """
+        total = freqs.get_total()
+        if total > self.maximum_total:
+            raise ValueError("Cannot decode symbol because total is too large")
+        low = self.low
+        code = self.code
+        range = self.high - low + 1
+        symbol = freqs.find_symbol(((code - low + 1) * total - 1) // range)
+        symlow = freqs.get_low(symbol)
+        symhigh = freqs.get_high(symbol)
+        high = low + symhigh * range // total - 1
+        low = low + symlow * range // total
+
+        half = self.half_range
+        mask = self.state_mask
+        read = self.input.read
+        while ((low ^ high) & half) == 0:
+            bit = read()
+            code = ((code << 1) & mask) | (bit if bit > 0 else 0)
+            low = (low << 1) & mask
+            high = ((high << 1) & mask) | 1
+
+        quarter = self.quarter_range
+        while (low & ~high & quarter) != 0:
+            bit = read()
+            code = (code & half) | ((code << 1) & (mask >> 1)) | (bit if bit > 0 else 0)
+            low = (low << 1) ^ half
+            high = ((high ^ half) << 1) | half | 1
+        self.low = low
+        self.high = high
+        self.code = code
+        return symbol
+
     def shift(self):
         self.code = ((self.code << 1) & self.state_mask) | self.read_code_bit()
 
@@ -196,6 +280,145 @@ class ArithmeticDecoder(ArithmeticCoderBase):
         return temp
 
 
+# ---- Range coder classes ----
+
+# The range coder keeps a 32-bit range and a low end of 32 bits plus a carry bit. A byte is shifted out whenever the
+# range drops below RANGE_TOP, so the range always has at least 24 significant bits while coding a symbol.
+RANGE_MASK = (1 << 32) - 1
+RANGE_TOP = 1 << 24
+# Largest frequency total that the range coder accepts, so that a symbol of frequency 1 still gets at least 2^8 of
+# the range.
+RANGE_MAX_TOTAL = 1 << 16
+
+
+class RangeEncoder(object):
+    """
+    Encodes symbols and writes a range-coded stream, with the same interface as ArithmeticEncoder. The bytes shifted
+    out of the low end may still change through a carry, so the last one of them and the number of 0xFF bytes that
+    follow it are kept until the carry is known. The stream starts with a 0 byte, which the carry never reaches.
+    """
+
+    # Constructs a range encoder based on the given bit output stream.
+    def __init__(self, bitout, validation=CHECKED):
+        if validation not in (CHECKED, FAST):
+            raise ValueError("Unknown validation level")
+        # Whether the frequency tables and the state are checked on every symbol (see CHECKED and FAST).
+        self.checked = validation == CHECKED
+        self.num_state_bits = 32
+        self.maximum_total = RANGE_MAX_TOTAL
+        # The underlying bit output stream, which only gets whole bytes.
+        self.output = bitout
+        # Low end of the current range (32 bits and a carry bit), and its size
+        self.low = 0
+        self.range = RANGE_MASK
+        # The byte that is not written yet since a carry may still change it, and the number of bytes kept in total
+        # (that byte and the 0xFF bytes after it)
+        self.cache = 0
+        self.cache_size = 1
+
+    def write(self, freqs, symbol):
+        """
+        Encodes the given symbol based on the given frequency table. The rest of the range that the division leaves
+        goes to the last symbol of the table.
+        """
+        if self.checked and not isinstance(freqs, CheckedFrequencyTable):
+            freqs = CheckedFrequencyTable(freqs)
+        total = freqs.get_total()
+        symlow = freqs.get_low(symbol)
+        symhigh = freqs.get_high(symbol)
+        if symlow == symhigh:
+            raise ValueError("Symbol has zero frequency")
+        if total > RANGE_MAX_TOTAL:
+            raise ValueError("Cannot code symbol because total is too large")
+
+        r = self.range // total
+        self.low += r * symlow
+        if symhigh < total:
+            self.range = r * (symhigh - symlow)
+        else:
+            self.range -= r * symlow
+        while self.range < RANGE_TOP:
+            self.range <<= 8
+            self._shift_low()
+        if self.checked and not (RANGE_TOP <= self.range <= RANGE_MASK and 0 <= self.low < (RANGE_MASK + 1) * 2):
+            raise AssertionError("Low or range out of range")
+
+    def finish(self):
+        """
+        Writes out the rest of the low end, which ends the stream.
+        """
+        for _ in range(5):
+            self._shift_low()
+
+    def _shift_low(self):
+        """
+        Shifts the top byte out of the low end. It is written with the kept bytes once it is clear that no carry can
+        reach them any more, that is unless it is 0xFF and there was no carry.
+        """
+        low = self.low
+        if low < 0xFF000000 or low > RANGE_MASK:
+            carry = low >> 32
+            write = self.output.write_byte
+            write((self.cache + carry) & 0xFF)
+            for _ in range(self.cache_size - 1):
+                write((0xFF + carry) & 0xFF)
+            self.cache_size = 0
+            self.cache = (low >> 24) & 0xFF
+        self.cache_size += 1
+        self.low = (low & 0x00FFFFFF) << 8
+
+
+class RangeDecoder(object):
+    """
+    Reads a range-coded stream and decodes symbols, with the same interface as ArithmeticDecoder. It keeps the offset
+    of the code from the low end of the range, so it needs no carry.
+    """
+
+    # Constructs a range decoder based on the given bit input stream, and reads the first bytes of the code.
+    def __init__(self, bitin, validation=CHECKED):
+        if validation not in (CHECKED, FAST):
+            raise ValueError("Unknown validation level")
+        # Whether the frequency tables and the state are checked on every symbol (see CHECKED and FAST).
+        self.checked = validation == CHECKED
+        self.num_state_bits = 32
+        self.maximum_total = RANGE_MAX_TOTAL
+        # The underlying bit input stream, which is only read a whole byte at a time.
+        self.input = bitin
+        self.range = RANGE_MASK
+        # The code minus the low end of the range, always smaller than the range. The first byte is always 0.
+        self.code = 0
+        for _ in range(5):
+            self.code = ((self.code << 8) | bitin.read_byte()) & RANGE_MASK
+
+    def read(self, freqs):
+        """
+        Decodes the next symbol based on the given frequency table and returns it.
+        """
+        if self.checked and not isinstance(freqs, CheckedFrequencyTable):
+            freqs = CheckedFrequencyTable(freqs)
+        total = freqs.get_total()
+        if total > RANGE_MAX_TOTAL:
+            raise ValueError("Cannot decode symbol because total is too large")
+        r = self.range // total
+        # The values past r * total belong to the last symbol, which got the rest of the range
+        symbol = freqs.find_symbol(min(self.code // r, total - 1))
+        symlow = freqs.get_low(symbol)
+        symhigh = freqs.get_high(symbol)
+
+        self.code -= r * symlow
+        if symhigh < total:
+            self.range = r * (symhigh - symlow)
+        else:
+            self.range -= r * symlow
+        read_byte = self.input.read_byte
+        while self.range < RANGE_TOP:
+            self.code = ((self.code << 8) | read_byte()) & RANGE_MASK
+            self.range <<= 8
+        if self.checked and not (0 <= self.code < self.range):
+            raise AssertionError("Code out of range")
+        return symbol
+
+
 # ---- Frequency table classes ----
 
 class FrequencyTable(object):
@@ -204,6 +427,9 @@ class FrequencyTable(object):
     Each symbol has a frequency, which is a non-negative integer. Frequency table objects are primarily used for
     getting cumulative symbol frequencies.
     """
+
+    __slots__ = ()
+
     # Returns the number of symbols in this frequency table, which is a positive number.
     def get_symbol_limit(self):
         raise NotImplementedError()
@@ -232,6 +458,33 @@ class FrequencyTable(object):
     def get_high(self, symbol):
         raise NotImplementedError()
 
+    def find_symbol(self, value):
+        """
+        Returns the highest symbol such that get_low(symbol) <= value, where 0 <= value < get_total(). This is the
+        symbol whose cumulative range [get_low(symbol), get_high(symbol)) contains the value. Subclasses that can
+        answer this directly should override this generic binary search.
+        """
+        start = 0
+        end = self.get_symbol_limit()
+        while end - start > 1:
+            middle = (start + end) >> 1
+            if self.get_low(middle) > value:
+                end = middle
+            else:
+                start = middle
+        return start
+
+    def halve(self):
+        """
+        Halves every frequency, rounding up so that a symbol that was seen keeps a non-zero frequency. Adaptive models
+        call this when the total grows too large, which also lets recent symbols weigh more than old ones. Subclasses
+        that can do this faster should override this generic loop.
+        """
+        for symbol in range(self.get_symbol_limit()):
+            freq = self.get(symbol)
+            if freq > 1:
+                self.set(symbol, (freq + 1) >> 1)
+
 
 class FlatFrequencyTable(FrequencyTable):
     """
@@ -270,6 +523,11 @@ class FlatFrequencyTable(FrequencyTable):
         self._check_symbol(symbol)
         return symbol + 1
 
+    # Returns the symbol whose cumulative range contains the given value, which is the value itself.
+    def find_symbol(self, value):
+        self._check_symbol(value)
+        return value
+
     # Returns silently if 0 <= symbol < numsymbols, otherwise raises an exception.
     def _check_symbol(self, symbol):
         if 0 <= symbol < self.numsymbols:
@@ -288,6 +546,71 @@ class FlatFrequencyTable(FrequencyTable):
         raise NotImplementedError()
 
 
+class StaticFrequencyTable(FrequencyTable):
+    """
+    An immutable table of symbol frequencies for static models, whose frequencies are known before coding. The
+    cumulative frequencies are computed once, and a lookup table gives the symbol of every value from 0 to the total
+    directly, so find_symbol needs no search. The lookup table has one entry per unit of the total, so the total should
+    be small (a few thousand to a few tens of thousands). For speed, the methods do not check that the symbols are in
+    range, a CHECKED coder checks them through CheckedFrequencyTable.
+    """
+
+    __slots__ = ("frequencies", "cumulative", "total", "symbols")
+
+    def __init__(self, freqs):
+        self.frequencies = tuple(freqs)
+        if len(self.frequencies) < 1:
+            raise ValueError("At least 1 symbol needed")
+        if any(freq < 0 for freq in self.frequencies):
+            raise ValueError("Negative frequency")
+        # cumulative[i] is the sum of 'frequencies' from 0 (inclusive) to i (exclusive)
+        cumul = [0]
+        for freq in self.frequencies:
+            cumul.append(cumul[-1] + freq)
+        self.cumulative = cumul
+        self.total = cumul[-1]
+        # symbols[value] is the symbol whose cumulative range contains the value
+        self.symbols = array.array("H" if len(self.frequencies) <= 0x10000 else "L")
+        for (symbol, freq) in enumerate(self.frequencies):
+            self.symbols.extend([symbol] * freq)
+
+    # Returns the number of symbols in this frequency table, which is at least 1.
+    def get_symbol_limit(self):
+        return len(self.frequencies)
+
+    # Returns the frequency of the given symbol. The returned value is at least 0.
+    def get(self, symbol):
+        return self.frequencies[symbol]
+
+    # Returns the total of all symbol frequencies.
+    def get_total(self):
+        return self.total
+
+    # Returns the sum of the frequencies of all the symbols strictly below the given symbol value.
+    def get_low(self, symbol):
+        return self.cumulative[symbol]
+
+    # Returns the sum of the frequencies of the given symbol and all the symbols below.
+    def get_high(self, symbol):
+        return self.cumulative[symbol + 1]
+
+    # Returns the symbol whose cumulative range contains the given value, from the lookup table.
+    def find_symbol(self, value):
+        if not (0 <= value < self.total):
+            raise ValueError("Value out of range")
+        return self.symbols[value]
+
+    # Returns a string representation of this frequency table. The format is subject to change.
+    def __str__(self):
+        return "".join("{}\t{}\n".format(i, freq) for (i, freq) in enumerate(self.frequencies))
+
+    def set(self, symbol, freq):
+        raise NotImplementedError()
+
+    def increment(self, symbol):
+        raise NotImplementedError()
+
+
 class SimpleFrequencyTable(FrequencyTable):
     """
     A mutable table of symbol frequencies. The number of symbols cannot be changed after construction.
@@ -374,6 +697,16 @@ class SimpleFrequencyTable(FrequencyTable):
             self._init_cumulative()
         return self.cumulative[symbol + 1]
 
+    def find_symbol(self, value):
+        """
+        Returns the highest symbol such that get_low(symbol) <= value, by bisecting the cumulative array.
+        """
+        if not (0 <= value < self.total):
+            raise ValueError("Value out of range")
+        if self.cumulative is None:
+            self._init_cumulative()
+        return bisect.bisect_right(self.cumulative, value) - 1
+
     def _init_cumulative(self):
         """
         Recomputes the array of cumulative symbol frequencies.
@@ -404,6 +737,324 @@ class SimpleFrequencyTable(FrequencyTable):
         return result
 
 
+class FenwickFrequencyTable(FrequencyTable):
+    """
+    A mutable table of symbol frequencies backed by a binary indexed (Fenwick) tree, so that increment, get_low,
+    get_high and find_symbol all take O(log n) time instead of rebuilding a cumulative array after every change.
+    The number of symbols cannot be changed after construction.
+    """
+
+    def __init__(self, freqs):
+        if isinstance(freqs, FrequencyTable):
+            numsym = freqs.get_symbol_limit()
+            self.frequencies = [freqs.get(i) for i in range(numsym)]
+        else:  # Assume it is a sequence type
+            self.frequencies = list(freqs)  # Make copy
+
+        # 'frequencies' is a list of the frequency for each symbol. Its length is at least 1, and each element
+        # is non-negative.
+        if len(self.frequencies) < 1:
+            raise ValueError("At least 1 symbol needed")
+        for freq in self.frequencies:
+            if freq < 0:
+                raise ValueError("Negative frequency")
+
+        # Always equal to the sum of 'frequencies'
+        self.total = sum(self.frequencies)
+
+        # tree[i] (1-based) holds the sum of the frequencies of symbols (i - lowbit(i)) up to i-1 inclusive.
+        self._build_tree()
+
+        # The largest power of 2 that is at most the number of symbols, where find_symbol starts its descent.
+        self.topbit = 1 << (len(self.frequencies).bit_length() - 1)
+
+    # Returns the number of symbols in this frequency table, which is at least 1.
+    def get_symbol_limit(self):
+        return len(self.frequencies)
+
+    # Returns the frequency of the given symbol. The returned value is at least 0.
+    def get(self, symbol):
+        self._check_symbol(symbol)
+        return self.frequencies[symbol]
+
+    def set(self, symbol, freq):
+        """
+        Sets the frequency of the given symbol to the given value. The frequency value
+        must be at least 0. If an exception is raised, then the state is left unchanged.
+        """
+        self._check_symbol(symbol)
+        if freq < 0:
+            raise ValueError("Negative frequency")
+        self._add(symbol, freq - self.frequencies[symbol])
+
+    def increment(self, symbol):
+        """
+        Increments the frequency of the given symbol.
+        """
+        self._check_symbol(symbol)
+        self._add(symbol, 1)
+
+    def halve(self):
+        """
+        Halves every frequency, rounding up so that non-zero frequencies stay non-zero, and rebuilds the tree.
+        """
+        self.frequencies = [(freq + 1) >> 1 for freq in self.frequencies]
+        self.total = sum(self.frequencies)
+        self._build_tree()
+
+    def get_total(self):
+        """
+        Returns the total of all symbol frequencies. The returned value is at least 0 and is always equal to
+        get_high(get_symbol_limit() - 1).
+        """
+        return self.total
+
+    def get_low(self, symbol):
+        """
+        Returns the sum of the frequencies of all the symbols strictly below the given symbol value. The returned
+        value is at least 0.
+        """
+        self._check_symbol(symbol)
+        return self._prefix_sum(symbol)
+
+    def get_high(self, symbol):
+        """
+        Returns the sum of the frequencies of the given symbol and all the symbols below. The returned value is at
+        least 0.
+        """
+        self._check_symbol(symbol)
+        return self._prefix_sum(symbol + 1)
+
+    def find_symbol(self, value):
+        """
+        Returns the highest symbol such that get_low(symbol) <= value, by descending the tree from its top bit.
+        The value must satisfy 0 <= value < get_total().
+        """
+        if not (0 <= value < self.total):
+            raise ValueError("Value out of range")
+        tree = self.tree
+        limit = len(self.frequencies)
+        pos = 0
+        step = self.topbit
+        while step != 0:
+            nextpos = pos + step
+            if nextpos <= limit and tree[nextpos] <= value:
+                pos = nextpos
+                value -= tree[nextpos]
+            step >>= 1
+        # 'pos' is now the largest count of leading symbols whose sum is at most the original value
+        return pos
+
+    def _add(self, symbol, delta):
+        """
+        Adds delta to the frequency of the given symbol and to every tree node that covers it.
+        """
+        self.frequencies[symbol] += delta
+        self.total += delta
+        tree = self.tree
+        limit = len(tree)
+        i = symbol + 1
+        while i < limit:
+            tree[i] += delta
+            i += i & -i
+
+    def _prefix_sum(self, count):
+        """
+        Returns the sum of the frequencies of the first 'count' symbols.
+        """
+        tree = self.tree
+        result = 0
+        while count > 0:
+            result += tree[count]
+            count &= count - 1
+        return result
+
+    def _build_tree(self):
+        """
+        Builds the tree array from 'frequencies' in linear time.
+        """
+        tree = [0] + self.frequencies
+        limit = len(tree)
+        for i in range(1, limit):
+            parent = i + (i & -i)
+            if parent < limit:
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    # Returns silently if 0 <= symbol < len(frequencies), otherwise raises an exception.
+    def _check_symbol(self, symbol):
+        if 0 <= symbol < len(self.frequencies):
+            return
+        else:
+            raise ValueError("Symbol out of range")
+
+    def __str__(self):
+        """
+        Returns a string representation of this frequency table, useful for debugging only, and the format is subject
+        to change.
+        """
+        result = ""
+        for (i, freq) in enumerate(self.frequencies):
+            result += "{}\t{}\n".format(i, freq)
+        return result
+
+
+class SparseFrequencyTable(FrequencyTable):
+    """
+    A mutable table of symbol frequencies that only stores the symbols with a non-zero frequency, in two compact
+    parallel arrays kept sorted by symbol. This suits tables where few of the possible symbols ever occur, such as
+    the high-order contexts of a PPM model. The number of symbols cannot be changed after construction.
+    """
+
+    __slots__ = ("numsymbols", "symbols", "counts", "total")
+
+    def __init__(self, numsyms, freqs=None):
+        if numsyms < 1:
+            raise ValueError("At least 1 symbol needed")
+        self.numsymbols = numsyms  # Total number of symbols, which is at least 1
+        # 'symbols' holds the symbols with a non-zero frequency in increasing order, and 'counts' their frequencies
+        self.symbols = array.array("H" if numsyms <= 0x10000 else "L")
+        self.counts = array.array("L")
+        # Always equal to the sum of 'counts'
+        self.total = 0
+        if freqs is not None:
+            for (symbol, freq) in freqs.items():
+                self.set(symbol, freq)
+
+    # Returns the number of symbols in this frequency table, which is at least 1.
+    def get_symbol_limit(self):
+        return self.numsymbols
+
+    # Returns the number of symbols whose frequency is not zero.
+    def get_distinct_count(self):
+        return len(self.symbols)
+
+    # Returns the frequency of the given symbol. The returned value is at least 0.
+    def get(self, symbol):
+        self._check_symbol(symbol)
+        symbols = self.symbols
+        i = bisect.bisect_left(symbols, symbol)
+        if i < len(symbols) and symbols[i] == symbol:
+            return self.counts[i]
+        return 0
+
+    def set(self, symbol, freq):
+        """
+        Sets the frequency of the given symbol to the given value. The frequency value
+        must be at least 0. If an exception is raised, then the state is left unchanged.
+        """
+        self._check_symbol(symbol)
+        if freq < 0:
+            raise ValueError("Negative frequency")
+        symbols = self.symbols
+        i = bisect.bisect_left(symbols, symbol)
+        if i < len(symbols) and symbols[i] == symbol:
+            self.total += freq - self.counts[i]
+            if freq == 0:
+                del symbols[i]
+                del self.counts[i]
+            else:
+                self.counts[i] = freq
+        elif freq != 0:
+            symbols.insert(i, symbol)
+            self.counts.insert(i, freq)
+            self.total += freq
+
+    def increment(self, symbol):
+        """
+        Increments the frequency of the given symbol.
+        """
+        self._check_symbol(symbol)
+        symbols = self.symbols
+        i = bisect.bisect_left(symbols, symbol)
+        if i < len(symbols) and symbols[i] == symbol:
+            self.counts[i] += 1
+        else:
+            symbols.insert(i, symbol)
+            self.counts.insert(i, 1)
+        self.total += 1
+
+    def halve(self):
+        """
+        Halves every frequency, rounding up so that the stored symbols keep a non-zero frequency.
+        """
+        self.counts = array.array("L", [(freq + 1) >> 1 for freq in self.counts])
+        self.total = sum(self.counts)
+
+    def copy(self):
+        """
+        Returns a new table with the same frequencies, copied at once instead of being set one by one.
+        """
+        result = SparseFrequencyTable.__new__(SparseFrequencyTable)
+        result.numsymbols = self.numsymbols
+        result.symbols = self.symbols[:]
+        result.counts = self.counts[:]
+        result.total = self.total
+        return result
+
+    def assign(self, symbols, counts):
+        """
+        Replaces all the frequencies at once with the given symbols, in increasing order, and their non-zero
+        frequencies. The values are not checked, so this is meant for restoring the contents of another sparse
+        table, like the contexts of a PPM model snapshot (see ppmsnapshot.py).
+        """
+        self.symbols = array.array(self.symbols.typecode, symbols)
+        self.counts = array.array("L", counts)
+        self.total = sum(self.counts)
+
+    def get_total(self):
+        """
+        Returns the total of all symbol frequencies. The returned value is at least 0 and is always equal to
+        get_high(get_symbol_limit() - 1).
+        """
+        return self.total
+
+    def get_low(self, symbol):
+        """
+        Returns the sum of the frequencies of all the symbols strictly below the given symbol value. The returned
+        value is at least 0.
+        """
+        self._check_symbol(symbol)
+        return sum(self.counts[: bisect.bisect_left(self.symbols, symbol)])
+
+    def get_high(self, symbol):
+        """
+        Returns the sum of the frequencies of the given symbol and all the symbols below. The returned value is at
+        least 0.
+        """
+        self._check_symbol(symbol)
+        return sum(self.counts[: bisect.bisect_right(self.symbols, symbol)])
+
+    def find_symbol(self, value):
+        """
+        Returns the highest symbol such that get_low(symbol) <= value, by scanning the stored counts.
+        """
+        if not (0 <= value < self.total):
+            raise ValueError("Value out of range")
+        for (symbol, freq) in zip(self.symbols, self.counts):
+            value -= freq
+            if value < 0:
+                return symbol
+        raise AssertionError("Total does not match the counts")
+
+    # Returns silently if 0 <= symbol < numsymbols, otherwise raises an exception.
+    def _check_symbol(self, symbol):
+        if 0 <= symbol < self.numsymbols:
+            return
+        else:
+            raise ValueError("Symbol out of range")
+
+    def __str__(self):
+        """
+        Returns a string representation of this frequency table, useful for debugging only, and the format is subject
+        to change.
+        """
+        result = ""
+        for (symbol, freq) in zip(self.symbols, self.counts):
+            result += "{}\t{}\n".format(symbol, freq)
+        return result
+
+
 class CheckedFrequencyTable(FrequencyTable):
     """
     A wrapper that checks the preconditions (arguments) and post-conditions (return value) of all
@@ -455,6 +1106,14 @@ class CheckedFrequencyTable(FrequencyTable):
             self.freqtable.get_high(symbol)
             raise AssertionError("ValueError expected")
 
+    def find_symbol(self, value):
+        result = self.freqtable.find_symbol(value)
+        if not self._is_symbol_in_range(result):
+            raise AssertionError("Found symbol out of range")
+        if not (self.freqtable.get_low(result) <= value < self.freqtable.get_high(result)):
+            raise AssertionError("Found symbol does not contain the value")
+        return result
+
     def __str__(self):
         return "CheckedFrequencyTable (" + str(self.freqtable) + ")"
 
@@ -474,16 +1133,24 @@ class CheckedFrequencyTable(FrequencyTable):
 
 # ---- Bit-oriented I/O streams ----
 
+# Number of bytes that the bit streams and the byte sink read or write at a time from the underlying byte stream.
+BUFFER_SIZE = 1 << 16
+
+
 class BitInputStream(object):
     """
     A stream of bits that can be read. Because they come from an underlying byte stream, the total number of bits is
-    always a multiple of 8. The bits are read in big endian.
+    always a multiple of 8. The bits are read in big endian. The underlying stream is read BUFFER_SIZE bytes at a
+    time.
     """
 
     # Constructs a bit input stream based on the given byte input stream.
     def __init__(self, inp):
         # The underlying byte stream to read from
         self.input = inp
+        # The bytes read ahead from the underlying stream, and the position of the next byte to use in them
+        self.buffer = b""
+        self.position = 0
         # Either in the range [0x00, 0xFF] if bits are available, or -1 if end of stream is reached
         self.currentbyte = 0
         # Number of remaining bits in the current byte, always between 0 and 7 (inclusive)
@@ -497,13 +1164,12 @@ class BitInputStream(object):
         if self.currentbyte == -1:
             return -1
         if self.numbitsremaining == 0:
-            temp = self.input.read(1)
-            if len(temp) == 0:
+            if self.position == len(self.buffer) and not self._fill():
                 self.currentbyte = -1
                 return -1
-            self.currentbyte = temp[0] if python3 else ord(temp)
+            self.currentbyte = self.buffer[self.position]
+            self.position += 1
             self.numbitsremaining = 8
-        assert self.numbitsremaining > 0
         self.numbitsremaining -= 1
         return (self.currentbyte >> self.numbitsremaining) & 1
 
@@ -518,6 +1184,65 @@ class BitInputStream(object):
         else:
             raise EOFError()
 
+    def read_bits(self, n):
+        """
+        Reads n bits from this stream and returns them as an unsigned integer, the first bit read being the most
+        significant one. The bits after the end of stream are read as 0s, so the end of stream is not reported.
+        """
+        if n < 0:
+            raise ValueError("Number of bits must be non-negative")
+        result = 0
+        while n > 0:
+            if self.numbitsremaining == 0:
+                if self.currentbyte == -1:
+                    return result << n
+                # Take the whole bytes directly from the buffer
+                if n >= 8:
+                    if self.position == len(self.buffer) and not self._fill():
+                        self.currentbyte = -1
+                        return result << n
+                    count = min(n >> 3, len(self.buffer) - self.position)
+                    result = (result << (count << 3)) | \
+                        int.from_bytes(self.buffer[self.position:self.position + count], "big")
+                    self.position += count
+                    n -= count << 3
+                    continue
+                if self.read() == -1:
+                    return result << n
+                self.numbitsremaining += 1  # Put back the bit that read() took
+            take = min(n, self.numbitsremaining)
+            self.numbitsremaining -= take
+            result = (result << take) | ((self.currentbyte >> self.numbitsremaining) & ((1 << take) - 1))
+            n -= take
+        return result
+
+    def read_byte(self):
+        """
+        Reads 8 bits from this stream and returns them as an unsigned integer. The bits after the end of stream are
+        read as 0s, like in read_bits.
+        """
+        if self.numbitsremaining == 0 and self.currentbyte != -1:
+            if self.position == len(self.buffer) and not self._fill():
+                self.currentbyte = -1
+                return 0
+            self.position += 1
+            return self.buffer[self.position - 1]
+        return self.read_bits(8)
+
+    def get_buffered_count(self):
+        """
+        Returns the number of bytes that were read from the underlying stream but whose bits were not read yet.
+        """
+        return len(self.buffer) - self.position
+
+    def _fill(self):
+        """
+        Reads the next buffer from the underlying stream. Returns False if it is at its end.
+        """
+        self.buffer = self.input.read(BUFFER_SIZE)
+        self.position = 0
+        return len(self.buffer) > 0
+
     def close(self):
         """
         Closes this stream and the underlying input stream.
@@ -530,12 +1255,14 @@ class BitInputStream(object):
 class BitOutputStream(object):
     """
     A stream where bits can be written to. Because they are written to an underlying byte stream, the end of the
-    stream is padded with 0's up to a multiple of 8 bits. The bits are written in big endian.
+    stream is padded with 0's up to a multiple of 8 bits. The bits are written in big endian. The complete bytes are
+    collected in a buffer and written to the underlying stream BUFFER_SIZE bytes at a time.
     """
 
     # Constructs a bit output stream based on the given byte output stream.
     def __init__(self, out):
         self.output = out  # The underlying byte stream to write to
+        self.buffer = bytearray()  # The complete bytes that are not written to the underlying stream yet
         self.currentbyte = 0  # The accumulated bits for the current byte, always in the range [0x00, 0xFF]
         self.numbitsfilled = 0  # Number of accumulated bits in the current byte, always between 0 and 7 (inclusive)
 
@@ -548,17 +1275,101 @@ class BitOutputStream(object):
         self.currentbyte = (self.currentbyte << 1) | b
         self.numbitsfilled += 1
         if self.numbitsfilled == 8:
-            towrite = bytes((self.currentbyte,)) if python3 else chr(self.currentbyte)
-            self.output.write(towrite)
+            self.buffer.append(self.currentbyte)
+            if len(self.buffer) >= BUFFER_SIZE:
+                self._write_buffer()
             self.currentbyte = 0
             self.numbitsfilled = 0
 
+    def write_bits(self, value, n):
+        """
+        Writes the n lowest bits of value to the stream, the most significant one first. The value must be an
+        unsigned integer smaller than 2^n.
+        """
+        if n < 0 or value < 0 or (value >> n) != 0:
+            raise ValueError("Value does not fit in the given number of bits")
+        bits = (self.currentbyte << n) | value
+        numbits = self.numbitsfilled + n
+        if numbits >= 8:
+            # Move all the complete bytes to the buffer at once
+            numbytes = numbits >> 3
+            numbits &= 7
+            self.buffer += (bits >> numbits).to_bytes(numbytes, "big")
+            bits &= (1 << numbits) - 1
+            if len(self.buffer) >= BUFFER_SIZE:
+                self._write_buffer()
+        self.currentbyte = bits
+        self.numbitsfilled = numbits
+
+    def write_byte(self, b):
+        """
+        Writes the 8 bits of a byte, which must be in the range [0x00, 0xFF].
+        """
+        if self.numbitsfilled != 0:
+            self.write_bits(b, 8)
+            return
+        self.buffer.append(b)
+        if len(self.buffer) >= BUFFER_SIZE:
+            self._write_buffer()
+
+    def _write_buffer(self):
+        """
+        Writes the complete bytes in the buffer to the underlying stream.
+        """
+        if self.buffer:
+            self.output.write(self.buffer)
+            self.buffer = bytearray()
+
+    def drain(self):
+        """
+        Writes the complete bytes in the buffer to the underlying stream, keeping the bits of the current byte. Unlike
+        flush, this can be called in the middle of the bit stream, to pass on the bytes that are ready.
+        """
+        self._write_buffer()
+
+    def flush(self):
+        """
+        Writes the minimum number of "0" bits (between 0 and 7 of them) as padding to reach the next byte boundary,
+        and writes all the buffered bytes to the underlying output stream, without closing it. Only call this at the
+        end of the bit stream.
+        """
+        if self.numbitsfilled != 0:
+            self.write_bits(0, 8 - self.numbitsfilled)
+        self._write_buffer()
+
     def close(self):
         """
         Closes this stream and the underlying output stream. If called when this bit stream is not at a byte boundary,
         then the minimum number of "0" bits (between 0 and 7 of them) are written as padding to reach the next byte
         boundary.
         """
-        while self.numbitsfilled != 0:
-            self.write(0)
+        self.flush()
         self.output.close()
+
+
+class ByteSink(object):
+    """
+    A buffered sink for decoded symbols that are bytes. The bytes are collected in a buffer and written to the
+    underlying byte stream BUFFER_SIZE bytes at a time, instead of one write call per byte.
+    """
+
+    # Constructs a byte sink based on the given byte output stream.
+    def __init__(self, out):
+        self.output = out  # The underlying byte stream to write to
+        self.buffer = bytearray()  # The bytes that are not written to the underlying stream yet
+
+    def write(self, b):
+        """
+        Writes a byte, which must be in the range [0x00, 0xFF].
+        """
+        self.buffer.append(b)
+        if len(self.buffer) >= BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes all the buffered bytes to the underlying output stream, without closing it.
+        """
+        if self.buffer:
+            self.output.write(self.buffer)
+            self.buffer = bytearray()
@@ -0,0 +1,295 @@
+"""
+asyncio adapters for the PPM and Huffman codecs, to compress the data written to an asyncio.StreamWriter and
+decompress the data read from an asyncio.StreamReader, for example on the connections of an asyncio server.
+
+The coding itself runs in an executor, a batch at a time, so the event loop thread only moves bytes and stays free
+to serve other connections. Every writer waits for the underlying StreamWriter to drain after each batch, and every
+reader only decodes the next chunk when it is asked for it, so the data buffered per connection stays bounded.
+
+    writer = PpmCompressWriter(stream_writer)
+    await writer.write(data)
+    await writer.finish()
+
+    async for chunk in PpmDecompressReader(stream_reader):
+        use(chunk)
+
+The PPM adapters keep one model per stream, so their executor must be a thread pool (the default executor of the
+loop is used when none is given). The Huffman adapters code every batch independently, so they can also be given a
+concurrent.futures.ProcessPoolExecutor to code the batches of many connections in parallel.
+
+A Huffman stream is made of frames: the magic "HUFS" and a version (1 byte), then for every batch its decoded size
+and coded size (4 bytes each, big endian) followed by the block coded by Huffman.encode_block with codes of its own,
+and a last frame with both sizes 0. A PPM stream is the stream of ppmcodec.PpmEncoder cut into frames: for every
+batch its coded size (4 bytes, big endian) followed by the bytes the encoder returned for it, and a last frame of size
+0. Both kinds of streams end with their last frame, so the connection can stay open and carry other data after them.
+Both PPM adapters take the ppmsnapshot.Snapshot the model starts from, if any.
+"""
+
+import asyncio
+import struct
+import arithmeticcoding
+import Huffman
+import ppmcodec
+import ppmcontainer
+
+# Default number of original bytes coded in one executor call.
+BATCH_SIZE = 1 << 16
+
+HUFFMAN_MAGIC = b"HUFS"
+HUFFMAN_VERSION = 1
+HUFFMAN_PREFIX = struct.Struct(">4sB")
+FRAME = struct.Struct(">II")
+PPM_FRAME = struct.Struct(">I")
+
+
+class PpmCompressWriter(object):
+    """
+    Compresses the data written to it with PPM and writes the compressed stream to an asyncio.StreamWriter.
+    """
+
+    def __init__(self, writer, params=ppmcontainer.DEFAULT_PARAMETERS, executor=None, batch_size=BATCH_SIZE,
+                 snapshot=None):
+        if batch_size < 1:
+            raise ValueError("Batch size must be positive")
+        self.writer = writer  # The underlying asyncio.StreamWriter
+        self.executor = executor
+        self.batch_size = batch_size
+        self.encoder = ppmcodec.PpmEncoder(params, snapshot=snapshot)
+        self.pending = bytearray()  # The data that was written but not coded yet
+
+    async def write(self, data):
+        """
+        Adds the data to the stream, coding it once a whole batch has been collected.
+        """
+        self.pending += data
+        while len(self.pending) >= self.batch_size:
+            batch = bytes(self.pending[:self.batch_size])
+            del self.pending[:self.batch_size]
+            await self._send(self.encoder.feed, batch)
+
+    async def finish(self):
+        """
+        Codes the rest of the data and writes the last frame. The underlying writer is left open.
+        """
+        if self.pending:
+            batch = bytes(self.pending)
+            self.pending.clear()
+            await self._send(self.encoder.feed, batch)
+        await self._send(self.encoder.finish)
+        self.writer.write(PPM_FRAME.pack(0))
+        await self.writer.drain()
+
+    async def _send(self, function, *args):
+        """
+        Runs the coding function in the executor and writes its result as a frame, waiting for the writer to drain.
+        """
+        loop = asyncio.get_running_loop()
+        coded = await loop.run_in_executor(self.executor, function, *args)
+        if coded:
+            self.writer.write(PPM_FRAME.pack(len(coded)) + coded)
+            await self.writer.drain()
+
+
+class PpmDecompressReader(object):
+    """
+    Decompresses a PPM stream read from an asyncio.StreamReader, in chunks of at most chunk_size bytes. The stream
+    must start with the header written by PpmCompressWriter, unless its parameters are given.
+
+    The compressed data is read on the event loop a frame at a time, and the executor only decodes while enough of it
+    is buffered to decode the next byte whatever its code is, so no executor thread ever waits for the network. The
+    reader stops after the last frame, so nothing that follows the stream on the connection is read.
+    """
+
+    def __init__(self, reader, params=None, executor=None, chunk_size=BATCH_SIZE, snapshot=None):
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be positive")
+        self.reader = reader  # The underlying asyncio.StreamReader
+        self.params = params
+        self.snapshot = snapshot
+        self.executor = executor
+        self.chunk_size = chunk_size
+        self.source = _BufferSource()  # The compressed data that the decoder did not take yet
+        self.eof = False  # Whether the last frame was read
+        self.decoder = None  # Created once the header is buffered
+        self.lookahead = 0
+
+    async def read(self):
+        """
+        Returns the next decompressed chunk, or b"" at the end of the stream.
+        """
+        if self.decoder is None:
+            await self._fill(ppmcontainer.STREAM_HEADER.size if self.params is None else 0)
+            self.decoder = ppmcodec.PpmDecoder(self.source, self.params, arithmeticcoding.FAST, self.chunk_size,
+                                               self.snapshot)
+            self.lookahead = _lookahead(self.decoder.params)
+        loop = asyncio.get_running_loop()
+        while not self.decoder.finished:
+            await self._fill(self.lookahead)
+            chunk = await loop.run_in_executor(self.executor, self.decoder.decode, self.chunk_size, self._must_pause)
+            if chunk:
+                return chunk
+        # The decoder may stop before the frames that only hold the padding of the coder
+        while not self.eof:
+            await self._read_frame()
+        return b""
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        chunk = await self.read()
+        if not chunk:
+            raise StopAsyncIteration
+        return chunk
+
+    def _buffered(self):
+        """
+        Returns the number of compressed bytes that are buffered and not decoded yet.
+        """
+        bitin = self.decoder.bitin if self.decoder is not None else None
+        return len(self.source.pending) + (bitin.get_buffered_count() if bitin is not None else 0)
+
+    def _must_pause(self):
+        """
+        Returns True if the decoder must stop before the next byte, to wait for more compressed data.
+        """
+        return not self.eof and self._buffered() < self.lookahead
+
+    async def _fill(self, size):
+        """
+        Reads frames until at least size compressed bytes are buffered or the last frame is read.
+        """
+        while not self.eof and self._buffered() < size:
+            await self._read_frame()
+
+    async def _read_frame(self):
+        """
+        Reads the next frame and buffers its compressed data.
+        """
+        try:
+            coded_size, = PPM_FRAME.unpack(await self.reader.readexactly(PPM_FRAME.size))
+            if coded_size == 0:
+                self.eof = True
+            else:
+                self.source.pending += await self.reader.readexactly(coded_size)
+        except asyncio.IncompleteReadError:
+            raise ValueError("PPM frame stream is truncated")
+
+
+class HuffmanCompressWriter(object):
+    """
+    Compresses the data written to it with Huffman coding, every batch with codes of its own, and writes the frames
+    to an asyncio.StreamWriter.
+    """
+
+    def __init__(self, writer, executor=None, batch_size=BATCH_SIZE):
+        if batch_size < 1:
+            raise ValueError("Batch size must be positive")
+        self.writer = writer  # The underlying asyncio.StreamWriter
+        self.executor = executor
+        self.batch_size = batch_size
+        self.pending = bytearray()  # The data that was written but not coded yet
+        self.writer.write(HUFFMAN_PREFIX.pack(HUFFMAN_MAGIC, HUFFMAN_VERSION))
+
+    async def write(self, data):
+        """
+        Adds the data to the stream, coding it once a whole batch has been collected.
+        """
+        self.pending += data
+        while len(self.pending) >= self.batch_size:
+            batch = bytes(self.pending[:self.batch_size])
+            del self.pending[:self.batch_size]
+            await self._send(batch)
+
+    async def finish(self):
+        """
+        Codes the rest of the data and writes the last frame. The underlying writer is left open.
+        """
+        if self.pending:
+            batch = bytes(self.pending)
+            self.pending.clear()
+            await self._send(batch)
+        self.writer.write(FRAME.pack(0, 0))
+        await self.writer.drain()
+
+    async def _send(self, batch):
+        """
+        Codes the batch in the executor and writes its frame, waiting for the writer to drain.
+        """
+        loop = asyncio.get_running_loop()
+        coded = await loop.run_in_executor(self.executor, Huffman.encode_block, batch)
+        self.writer.write(FRAME.pack(len(batch), len(coded)) + coded)
+        await self.writer.drain()
+
+
+class HuffmanDecompressReader(object):
+    """
+    Decompresses a Huffman frame stream read from an asyncio.StreamReader, a frame at a time.
+    """
+
+    def __init__(self, reader, executor=None):
+        self.reader = reader  # The underlying asyncio.StreamReader
+        self.executor = executor
+        self.started = False  # Whether the magic was read
+        self.finished = False
+
+    async def read(self):
+        """
+        Returns the decompressed data of the next frame, or b"" at the end of the stream.
+        """
+        if self.finished:
+            return b""
+        try:
+            if not self.started:
+                magic, version = HUFFMAN_PREFIX.unpack(await self.reader.readexactly(HUFFMAN_PREFIX.size))
+                if magic != HUFFMAN_MAGIC:
+                    raise ValueError("Not a Huffman frame stream")
+                if version != HUFFMAN_VERSION:
+                    raise ValueError("Unsupported Huffman frame stream version {}".format(version))
+                self.started = True
+            decoded_size, coded_size = FRAME.unpack(await self.reader.readexactly(FRAME.size))
+            if decoded_size == 0:
+                self.finished = True
+                return b""
+            coded = await self.reader.readexactly(coded_size)
+        except asyncio.IncompleteReadError:
+            raise ValueError("Huffman frame stream is truncated")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, Huffman.decode_block, coded, decoded_size)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        chunk = await self.read()
+        if not chunk:
+            raise StopAsyncIteration
+        return chunk
+
+
+def _lookahead(params):
+    """
+    Returns a number of compressed bytes that is always enough to decode one byte with the given parameters. Every
+    byte is coded with at most order + 2 symbols, from the highest order context down to order -1, and the coder reads
+    fewer than numbits + 1 bits for every symbol, since a symbol has a probability of at least 1 / maximum total.
+    """
+    return ((max(params.order, -1) + 2) * (params.numbits + 1) + 7) // 8 + 1
+
+
+class _BufferSource(object):
+    """
+    A file object for the PPM decoder over the compressed data buffered by PpmDecompressReader. It never waits: the
+    reader makes sure that the decoder only reads what is already buffered, unless the last frame was read.
+    """
+
+    def __init__(self):
+        self.pending = bytearray()
+
+    def read(self, n=-1):
+        if n < 0 or n >= len(self.pending):
+            result = bytes(self.pending)
+            self.pending.clear()
+        else:
+            result = bytes(self.pending[:n])
+            del self.pending[:n]
+        return result
@@ -0,0 +1,384 @@
+"""
+Benchmark suite for the compression methods of the project: Huffman coding (Huffman.py), rANS coding (ANS.py), static
+order-0 arithmetic coding (static_arithmetic.py), PPM (ppm_compress.py and ppm_decompress.py, at several model orders)
+and zipfile. It generates its own corpora, so the results do not depend on files that are not in the repository, and
+always the same ones for the same seed and size:
+    english   English-like text, words drawn from a small vocabulary with Zipf-like frequencies
+    logs      server log lines with timestamps, levels, addresses and request paths
+    random    uniformly random bytes, which cannot be compressed
+    lowent    long runs of a few byte values, with a very low entropy
+    binary    fixed-size binary records of integers and floating point numbers
+
+For every method and corpus, the benchmark reports the compression and decompression speed in MB/s (the best of
+--repeat runs), the compression ratio (compressed size / original size) and the peak memory of compression and
+decompression, measured with tracemalloc in a separate run since tracing slows the code down (--no-memory skips
+that run). tracemalloc only sees the objects that Python allocates, not the memory-mapped input and output files of
+mmapio.py, so the peak memory is the peak of the heap and leaves out the file buffers: the resident size of a real run
+is larger by up to the sizes of its files. Fast methods on small corpora take only milliseconds, so use --repeat N to
+get stable speeds.
+
+To run the benchmark please run in the terminal:
+    python benchmark.py [--size BYTES] [--corpora NAME ...] [--codecs NAME ...] [--orders N ...] [--json FILE]
+To compare the results against a baseline saved with --json before, and flag the regressions, please run:
+    python benchmark.py --compare BASELINE.json [--tolerance FRACTION]
+The command exits with status 1 if any speed or peak memory got worse than the tolerance (10% by default) allows,
+or any compression ratio got worse at all.
+"""
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import platform
+import random
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+import ANS
+import Huffman
+import static_arithmetic
+
+# The compression scripts have a '-' in their names, so they are imported by name.
+ppm_compress = importlib.import_module("ppm-compress")
+ppm_decompress = importlib.import_module("ppm-decompress")
+
+CORPORA = ("english", "logs", "random", "lowent", "binary")
+CODECS = ("huffman", "ans", "static", "ppm", "zip")
+
+# Default number of bytes of every corpus, and default model orders of PPM.
+SIZE = 1 << 16
+ORDERS = (1, 2, 3)
+SEED = 2019
+
+WORDS = ("the", "of", "and", "to", "a", "in", "that", "it", "was", "he", "his", "said", "with", "for", "had", "you",
+         "not", "be", "her", "as", "at", "on", "him", "have", "my", "is", "which", "by", "so", "all", "mr", "were",
+         "this", "they", "from", "but", "one", "there", "or", "would", "what", "no", "me", "been", "little", "very",
+         "upon", "out", "when", "could", "time", "old", "know", "man", "gentleman", "house", "great", "door", "hand",
+         "morning", "returned", "looking", "together", "remarkable", "circumstances", "immediately", "expression")
+LEVELS = ("INFO", "INFO", "INFO", "DEBUG", "WARNING", "ERROR")
+PATHS = ("/", "/index.html", "/api/v1/users", "/api/v1/orders", "/static/app.js", "/login", "/search?q=compression")
+
+
+def make_english(rand, size):
+    """
+    Returns English-like text: sentences of words with Zipf-like frequencies, in paragraphs.
+    """
+    weights = [1.0 / (rank + 1) for rank in range(len(WORDS))]
+    parts = []
+    length = 0
+    while length < size:
+        words = rand.choices(WORDS, weights, k=rand.randint(4, 18))
+        sentence = " ".join(words).capitalize() + rand.choice((".", ".", ".", ",", "?", "!")) + \
+            ("\n\n" if rand.random() < 0.1 else " ")
+        parts.append(sentence)
+        length += len(sentence)
+    return "".join(parts).encode("ascii")[:size]
+
+
+def make_logs(rand, size):
+    """
+    Returns server log lines with increasing timestamps.
+    """
+    parts = []
+    length = 0
+    timestamp = 1500000000.0
+    while length < size:
+        timestamp += rand.expovariate(20.0)
+        line = "{} {:<7} 10.0.{}.{} {} {} {}ms\n".format(
+            time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(timestamp)), rand.choice(LEVELS), rand.randint(0, 3),
+            rand.randint(1, 254), rand.choice(("GET", "GET", "POST")), rand.choice(PATHS), rand.randint(1, 900))
+        parts.append(line)
+        length += len(line)
+    return "".join(parts).encode("ascii")[:size]
+
+
+def make_random(rand, size):
+    """
+    Returns uniformly random bytes.
+    """
+    return rand.getrandbits(8 * size).to_bytes(size, "little") if size else b""
+
+
+def make_lowent(rand, size):
+    """
+    Returns long runs of four byte values, most of them of the first one.
+    """
+    parts = bytearray()
+    while len(parts) < size:
+        parts += bytes((rand.choices(b"\x00\x01\x02\xff", (90, 5, 4, 1))[0],)) * rand.randint(1, 64)
+    return bytes(parts[:size])
+
+
+def make_binary(rand, size):
+    """
+    Returns fixed-size little endian records: an increasing id, a small counter, a flag and a measurement.
+    """
+    record = struct.Struct("<IhBd")
+    parts = bytearray()
+    identifier = 0
+    while len(parts) < size:
+        identifier += rand.randint(1, 3)
+        parts += record.pack(identifier, rand.randint(-100, 100), rand.randint(0, 1), rand.gauss(20.0, 5.0))
+    return bytes(parts[:size])
+
+
+GENERATORS = {"english": make_english, "logs": make_logs, "random": make_random, "lowent": make_lowent,
+              "binary": make_binary}
+
+
+def make_corpus(name, size, seed=SEED):
+    """
+    Returns the corpus with the given name and size, always the same one for the same seed.
+    """
+    return GENERATORS[name](random.Random("{}-{}".format(seed, name)), size)
+
+
+@contextlib.contextmanager
+def working_directory(directory):
+    """
+    Runs the body of the with statement in the given directory, and silences its prints.
+    """
+    previous = os.getcwd()
+    os.chdir(directory)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        os.chdir(previous)
+
+
+def huffman_compress(inputfile, outputfile):
+    """
+    Compresses with Huffman.py, which names its output after the part of the input file name before the first '.',
+    and moves the output to outputfile.
+    """
+    directory, name = os.path.split(inputfile)
+    with working_directory(directory):
+        Huffman.HuffmanCoding().compress(name)
+    os.replace(os.path.join(directory, name.split('.')[0] + "_compressed.bin"), outputfile)
+
+
+def huffman_decompress(inputfile, outputfile):
+    """
+    Decompresses with Huffman.py, which names its output after the part of the input file name before the first '_',
+    and moves the output to outputfile.
+    """
+    directory, name = os.path.split(inputfile)
+    with working_directory(directory):
+        Huffman.HuffmanCoding().decompress(name)
+    os.replace(os.path.join(directory, name.split('_')[0] + "_decompressed.txt"), outputfile)
+
+
+def ans_compress(inputfile, outputfile):
+    """
+    Compresses with ANS.py, which names its output like Huffman.py does, and moves the output to outputfile.
+    """
+    directory, name = os.path.split(inputfile)
+    with working_directory(directory):
+        ANS.ANSCoding().compress(name)
+    os.replace(os.path.join(directory, name.split('.')[0] + "_compressed.ans"), outputfile)
+
+
+def ans_decompress(inputfile, outputfile):
+    """
+    Decompresses with ANS.py, which names its output like Huffman.py does, and moves the output to outputfile.
+    """
+    directory, name = os.path.split(inputfile)
+    with working_directory(directory):
+        ANS.ANSCoding().decompress(name)
+    os.replace(os.path.join(directory, name.split('_')[0] + "_decompressed.txt"), outputfile)
+
+
+def ppm_functions(order):
+    """
+    Returns the compression and decompression functions of PPM with the given model order.
+    """
+    params = ppm_compress.PARAMETERS._replace(order=order)
+    return (lambda inputfile, outputfile: ppm_compress.compress_file(inputfile, outputfile, params=params),
+            ppm_decompress.decompress_file)
+
+
+def zip_compress(inputfile, outputfile):
+    """
+    Compresses the input file as the only member of a deflated zip file.
+    """
+    with zipfile.ZipFile(outputfile, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.write(inputfile, "data")
+
+
+def zip_decompress(inputfile, outputfile):
+    """
+    Extracts the only member of a zip file written by zip_compress.
+    """
+    with zipfile.ZipFile(inputfile, "r") as archive, open(outputfile, "wb") as out:
+        out.write(archive.read("data"))
+
+
+def make_methods(codecs, orders):
+    """
+    Returns a list of (method name, compress function, decompress function) for the given codecs.
+    """
+    methods = []
+    for codec in codecs:
+        if codec == "huffman":
+            methods.append(("huffman", huffman_compress, huffman_decompress))
+        elif codec == "ans":
+            methods.append(("ans", ans_compress, ans_decompress))
+        elif codec == "static":
+            methods.append(("static-o0", static_arithmetic.compress_file, static_arithmetic.decompress_file))
+        elif codec == "ppm":
+            for order in orders:
+                methods.append(("ppm-o{}".format(order),) + ppm_functions(order))
+        else:
+            methods.append(("zip", zip_compress, zip_decompress))
+    return methods
+
+
+def timed(function, *args):
+    """
+    Returns the number of seconds that calling function with the given arguments takes.
+    """
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def peak_memory(function, *args):
+    """
+    Returns the largest number of bytes that calling function with the given arguments keeps allocated at once on the
+    Python heap. The pages of memory-mapped files are not allocations, so they are not counted.
+    """
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_method(compress, decompress, data, tmpdir, repeat, memory=True):
+    """
+    Runs one method on one corpus and returns its measurements.
+    """
+    # Huffman.py and ANS.py name their output files after the part of these names before the first '.' or '_'
+    original = os.path.join(tmpdir, "corpus.dat")
+    compressed = os.path.join(tmpdir, "packed.bin")
+    decompressed = os.path.join(tmpdir, "restored.dat")
+    with open(original, "wb") as out:
+        out.write(data)
+
+    ctime = min(timed(compress, original, compressed) for _ in range(repeat))
+    dtime = min(timed(decompress, compressed, decompressed) for _ in range(repeat))
+    with open(decompressed, "rb") as inp:
+        if inp.read() != data:
+            raise AssertionError("Decompressed data differs from the original")
+    compressed_size = os.path.getsize(compressed)
+    megabytes = len(data) / 1e6
+    return {
+        "original_size": len(data),
+        "compressed_size": compressed_size,
+        "ratio": compressed_size / len(data) if data else 1.0,
+        "compress_mb_s": megabytes / ctime if ctime else 0.0,
+        "decompress_mb_s": megabytes / dtime if dtime else 0.0,
+        "compress_peak_bytes": peak_memory(compress, original, compressed) if memory else None,
+        "decompress_peak_bytes": peak_memory(decompress, compressed, decompressed) if memory else None,
+    }
+
+
+def run(corpora, codecs, orders, size, repeat, seed=SEED, memory=True):
+    """
+    Runs every method on every corpus and returns the results, ready to be saved as JSON.
+    """
+    results = {}
+    methods = make_methods(codecs, orders)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for corpus in corpora:
+            data = make_corpus(corpus, size, seed)
+            for name, compress, decompress in methods:
+                result = run_method(compress, decompress, data, tmpdir, repeat, memory)
+                results["{}/{}".format(name, corpus)] = result
+                print("{:>8} {:>10} ratio {:>6.3f}  compress {:>8.3f} MB/s  decompress {:>8.3f} MB/s  "
+                      "peak heap {} / {} bytes (without mapped files)".format(
+                          name, corpus, result["ratio"], result["compress_mb_s"], result["decompress_mb_s"],
+                          result["compress_peak_bytes"], result["decompress_peak_bytes"]), file=sys.stderr)
+    return {
+        "environment": {"python": platform.python_version(), "implementation": platform.python_implementation(),
+                        "machine": platform.machine(), "system": platform.system()},
+        "settings": {"size": size, "seed": seed, "repeat": repeat, "orders": list(orders)},
+        "results": results,
+    }
+
+
+def compare(baseline, current, tolerance):
+    """
+    Returns a list of messages, one for every measurement of current that is a regression against the baseline.
+    Speeds may drop and peak memory may grow by the tolerance fraction, compression ratios may not get worse.
+    """
+    regressions = []
+    for key, old in sorted(baseline["results"].items()):
+        new = current["results"].get(key)
+        if new is None:
+            continue
+        for field in ("compress_mb_s", "decompress_mb_s"):
+            if new[field] < old[field] * (1 - tolerance):
+                regressions.append("{}: {} dropped from {:.3f} to {:.3f}".format(key, field, old[field], new[field]))
+        for field in ("compress_peak_bytes", "decompress_peak_bytes"):
+            if old[field] is not None and new[field] is not None and new[field] > old[field] * (1 + tolerance):
+                regressions.append("{}: {} grew from {} to {}".format(key, field, old[field], new[field]))
+        if new["compressed_size"] > old["compressed_size"]:
+            regressions.append("{}: compressed size grew from {} to {}".format(
+                key, old["compressed_size"], new["compressed_size"]))
+    return regressions
+
+
+def final_function(args):
+    """
+    Final function to run the benchmark suite.
+    """
+    parser = argparse.ArgumentParser(prog="benchmark.py", description="Compression benchmark suite")
+    parser.add_argument("--size", type=int, default=SIZE, help="number of bytes of every corpus")
+    parser.add_argument("--corpora", nargs="+", choices=CORPORA, default=list(CORPORA))
+    parser.add_argument("--codecs", nargs="+", choices=CODECS, default=list(CODECS))
+    parser.add_argument("--orders", type=int, nargs="+", default=list(ORDERS), help="model orders of PPM")
+    parser.add_argument("--repeat", type=int, default=1, help="number of timed runs, the best one is reported")
+    parser.add_argument("--seed", type=int, default=SEED, help="seed of the corpora")
+    parser.add_argument("--no-memory", action="store_true", help="do not measure the peak memory")
+    parser.add_argument("--json", help="file to save the results to")
+    parser.add_argument("--compare", help="results saved before, to flag the regressions against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="fraction by which speeds may drop and peak memory may grow (default 0.1)")
+    args = parser.parse_args(args)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as inp:
+            baseline = json.load(inp)
+        # Run with the settings of the baseline, so that the results can be compared
+        settings = baseline["settings"]
+        args.size, args.seed, args.orders = settings["size"], settings["seed"], settings["orders"]
+
+    current = run(args.corpora, args.codecs, args.orders, args.size, max(args.repeat, 1), args.seed,
+                  not args.no_memory)
+    if args.json:
+        with open(args.json, "w") as out:
+            json.dump(current, out, indent=2, sort_keys=True)
+    else:
+        json.dump(current, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+    if baseline is not None:
+        regressions = compare(baseline, current, args.tolerance)
+        for message in regressions:
+            print("REGRESSION " + message, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("No regressions against {}".format(args.compare), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    final_function(sys.argv[1:])
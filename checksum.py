@@ -0,0 +1,39 @@
+"""
+Byte stream wrappers that keep the size and CRC-32 of the data that goes through them, for the compressors that
+record them in their headers and check them after decompression.
+"""
+
+import zlib
+
+
+class ChecksumReader(object):
+    """
+    Wraps a byte input stream and keeps the number of bytes read from it and their CRC-32.
+    """
+
+    def __init__(self, inp):
+        self.input = inp  # The underlying byte stream
+        self.size = 0  # Number of bytes read so far
+        self.crc = 0  # CRC-32 of the bytes read so far
+
+    def read(self, n=-1):
+        data = self.input.read(n)
+        self.size += len(data)
+        self.crc = zlib.crc32(data, self.crc)
+        return data
+
+
+class ChecksumWriter(object):
+    """
+    Wraps a byte output stream and keeps the number of bytes written to it and their CRC-32.
+    """
+
+    def __init__(self, out):
+        self.output = out  # The underlying byte stream
+        self.size = 0  # Number of bytes written so far
+        self.crc = 0  # CRC-32 of the bytes written so far
+
+    def write(self, data):
+        self.size += len(data)
+        self.crc = zlib.crc32(data, self.crc)
+        return self.output.write(data)
@@ -0,0 +1,183 @@
+"""
+Memory-mapped file I/O for the compression scripts. An input file is mapped read-only and read as memoryview slices
+of the mapping, so reading copies nothing and makes no system calls: the operating system pages the file in from its
+page cache. An output file is mapped at its final size when it is known (a decompressed file whose size is recorded
+in the compressed file), or grown in large steps and cut to the written size when it is closed.
+
+Both objects have the read or write, seek and tell methods of the file objects they replace, and are used the same
+way:
+    with mmapio.open_input(inputfile) as inp, mmapio.open_output(outputfile, original_size) as out:
+        ...
+Only regular files are mapped: empty input files and the paths of pipes and devices (like /dev/stdout) are opened as
+ordinary files instead, as are all the files when ENABLED is False.
+
+The slices returned by read stay valid while the mapping is open, they are memoryviews and not bytes, so callers that
+need bytes methods must convert them.
+"""
+
+import io
+import mmap
+import os
+import stat
+
+# Whether the files are mapped. Set to False to use ordinary files.
+ENABLED = True
+
+# Number of bytes an output file of unknown size grows by at least, when its mapping is full.
+GROW_SIZE = 1 << 24
+
+
+def open_input(path):
+    """
+    Opens the file at path for reading, mapped if it is a non-empty regular file.
+    """
+    if ENABLED:
+        info = os.stat(path)
+        if stat.S_ISREG(info.st_mode) and info.st_size > 0:
+            return MappedReader(path)
+    return open(path, "rb")
+
+
+def open_output(path, size=None):
+    """
+    Creates the file at path for writing, mapped at the given final size if it is known and grown as needed
+    otherwise. A path that exists and is not a regular file is opened as an ordinary file, and so is every path when
+    ENABLED is False; such a file is preallocated at the final size only if it is a regular file, so the output can
+    also be streamed to pipes and devices.
+    """
+    if ENABLED:
+        try:
+            mode = os.stat(path).st_mode
+        except FileNotFoundError:
+            mode = stat.S_IFREG  # A new file is created as a regular file
+        if stat.S_ISREG(mode):
+            return MappedWriter(path, size)
+    out = open(path, "wb")
+    if size is not None and stat.S_ISREG(os.fstat(out.fileno()).st_mode):
+        out.truncate(size)
+    return out
+
+
+class MappedReader(io.RawIOBase):
+    """
+    A read-only file object over a memory-mapped file, whose reads return memoryview slices of the mapping.
+    """
+
+    def __init__(self, path):
+        super(MappedReader, self).__init__()
+        self.name = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, n=-1):
+        """
+        Returns the next n bytes (all the rest if n is negative) as a memoryview, which is empty at the end of file.
+        """
+        end = len(self.view) if n is None or n < 0 else min(self.position + n, len(self.view))
+        data = self.view[self.position:end]
+        self.position = max(self.position, end)
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = (0, self.position, len(self.view))[whence]
+        if base + offset < 0:
+            raise ValueError("Negative seek position")
+        self.position = base + offset
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        """
+        Closes the mapping and the file. The mapping stays until the last slice returned by read is released.
+        """
+        if self.closed:
+            return
+        self.view.release()
+        try:
+            self.map.close()
+        except BufferError:  # Slices are still in use, the mapping is closed when they are collected
+            pass
+        self.file.close()
+        super(MappedReader, self).close()
+
+
+class MappedWriter(io.RawIOBase):
+    """
+    A file object that writes to a memory-mapped file. The mapping covers the expected size, and is grown when more
+    is written; when the file is closed it is cut to the end of the data written.
+    """
+
+    def __init__(self, path, size=None):
+        super(MappedWriter, self).__init__()
+        self.name = path
+        self.file = open(path, "w+b")  # A writable mapping needs a file open for reading too
+        self.map = None
+        self.size = 0  # Size of the mapping
+        self.position = 0
+        self.end = 0  # End of the data written
+        self._resize(size if size is not None else GROW_SIZE)
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def write(self, data):
+        """
+        Copies the bytes into the mapping at the current position, growing the file if they do not fit.
+        """
+        count = len(data)
+        if count == 0:
+            return 0
+        end = self.position + count
+        if end > self.size:
+            self._resize(max(end, self.size + max(self.size, GROW_SIZE)))
+        self.map[self.position:end] = data
+        self.position = end
+        self.end = max(self.end, end)
+        return count
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = (0, self.position, self.end)[whence]
+        if base + offset < 0:
+            raise ValueError("Negative seek position")
+        self.position = base + offset
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        """
+        Unmaps the file, cuts it to the end of the data written and closes it.
+        """
+        if self.closed:
+            return
+        if self.map is not None:
+            self.map.close()
+        self.file.truncate(self.end)
+        self.file.close()
+        super(MappedWriter, self).close()
+
+    def _resize(self, size):
+        """
+        Sets the size of the file and maps all of it.
+        """
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.truncate(size)
+        if size > 0:
+            self.map = mmap.mmap(self.file.fileno(), size)
+        self.size = size
@@ -0,0 +1,22 @@
+"""
+Helpers for the block modes of the compressors, which code independent blocks of a file in a pool of worker
+processes.
+"""
+
+import collections
+import os
+
+
+def map_in_order(executor, function, tasks, workers):
+    """
+    Run function on every tuple of arguments in tasks with the executor and yield the results in order. Only a few
+    tasks per worker are in flight at a time, so the results that wait for an earlier one stay bounded.
+    """
+    window = 2 * (workers or os.cpu_count() or 1)
+    pending = collections.deque()
+    for task in tasks:
+        pending.append(executor.submit(function, *task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
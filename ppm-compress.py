@@ -6,69 +6,152 @@ To compress dickens text file please run in the terminal:
 In our case the input file is 'dickens.txt' and the output file is the compressed file, can be called for example
 'compressed_dickens.txt'
 
+To compress a big file in parallel, in independent blocks that each get a fresh model, please run in the terminal:
+    python ppm_compress.py InputFile OutputFile --blocks [--block-size BYTES] [--workers N]
+Splitting the file costs some compression, since every block starts learning from an empty model.
+
+The output file starts with a header that records the parameters of the codec, the original size and a CRC-32 of
+the data (see ppmcontainer.py), so ppm_decompress.py needs no options to decompress it. The parameters can be chosen
+with:
+    --order N             model order, at least -1 (default 3)
+    --max-contexts N      bound the memory of the model to N contexts, with --budget-policy restart|prune
+    --max-total N         halve the counts of a context whenever their total passes N (2^30 by default, just under
+                          the limit of the coder), which lets streams of any length be compressed. A smaller value,
+                          like 4096, makes the model forget old statistics faster and adapt to data that changes.
+    --coder range         code with the byte-oriented range coder instead of the bit-oriented arithmetic coder, which
+                          is faster. It accepts totals up to 2^16, which is then the default of --max-total.
+With --snapshot FILE, the model starts from a snapshot of a model trained on a dictionary corpus (see ppmsnapshot.py)
+instead of an empty model, which compresses short files much better; the same snapshot is needed to decompress.
+With --report, the size of the final model is printed. With --stats FILE, the counters of ppmstats.py (symbols coded
+and escaped at every order, coder shifts and underflows, contexts created, ...) are written to FILE as JSON; the
+instrumented run is slower.
+
 Note: Please make sure you have python version >=3.
 """
 
-import contextlib
+import argparse
+import concurrent.futures
+import io
+import os
 import sys
+import zlib
 import arithmeticcoding
+import checksum
+import mmapio
+import parallel
+import ppmcodec
+import ppmcontainer
 import ppmmodel
+import ppmsnapshot
+import ppmstats
 
-# Must be at least -1 and match ppm_decompress.py.
+# Default model order, must be at least -1.
 MODEL_ORDER = 3
 
+# Default frequency total at which the counts of a context are halved, so that streams of any length can be coded.
+# Must be at most the largest total the 32-bit coder accepts, and RANGE_MAX_TOTAL with the range coder.
+MAX_TOTAL = 1 << 30
+RANGE_MAX_TOTAL = arithmeticcoding.RANGE_MAX_TOTAL
+
+# Default parameters of the codec. Symbol 256 is both the escape symbol and EOF.
+PARAMETERS = ppmcontainer.DEFAULT_PARAMETERS._replace(order=MODEL_ORDER, max_total=MAX_TOTAL)
+
+# Default number of original bytes in every block of a block mode file.
+BLOCK_SIZE = 1 << 20
 
-def compress(inp, bitout):
+
+def compress(inp, bitout, validation=arithmeticcoding.FAST, params=PARAMETERS, stats=None, snapshot=None):
     """
     Set up encoder and model. In this PPM model, symbol 256 represents EOF. Its frequency is 1 in the order -1
-    context but its frequency is 0 in all other contexts (which have non-negative order).
+    context but its frequency is 0 in all other contexts (which have non-negative order). The validation level of the
+    encoder is arithmeticcoding.FAST or arithmeticcoding.CHECKED, and params are the ppmcontainer.Parameters of the
+    codec, which the decoder must use too. If a ppmstats.PpmStats object is given, the instrumented coder and model
+    fill it (always checked). The model starts from the given ppmsnapshot.Snapshot, if any. Only the coded stream is
+    written, without a header. Returns the model.
     """
-    enc = arithmeticcoding.ArithmeticEncoder(32, bitout)
-    model = ppmmodel.PpmModel(MODEL_ORDER, 257, 256)
-    history = []
+    if stats is None:
+        enc = ppmcodec.new_encoder(params, bitout, validation)
+        model = ppmcodec.new_model(params, enc, snapshot=snapshot)
+        encode_symbol = ppmcodec.encode_symbol
+    else:
+        enc = stats.new_encoder(params, bitout)
+        model = stats.new_model(params, enc, snapshot)
+        encode_symbol = stats.encode_symbol
 
     while True:
-        # Read and encode one byte
-        symbol = inp.read(1)
-        if len(symbol) == 0:
+        # Read and encode the bytes, a buffer at a time
+        data = inp.read(arithmeticcoding.BUFFER_SIZE)
+        if len(data) == 0:
             break
-        symbol = symbol[0]
-        encode_symbol(model, history, symbol, enc)
-        model.increment_contexts(history, symbol)
-
-        if model.model_order >= 1:
-            # Prepend current symbol, dropping oldest symbol if necessary
-            if len(history) == model.model_order:
-                history.pop()
-            history.insert(0, symbol)
+        for symbol in data:
+            encode_symbol(model, symbol, enc)
+            model.update(symbol)
 
-    encode_symbol(model, history, 256, enc)  # EOF
+    encode_symbol(model, 256, enc)  # EOF
     # Flush remaining code bits
     enc.finish()
+    return model
 
 
-def encode_symbol(model, history, symbol, enc):
+def compress_file(inputfile, outputfile, validation=arithmeticcoding.FAST, params=PARAMETERS, stats=None,
+                  snapshot=None):
+    """
+    Compress the input file as one stream, after a header with the parameters, the original size, the CRC-32 of the
+    data and the id of the snapshot, if any. The header is written with a zero size and CRC first and filled in once
+    the input was read. Both files are memory-mapped (see mmapio.py). An output that cannot seek back, like a pipe,
+    gets the header of a stream of unknown size instead, which cannot be verified. Returns the model.
+    """
+    snapshot_id = snapshot.id if snapshot is not None else ppmcontainer.NO_SNAPSHOT
+    with mmapio.open_input(inputfile) as inp, mmapio.open_output(outputfile) as out:
+        seekable = out.seekable()
+        if seekable:
+            ppmcontainer.write_stream_header(out, params, 0, 0, snapshot_id)
+        else:
+            ppmcontainer.write_stream_header(out, params, ppmcontainer.UNKNOWN_SIZE, 0, snapshot_id)
+        reader = checksum.ChecksumReader(inp)
+        bitout = arithmeticcoding.BitOutputStream(out)
+        model = compress(reader, bitout, validation, params, stats, snapshot)
+        bitout.flush()
+        if seekable:
+            out.seek(0)
+            ppmcontainer.write_stream_header(out, params, reader.size, reader.crc, snapshot_id)
+    return model
+
+
+def compress_block(inputfile, offset, length, validation, params):
+    """
+    Compress one block of the input file in a worker process, with a fresh model and encoder. Returns the number of
+    original bytes, their CRC-32 and the coded block.
+    """
+    with open(inputfile, "rb") as inp:
+        inp.seek(offset)
+        data = inp.read(length)
+    out = io.BytesIO()
+    bitout = arithmeticcoding.BitOutputStream(out)
+    compress(io.BytesIO(data), bitout, validation, params)
+    bitout.flush()
+    return len(data), zlib.crc32(data), out.getvalue()
+
+
+def compress_blocks(inputfile, outputfile, block_size=BLOCK_SIZE, workers=None, validation=arithmeticcoding.FAST,
+                    params=PARAMETERS):
     """
-    Try to use highest order context that exists based on the history suffix, such
-    that the next symbol has non-zero frequency. When symbol 256 is produced at a context
-    at any non-negative order, it means "escape to the next lower order with non-empty
-    context". When symbol 256 is produced at the order -1 context, it means "EOF".
+    Compress the input file in block mode: blocks of block_size bytes are compressed independently in a pool of
+    worker processes and written in order, followed by their index (see ppmcontainer.py).
     """
-    for order in reversed(range(len(history) + 1)):
-        ctx = model.root_context
-        for sym in history[: order]:
-            assert ctx.subcontexts is not None
-            ctx = ctx.subcontexts[sym]
-            if ctx is None:
-                break
-        else:  # ctx is not None
-            if symbol != 256 and ctx.frequencies.get(symbol) > 0:
-                enc.write(ctx.frequencies, symbol)
-                return
-            # Else write context escape symbol and continue decrementing the order
-            enc.write(ctx.frequencies, 256)
-    # Logic for order = -1
-    enc.write(model.order_minus1_freqs, symbol)
+    if block_size < 1:
+        raise ValueError("Block size must be positive")
+    original_size = os.path.getsize(inputfile)
+    with open(outputfile, "wb") as out:
+        ppmcontainer.write_header(out, params, block_size, original_size)
+        index = []
+        tasks = ((inputfile, offset, min(block_size, original_size - offset), validation, params)
+                 for offset in range(0, original_size, block_size))
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            for decoded_size, crc, encoded in parallel.map_in_order(executor, compress_block, tasks, workers):
+                index.append((out.tell(), len(encoded), decoded_size, crc))
+                out.write(encoded)
+        ppmcontainer.write_index(out, index)
 
 
 def final_function(args):
@@ -76,15 +159,61 @@ def final_function(args):
     Final function to compress the given text file with PPM compression.
     """
     # Handle command line arguments
-    if len(args) != 2:
-        sys.exit("Usage: python ppm_compress.py InputFile OutputFile")
-    inputfile = args[0]
-    outputfile = args[1]
+    parser = argparse.ArgumentParser(prog="ppm_compress.py", description="PPM compression")
+    parser.add_argument("inputfile")
+    parser.add_argument("outputfile")
+    parser.add_argument("--blocks", action="store_true",
+                        help="compress in independent blocks, in parallel")
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE,
+                        help="number of original bytes in every block (block mode)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes (block mode, default: one per core)")
+    parser.add_argument("--checked", action="store_true",
+                        help="check the frequency tables and the coder state on every symbol (slower)")
+    parser.add_argument("--order", type=int, default=MODEL_ORDER,
+                        help="model order, at least -1")
+    parser.add_argument("--max-contexts", type=int, default=None,
+                        help="budget of model contexts (default: no limit)")
+    parser.add_argument("--budget-policy", choices=ppmcontainer.BUDGET_POLICIES, default=ppmmodel.RESTART,
+                        help="what to do when the budget is exceeded")
+    parser.add_argument("--max-total", type=int, default=None,
+                        help="frequency total at which the counts of a context are halved (default: the largest "
+                             "total the coder accepts)")
+    parser.add_argument("--coder", choices=ppmcontainer.CODERS, default=arithmeticcoding.ARITHMETIC,
+                        help="coding engine, the bit-oriented arithmetic coder or the faster byte-oriented range coder")
+    parser.add_argument("--report", action="store_true",
+                        help="print the number of contexts of the final model and their approximate memory")
+    parser.add_argument("--stats", metavar="FILE",
+                        help="write the coder and model counters to FILE as JSON (not in block mode)")
+    parser.add_argument("--snapshot", metavar="FILE",
+                        help="start from the model of a snapshot file of ppmsnapshot.py (not in block mode)")
+    args = parser.parse_args(args)
+    inputfile = args.inputfile
+    outputfile = args.outputfile
+    validation = arithmeticcoding.CHECKED if args.checked else arithmeticcoding.FAST
+    max_total = args.max_total
+    if max_total is None:
+        max_total = RANGE_MAX_TOTAL if args.coder == arithmeticcoding.RANGE else MAX_TOTAL
+    params = PARAMETERS._replace(order=args.order, max_contexts=args.max_contexts, budget_policy=args.budget_policy,
+                                 max_total=max_total, coder=args.coder)
+
+    if args.blocks:
+        if args.stats is not None:
+            parser.error("--stats is not supported in block mode")
+        if args.snapshot is not None:
+            parser.error("--snapshot is not supported in block mode")
+        compress_blocks(inputfile, outputfile, args.block_size, args.workers, validation, params)
+        return
 
     # Perform file compression
-    with open(inputfile, "rb") as inp, \
-            contextlib.closing(arithmeticcoding.BitOutputStream(open(outputfile, "wb"))) as bitout:
-        compress(inp, bitout)
+    stats = ppmstats.PpmStats() if args.stats is not None else None
+    snapshot = ppmsnapshot.load(args.snapshot) if args.snapshot is not None else None
+    model = compress_file(inputfile, outputfile, validation, params, stats, snapshot)
+    if args.report:
+        print("{} contexts, about {} bytes".format(model.num_contexts, model.get_memory_usage()), file=sys.stderr)
+    if stats is not None:
+        with open(args.stats, "w") as out:
+            out.write(stats.to_json())
 
 
 if __name__ == "__main__":
@@ -7,62 +7,145 @@ terminal:
 In our case the input file is 'compressed_dickens.txt' and the output file is the decompressed file (equal to the
 original), can be called for example 'decompressed_dickens.txt'
 
+The parameters of the codec are read from the header of the file, and the decompressed data is checked against the
+original size and CRC-32 recorded there. A file compressed in block mode (see ppm_compress.py) is recognized
+automatically and decompressed in parallel, the number of worker processes can be given with --workers N.
+
+Legacy files, written before the header existed, are decoded with the parameters given by --order, --max-contexts,
+--budget-policy and --max-total, which must be the ones the file was compressed with (default: order 3, no budget).
+
+With --stats FILE, the counters of ppmstats.py are written to FILE as JSON, as with ppm_compress.py.
+
+A file compressed with --snapshot FILE must be decompressed with the same snapshot, given with --snapshot FILE too.
+Its id is recorded in the header, so a missing or different snapshot is reported instead of decoding garbage.
+
 Note: Please make sure you have python version >=3.
 """
 
 
+import argparse
+import concurrent.futures
+import io
 import sys
+import zlib
 import arithmeticcoding
-import ppmmodel
-
-
-# Must be at least -1 and match ppm-compress.py.
-MODEL_ORDER = 3
+import checksum
+import mmapio
+import parallel
+import ppmcodec
+import ppmcontainer
+import ppmsnapshot
+import ppmstats
 
 
-def decompress(bitin, out):
+def decompress(bitin, out, validation=arithmeticcoding.FAST, params=ppmcontainer.LEGACY_PARAMETERS,
+               original_size=None, stats=None, snapshot=None):
     """
     Set up decoder and model. In this PPM model, symbol 256 represents EOF; its frequency is 1 in the order -1
-    context but its frequency is 0 in all other contexts (which have non-negative order).
+    context but its frequency is 0 in all other contexts (which have non-negative order). The validation level of the
+    decoder is arithmeticcoding.FAST or arithmeticcoding.CHECKED, and params are the ppmcontainer.Parameters the
+    stream was compressed with. If the original size is known, a stream that decodes to more bytes is rejected as
+    corrupt instead of decoding garbage until an EOF symbol happens to come. If a ppmstats.PpmStats object is given,
+    the instrumented coder and model fill it (always checked). The model starts from the given ppmsnapshot.Snapshot,
+    if any, which must be the one the stream was compressed with.
     """
-    dec = arithmeticcoding.ArithmeticDecoder(32, bitin)
-    model = ppmmodel.PpmModel(MODEL_ORDER, 257, 256)
-    history = []
+    if stats is None:
+        dec = ppmcodec.new_decoder(params, bitin, validation)
+        model = ppmcodec.new_model(params, dec, snapshot=snapshot)
+        decode_symbol = ppmcodec.decode_symbol
+    else:
+        dec = stats.new_decoder(params, bitin)
+        model = stats.new_model(params, dec, snapshot)
+        decode_symbol = stats.decode_symbol
+    sink = arithmeticcoding.ByteSink(out)
+    remaining = -1 if original_size is None else original_size  # Never reaches 0 when the size is unknown
 
     while True:
         # Decode and write one byte
-        symbol = decode_symbol(dec, model, history)
+        symbol = decode_symbol(dec, model)
         if symbol == 256:  # EOF symbol
+            sink.flush()
             break
-        out.write(bytes((symbol,)))
-        model.increment_contexts(history, symbol)
+        if remaining == 0:
+            raise ValueError("Compressed data is corrupt: it decodes to more than {} bytes".format(original_size))
+        remaining -= 1
+        sink.write(symbol)
+        model.update(symbol)
 
-        if model.model_order >= 1:
-            # Prepend current symbol, dropping oldest symbol if necessary
-            if len(history) == model.model_order:
-                history.pop()
-            history.insert(0, symbol)
 
-
-def decode_symbol(dec, model, history):
+def decompress_file(inputfile, outputfile, validation=arithmeticcoding.FAST, params=ppmcontainer.LEGACY_PARAMETERS,
+                    stats=None, snapshot=None):
+    """
+    Decompress a stream file. The parameters, the original size and the CRC-32 are read from its header, and the
+    output file is mapped at its final size before decoding (see mmapio.py). The snapshot is used if the header
+    records its id, and a stream compressed with a snapshot cannot be decompressed without it. A legacy file without
+    a header is decoded with the given parameters and cannot be verified.
+    """
+    with mmapio.open_input(inputfile) as inp:
+        if not ppmcontainer.is_stream(inp.read(len(ppmcontainer.STREAM_MAGIC))):
+            inp.seek(0)
+            with mmapio.open_output(outputfile) as out:
+                decompress(arithmeticcoding.BitInputStream(inp), out, validation, params, stats=stats)
+            return
+        inp.seek(0)
+        params, original_size, crc, snapshot_id = ppmcontainer.read_stream_header(inp)
+        snapshot = ppmsnapshot.match(snapshot, snapshot_id)
+        if original_size == ppmcontainer.UNKNOWN_SIZE:  # Compressed while the data arrived, so it cannot be checked
+            with mmapio.open_output(outputfile) as out:
+                decompress(arithmeticcoding.BitInputStream(inp), out, validation, params, stats=stats,
+                           snapshot=snapshot)
+            return
+        with mmapio.open_output(outputfile, original_size) as out:
+            writer = checksum.ChecksumWriter(out)
+            decompress(arithmeticcoding.BitInputStream(inp), writer, validation, params, original_size, stats,
+                       snapshot)
+    if writer.size != original_size:
+        raise ValueError("Compressed data is truncated or corrupt: decoded {} of {} bytes".format(
+            writer.size, original_size))
+    if writer.crc != crc:
+        raise ValueError("Decompressed data does not match its CRC-32")
+
+
+def decompress_block(inputfile, offset, length, outputfile, output_offset, decoded_size, crc, validation, params):
+    """
+    Decompress one block of a block mode file in a worker process, with a fresh model and decoder, check it against
+    its size and CRC-32 and write it at its offset in the output file.
+    """
+    with open(inputfile, "rb") as inp:
+        inp.seek(offset)
+        block = inp.read(length)
+    out = io.BytesIO()
+    decompress(arithmeticcoding.BitInputStream(io.BytesIO(block)), out, validation, params, decoded_size)
+    decoded = out.getvalue()
+    if len(decoded) != decoded_size:
+        raise ValueError("Block at offset {} decoded to the wrong size".format(offset))
+    if zlib.crc32(decoded) != crc:
+        raise ValueError("Block at offset {} does not match its CRC-32".format(offset))
+    with open(outputfile, "r+b") as output:
+        output.seek(output_offset)
+        output.write(decoded)
+
+
+def decompress_blocks(inputfile, outputfile, workers=None, validation=arithmeticcoding.FAST):
     """
-    Try to use highest order context that exists based on the history suffix. When symbol 256
-    is consumed at a context at any non-negative order, it means "escape to the next lower order
-    with non-empty context". When symbol 256 is consumed at the order -1 context, it means "EOF".
+    Decompress a block mode file. The output file is created with its final size first, and the blocks are decoded
+    in a pool of worker processes that write them directly at their offsets. The parameters are read from the
+    header.
     """
-    for order in reversed(range(len(history) + 1)):
-        ctx = model.root_context
-        for sym in history[: order]:
-            assert ctx.subcontexts is not None
-            ctx = ctx.subcontexts[sym]
-            if ctx is None:
-                break
-        else:  # ctx is not None
-            symbol = dec.read(ctx.frequencies)
-            if symbol < 256:
-                return symbol
-        # Else we read the context escape symbol, so continue decrementing the order logic for order = -1
-    return dec.read(model.order_minus1_freqs)
+    with open(inputfile, "rb") as inp:
+        params, _, original_size = ppmcontainer.read_header(inp)
+        index = ppmcontainer.read_index(inp, original_size)
+    with open(outputfile, "wb") as out:
+        out.truncate(original_size)
+
+    tasks = []
+    output_offset = 0
+    for (offset, length, decoded_size, crc) in index:
+        tasks.append((inputfile, offset, length, outputfile, output_offset, decoded_size, crc, validation, params))
+        output_offset += decoded_size
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        for _ in parallel.map_in_order(executor, decompress_block, tasks, workers):
+            pass
 
 
 def final_function(args):
@@ -70,15 +153,50 @@ def final_function(args):
     Final function to decompress the given text file with PPM compression.
     """
     # Handle command line arguments
-    if len(args) != 2:
-        sys.exit("Usage: python ppm_decompress.py InputFile OutputFile")
-    inputfile = args[0]
-    outputfile = args[1]
+    parser = argparse.ArgumentParser(prog="ppm_decompress.py", description="PPM decompression")
+    parser.add_argument("inputfile")
+    parser.add_argument("outputfile")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes (block mode, default: one per core)")
+    parser.add_argument("--checked", action="store_true",
+                        help="check the frequency tables and the coder state on every symbol (slower)")
+    legacy = ppmcontainer.LEGACY_PARAMETERS
+    parser.add_argument("--order", type=int, default=legacy.order,
+                        help="model order of a legacy file without a header")
+    parser.add_argument("--max-contexts", type=int, default=legacy.max_contexts,
+                        help="budget of model contexts of a legacy file without a header (default: no limit)")
+    parser.add_argument("--budget-policy", choices=ppmcontainer.BUDGET_POLICIES, default=legacy.budget_policy,
+                        help="budget policy of a legacy file without a header")
+    parser.add_argument("--max-total", type=int, default=legacy.max_total,
+                        help="frequency total at which counts are halved, of a legacy file without a header")
+    parser.add_argument("--stats", metavar="FILE",
+                        help="write the coder and model counters to FILE as JSON (not in block mode)")
+    parser.add_argument("--snapshot", metavar="FILE",
+                        help="snapshot file of ppmsnapshot.py that the file was compressed with")
+    args = parser.parse_args(args)
+    inputfile = args.inputfile
+    outputfile = args.outputfile
+    validation = arithmeticcoding.CHECKED if args.checked else arithmeticcoding.FAST
+
+    with open(inputfile, "rb") as inp:
+        blocks = ppmcontainer.is_container(inp.read(len(ppmcontainer.MAGIC)))
+    if blocks:
+        if args.stats is not None:
+            parser.error("--stats is not supported in block mode")
+        if args.snapshot is not None:
+            parser.error("--snapshot is not supported in block mode")
+        decompress_blocks(inputfile, outputfile, args.workers, validation)
+        return
 
     # Perform file decompression
-    with open(inputfile, "rb") as inp, open(outputfile, "wb") as out:
-        bitin = arithmeticcoding.BitInputStream(inp)
-        decompress(bitin, out)
+    params = legacy._replace(order=args.order, max_contexts=args.max_contexts, budget_policy=args.budget_policy,
+                             max_total=args.max_total)
+    stats = ppmstats.PpmStats() if args.stats is not None else None
+    snapshot = ppmsnapshot.load(args.snapshot) if args.snapshot is not None else None
+    decompress_file(inputfile, outputfile, validation, params, stats, snapshot)
+    if stats is not None:
+        with open(args.stats, "w") as out:
+            out.write(stats.to_json())
 
 
 if __name__ == "__main__":
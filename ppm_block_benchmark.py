@@ -0,0 +1,95 @@
+"""
+Benchmark for the PPM block mode. It compresses and decompresses a file as one stream and then in block mode with
+every combination of the given block sizes and worker counts, and reports the compression ratio lost by splitting the
+file and the speedup of the parallel compression and decompression.
+
+To run the benchmark please run in the terminal:
+    python ppm_block_benchmark.py InputFile [--block-sizes BYTES ...] [--workers N ...]
+"""
+
+import argparse
+import contextlib
+import importlib
+import os
+import sys
+import tempfile
+import time
+import arithmeticcoding
+
+# The compression scripts have a '-' in their names, so they are imported by name.
+ppm_compress = importlib.import_module("ppm-compress")
+ppm_decompress = importlib.import_module("ppm-decompress")
+
+
+def timed(function, *args):
+    """
+    Returns the number of seconds that calling function with the given arguments takes.
+    """
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def compress_stream(inputfile, outputfile):
+    """
+    Compresses the input file as one stream, like ppm_compress.py without --blocks.
+    """
+    with open(inputfile, "rb") as inp, \
+            contextlib.closing(arithmeticcoding.BitOutputStream(open(outputfile, "wb"))) as bitout:
+        ppm_compress.compress(inp, bitout)
+
+
+def decompress_stream(inputfile, outputfile):
+    """
+    Decompresses a file that was compressed as one stream.
+    """
+    with open(inputfile, "rb") as inp, open(outputfile, "wb") as out:
+        ppm_decompress.decompress(arithmeticcoding.BitInputStream(inp), out)
+
+
+def check_equal(path1, path2):
+    """
+    Raises an error if the two files differ.
+    """
+    with open(path1, "rb") as file1, open(path2, "rb") as file2:
+        if file1.read() != file2.read():
+            raise AssertionError("Decompressed file differs from the original")
+
+
+def final_function(args):
+    """
+    Final function to run the block mode benchmark on the given file.
+    """
+    parser = argparse.ArgumentParser(prog="ppm_block_benchmark.py", description="PPM block mode benchmark")
+    parser.add_argument("inputfile")
+    parser.add_argument("--block-sizes", type=int, nargs="+", default=[1 << 18, 1 << 19, 1 << 20, 1 << 21])
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, os.cpu_count() or 1}))
+    args = parser.parse_args(args)
+    original_size = os.path.getsize(args.inputfile)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        compressed = os.path.join(tmpdir, "compressed")
+        decompressed = os.path.join(tmpdir, "decompressed")
+
+        base_ctime = timed(compress_stream, args.inputfile, compressed)
+        base_size = os.path.getsize(compressed)
+        base_dtime = timed(decompress_stream, compressed, decompressed)
+        check_equal(args.inputfile, decompressed)
+        print("Input: {} bytes, one stream: {} bytes ({:.2f} bits per byte), compress {:.2f}s, decompress {:.2f}s"
+              .format(original_size, base_size, 8 * base_size / max(original_size, 1), base_ctime, base_dtime))
+        print("{:>10} {:>8} {:>12} {:>10} {:>12} {:>12}".format(
+            "block", "workers", "size", "ratio loss", "c speedup", "d speedup"))
+
+        for block_size in args.block_sizes:
+            for workers in args.workers:
+                ctime = timed(ppm_compress.compress_blocks, args.inputfile, compressed, block_size, workers)
+                size = os.path.getsize(compressed)
+                dtime = timed(ppm_decompress.decompress_blocks, compressed, decompressed, workers)
+                check_equal(args.inputfile, decompressed)
+                print("{:>10} {:>8} {:>12} {:>9.2f}% {:>11.2f}x {:>11.2f}x".format(
+                    block_size, workers, size, 100.0 * (size - base_size) / max(base_size, 1),
+                    base_ctime / ctime, base_dtime / dtime))
+
+
+if __name__ == "__main__":
+    final_function(sys.argv[1:])
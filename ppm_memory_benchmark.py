@@ -0,0 +1,101 @@
+"""
+Memory benchmark for the PPM model. It trains a model on a file and reports how many bytes each context takes,
+both for the sparse context layout used by ppmmodel.py and for the dense layout it replaced (a 257-entry frequency
+list, a 258-entry cumulative list and a 257-entry subcontext list in every context).
+
+To run the benchmark please run in the terminal:
+    python ppm_memory_benchmark.py InputFile [ModelOrder]
+The model order defaults to 3, like in ppm_compress.py.
+"""
+
+import sys
+import tracemalloc
+import arithmeticcoding
+import ppmmodel
+
+
+class DenseContext(object):
+    """
+    A context laid out like the original PpmModel.Context, used as the "before" measurement.
+    """
+    def __init__(self, symbols, hassubctx):
+        self.frequencies = arithmeticcoding.SimpleFrequencyTable([0] * symbols)
+        self.frequencies._init_cumulative()  # Built lazily by the first coded symbol in the original model
+        self.subcontexts = ([None] * symbols) if hassubctx else None
+
+
+def train_model(data, order):
+    """
+    Feeds every byte of data through PpmModel.update, exactly like ppm_compress.py does.
+    """
+    model = ppmmodel.PpmModel(order, 257, 256)
+    for symbol in data:
+        model.update(symbol)
+    return model
+
+
+def count_contexts(ctx):
+    """
+    Returns the number of contexts in the subtree rooted at ctx.
+    """
+    if ctx is None:
+        return 0
+    result = 1
+    if ctx.subcontexts is not None:
+        for child in ctx.subcontexts.values():
+            result += count_contexts(child)
+    return result
+
+
+def build_dense_copy(ctx, depth, order, symbols):
+    """
+    Builds a DenseContext tree with the same shape and counts as the given sparse context tree.
+    """
+    dense = DenseContext(symbols, depth < order)
+    for symbol in range(symbols):
+        freq = ctx.frequencies.get(symbol)
+        if freq != 0:
+            dense.frequencies.set(symbol, freq)
+    dense.frequencies._init_cumulative()
+    if ctx.subcontexts is not None:
+        for (sym, child) in ctx.subcontexts.items():
+            dense.subcontexts[sym] = build_dense_copy(child, depth + 1, order, symbols)
+    return dense
+
+
+def measure(build):
+    """
+    Returns the value built by the given function and the number of bytes it keeps allocated.
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def final_function(args):
+    """
+    Final function to run the memory benchmark on the given file.
+    """
+    if len(args) not in (1, 2):
+        sys.exit("Usage: python ppm_memory_benchmark.py InputFile [ModelOrder]")
+    order = int(args[1]) if len(args) == 2 else 3
+    if order < 0:
+        sys.exit("Model order must be at least 0")
+    with open(args[0], "rb") as inp:
+        data = inp.read()
+
+    model, sparse_bytes = measure(lambda: train_model(data, order))
+    numcontexts = count_contexts(model.root_context)
+    _, dense_bytes = measure(lambda: build_dense_copy(model.root_context, 0, order, model.symbol_limit))
+
+    print("Input: {} bytes, model order {}, {} contexts".format(len(data), order, numcontexts))
+    print("Dense layout:  {:>12} bytes, {:>8.1f} bytes per context".format(dense_bytes, dense_bytes / numcontexts))
+    print("Sparse layout: {:>12} bytes, {:>8.1f} bytes per context".format(sparse_bytes, sparse_bytes / numcontexts))
+    print("Reduction: {:.1f}x".format(dense_bytes / sparse_bytes))
+
+
+if __name__ == "__main__":
+    final_function(sys.argv[1:])
@@ -0,0 +1,289 @@
+"""
+Incremental PPM encoder and decoder, for data that arrives in chunks (from a socket or a queue, for example) instead of
+being read from a file. Both keep the same model and arithmetic coder as ppm_compress.py and ppm_decompress.py, so a
+stream compressed one way can be decompressed the other way.
+
+To compress, feed the chunks to a PpmEncoder and send the bytes that every call returns:
+    encoder = PpmEncoder()
+    for chunk in chunks:
+        send(encoder.feed(chunk))
+    send(encoder.finish())
+To decompress, iterate over a PpmDecoder, which reads the compressed data from a file object or from an iterable of
+chunks only as far as it needs to, and yields the decompressed data in chunks:
+    for chunk in PpmDecoder(received_chunks):
+        use(chunk)
+
+By default the stream starts with the header of ppmcontainer.py, with an unknown original size, so the decoder takes
+its parameters from the stream. Both can start from the model of a ppmsnapshot.Snapshot, given as their snapshot
+argument, whose id is then recorded in the header and checked by the decoder.
+"""
+
+import io
+import zlib
+import arithmeticcoding
+import ppmcontainer
+import ppmmodel
+import ppmsnapshot
+
+
+def new_encoder(params, bitout, validation=arithmeticcoding.FAST):
+    """
+    Returns the encoder of the coder named by the given ppmcontainer.Parameters, writing to the bit output stream.
+    """
+    if params.coder == arithmeticcoding.RANGE:
+        if params.numbits != 32:
+            raise ValueError("The range coder is a 32-bit coder")
+        return arithmeticcoding.RangeEncoder(bitout, validation)
+    return arithmeticcoding.ArithmeticEncoder(params.numbits, bitout, validation)
+
+
+def new_decoder(params, bitin, validation=arithmeticcoding.FAST):
+    """
+    Returns the decoder of the coder named by the given ppmcontainer.Parameters, reading from the bit input stream.
+    """
+    if params.coder == arithmeticcoding.RANGE:
+        if params.numbits != 32:
+            raise ValueError("The range coder is a 32-bit coder")
+        return arithmeticcoding.RangeDecoder(bitin, validation)
+    return arithmeticcoding.ArithmeticDecoder(params.numbits, bitin, validation)
+
+
+def new_model(params, coder, factory=ppmmodel.PpmModel, snapshot=None):
+    """
+    Returns a new PPM model with the given ppmcontainer.Parameters, after checking that they can be coded with the
+    given arithmetic coder. Symbol 256 is both the escape symbol and EOF, so only that symbol layout is supported.
+    The model is built by calling factory with the arguments of PpmModel, and primed with the contexts of the given
+    ppmsnapshot.Snapshot, if any.
+    """
+    if params.symbol_limit != 257 or params.escape_symbol != 256:
+        raise ValueError("Only 257 symbols with escape symbol 256 are supported")
+    if params.max_total is None:
+        raise ValueError("Maximum total must be set, the coder accepts at most {}".format(coder.maximum_total))
+    if params.max_total > coder.maximum_total:
+        raise ValueError("Maximum total is too large for the coder, it accepts at most {}".format(coder.maximum_total))
+    model = factory(params.order, params.symbol_limit, params.escape_symbol, params.max_contexts,
+                    params.budget_policy, params.max_total)
+    if snapshot is not None:
+        snapshot.prime(model)
+    return model
+
+
+def encode_symbol(model, symbol, enc):
+    """
+    Try to use highest order context that exists based on the history suffix, such
+    that the next symbol has non-zero frequency. When symbol 256 is produced at a context
+    at any non-negative order, it means "escape to the next lower order with non-empty
+    context". When symbol 256 is produced at the order -1 context, it means "EOF".
+    The model keeps the contexts of the history suffixes in model.active_contexts.
+    """
+    for ctx in reversed(model.active_contexts):
+        freqs = ctx.frequencies
+        if freqs.get_total() == 0:  # The context was never updated, so it does not exist yet
+            continue
+        if symbol != 256 and freqs.get(symbol) > 0:
+            enc.write(freqs, symbol)
+            return
+        # Else write context escape symbol and continue decrementing the order
+        enc.write(freqs, 256)
+    # Logic for order = -1
+    enc.write(model.order_minus1_freqs, symbol)
+
+
+def decode_symbol(dec, model):
+    """
+    Try to use highest order context that exists based on the history suffix. When symbol 256
+    is consumed at a context at any non-negative order, it means "escape to the next lower order
+    with non-empty context". When symbol 256 is consumed at the order -1 context, it means "EOF".
+    The model keeps the contexts of the history suffixes in model.active_contexts.
+    """
+    for ctx in reversed(model.active_contexts):
+        freqs = ctx.frequencies
+        if freqs.get_total() == 0:  # The context was never updated, so it does not exist yet
+            continue
+        symbol = dec.read(freqs)
+        if symbol < 256:
+            return symbol
+        # Else we read the context escape symbol, so continue decrementing the order logic for order = -1
+    return dec.read(model.order_minus1_freqs)
+
+
+class PpmEncoder(object):
+    """
+    Compresses data that is given in chunks. Every call returns the compressed bytes that are complete so far, so the
+    encoder only buffers the bits of the last byte and the pending bits of the arithmetic coder.
+    """
+
+    def __init__(self, params=ppmcontainer.DEFAULT_PARAMETERS, validation=arithmeticcoding.FAST, header=True,
+                 snapshot=None):
+        self.params = params
+        self.output = io.BytesIO()  # The compressed bytes that were not returned yet
+        self.bitout = arithmeticcoding.BitOutputStream(self.output)
+        self.encoder = new_encoder(params, self.bitout, validation)
+        self.model = new_model(params, self.encoder, snapshot=snapshot)
+        self.finished = False
+        if header:
+            snapshot_id = snapshot.id if snapshot is not None else ppmcontainer.NO_SNAPSHOT
+            ppmcontainer.write_stream_header(self.output, params, ppmcontainer.UNKNOWN_SIZE, 0, snapshot_id)
+
+    def feed(self, data):
+        """
+        Compresses the given bytes and returns the compressed bytes that are complete so far.
+        """
+        if self.finished:
+            raise ValueError("Encoder is already finished")
+        model = self.model
+        enc = self.encoder
+        for symbol in data:
+            encode_symbol(model, symbol, enc)
+            model.update(symbol)
+        return self.flush()
+
+    def flush(self):
+        """
+        Returns the compressed bytes that are complete so far and were not returned yet. The stream itself is not
+        ended, so more data can be fed afterwards.
+        """
+        self.bitout.drain()
+        result = self.output.getvalue()
+        self.output.seek(0)
+        self.output.truncate()
+        return result
+
+    def finish(self):
+        """
+        Ends the stream with the EOF symbol and returns the rest of the compressed bytes. No data can be fed
+        afterwards.
+        """
+        if self.finished:
+            raise ValueError("Encoder is already finished")
+        encode_symbol(self.model, 256, self.encoder)  # EOF
+        self.encoder.finish()
+        self.bitout.flush()
+        self.finished = True
+        return self.flush()
+
+
+class PpmDecoder(object):
+    """
+    An iterator over the decompressed data of a stream, in chunks of at most chunk_size bytes. The compressed data is
+    read from a file object (with a read method) or from an iterable of byte chunks, only as far as decoding needs.
+    If params is None, the stream must start with a header (see PpmEncoder) and the parameters are read from it;
+    otherwise the stream is a raw coded stream with the given parameters. When the header records the original size
+    and CRC-32, the data is checked against them at the end. The snapshot, a ppmsnapshot.Snapshot, is used only if the
+    header records its id, or always for a raw stream.
+    """
+
+    def __init__(self, source, params=None, validation=arithmeticcoding.FAST, chunk_size=arithmeticcoding.BUFFER_SIZE,
+                 snapshot=None):
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be positive")
+        self.input = source if hasattr(source, "read") else _ChunkReader(source)
+        self.original_size = ppmcontainer.UNKNOWN_SIZE
+        self.expected_crc = 0
+        if params is None:
+            params, self.original_size, self.expected_crc, snapshot_id = ppmcontainer.read_stream_header(
+                _ExactReader(self.input))
+            snapshot = ppmsnapshot.match(snapshot, snapshot_id)
+        self.params = params
+        self.snapshot = snapshot
+        self.validation = validation
+        self.chunk_size = chunk_size
+        # The bit stream and the decoder are created on the first chunk, since the decoder reads the first bits
+        self.bitin = None
+        self.decoder = None
+        self.model = None
+        self.size = 0  # Number of bytes decoded so far
+        self.crc = 0  # CRC-32 of the bytes decoded so far
+        self.finished = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = self.decode(self.chunk_size)
+        if not chunk:
+            raise StopIteration
+        return chunk
+
+    def decode(self, count, pause=None):
+        """
+        Decodes at most count bytes and returns them, or b"" at the end of the stream. If pause is given, it is called
+        before every byte and the decoding stops early when it returns True, so that the caller can wait for more
+        compressed data without blocking in the middle of a symbol.
+        """
+        if self.finished:
+            return b""
+        if self.decoder is None:
+            self.bitin = arithmeticcoding.BitInputStream(self.input)
+            self.decoder = new_decoder(self.params, self.bitin, self.validation)
+            self.model = new_model(self.params, self.decoder, snapshot=self.snapshot)
+        dec = self.decoder
+        model = self.model
+        result = bytearray()
+        for _ in range(count):
+            if pause is not None and pause():
+                break
+            symbol = decode_symbol(dec, model)
+            if symbol == 256:  # EOF symbol
+                self.finished = True
+                break
+            result.append(symbol)
+            model.update(symbol)
+        self._check(result)
+        return bytes(result)
+
+    def _check(self, chunk):
+        """
+        Adds the chunk to the size and CRC-32 of the decoded data, and checks them against the header.
+        """
+        self.size += len(chunk)
+        self.crc = zlib.crc32(chunk, self.crc)
+        if self.original_size == ppmcontainer.UNKNOWN_SIZE:
+            return
+        if self.size > self.original_size:
+            raise ValueError("Compressed data is corrupt: it decodes to more than {} bytes".format(
+                self.original_size))
+        if self.finished and (self.size != self.original_size or self.crc != self.expected_crc):
+            raise ValueError("Decompressed data does not match its size and CRC-32")
+
+
+class _ChunkReader(object):
+    """
+    A minimal file object over an iterable of byte chunks. Every read returns the next available bytes, at most n of
+    them, without waiting for more chunks than needed.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.pending = b""  # The rest of the current chunk
+
+    def read(self, n=-1):
+        while not self.pending:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return b""
+            self.pending = bytes(chunk)
+        if n < 0 or n >= len(self.pending):
+            result, self.pending = self.pending, b""
+        else:
+            result, self.pending = self.pending[:n], self.pending[n:]
+        return result
+
+
+class _ExactReader(object):
+    """
+    Wraps a file object whose reads may return fewer bytes than asked, and reads exactly n bytes unless the stream
+    ends first.
+    """
+
+    def __init__(self, inp):
+        self.input = inp
+
+    def read(self, n):
+        result = b""
+        while len(result) < n:
+            data = self.input.read(n - len(result))
+            if not data:
+                break
+            result += data
+        return result
@@ -0,0 +1,186 @@
+"""
+File formats of the PPM compression. Every compressed file starts with a header that records the parameters of the
+codec, so the decoder configures itself from the file instead of relying on constants that must match.
+
+The parameters are stored as: model order (1 byte, signed), coder width in bits (1 byte), symbol limit (2 bytes),
+escape symbol (2 bytes), budget of contexts (4 bytes, 0 for no limit), budget policy (1 byte, 0 for restart and
+1 for prune), the frequency total at which counts are halved (8 bytes) and the coder (1 byte, 0 for the bit-oriented
+arithmetic coder and 1 for the byte-oriented range coder, see arithmeticcoding.py).
+
+The layout of a stream file, coded as one arithmetic-coded stream, is:
+    header: magic "PPMS", version (1 byte), parameters, original size (8 bytes), CRC-32 of the original data (4 bytes),
+            id of the snapshot the model started from (8 bytes, NO_SNAPSHOT for an empty model, see ppmsnapshot.py)
+    stream: the arithmetic-coded stream, padded to a whole byte
+A stream that is compressed while its data arrives has the original size UNKNOWN_SIZE and a CRC-32 of 0, and cannot
+be verified.
+
+In block mode the input is split into blocks that are compressed independently, each one with a fresh PPM model and
+its own arithmetic-coded stream, so they can be compressed and decompressed in parallel. The layout of a block mode
+file is:
+    header: magic "PPMB", version (1 byte), parameters, block size (4 bytes), original size (8 bytes)
+    blocks: the arithmetic-coded stream of every block, padded to a whole byte
+    index:  offset in the file, compressed size and decoded size (8 bytes each) and CRC-32 (4 bytes) of every block
+    footer: offset of the index (8 bytes), number of blocks (4 bytes), magic "PPMI"
+All the numbers are big endian.
+
+Files that start with neither magic are legacy streams, written before the header existed, with the parameters of
+LEGACY_PARAMETERS.
+"""
+
+import collections
+import struct
+import arithmeticcoding
+import ppmmodel
+
+# Parameters of the codec. max_contexts is None when the model has no budget.
+Parameters = collections.namedtuple("Parameters", ["order", "numbits", "symbol_limit", "escape_symbol",
+                                                   "max_contexts", "budget_policy", "max_total", "coder"],
+                                    defaults=(arithmeticcoding.ARITHMETIC,))
+
+# Default parameters of the codec: order 3, a 32-bit arithmetic coder, the 256 byte values and symbol 256 as both the
+# escape symbol and EOF, no budget, and counts halved just under the largest total the coder accepts.
+DEFAULT_PARAMETERS = Parameters(3, 32, 257, 256, None, ppmmodel.RESTART, 1 << 30, arithmeticcoding.ARITHMETIC)
+
+# The parameters the scripts used before they were recorded in the files.
+LEGACY_PARAMETERS = DEFAULT_PARAMETERS
+
+BUDGET_POLICIES = (ppmmodel.RESTART, ppmmodel.PRUNE)  # The budget policy is stored as its index in this tuple
+CODERS = (arithmeticcoding.ARITHMETIC, arithmeticcoding.RANGE)  # The coder is stored as its index in this tuple
+
+PREFIX = struct.Struct(">4sB")  # Magic and version, common to both formats
+PARAMETERS = struct.Struct(">bBHHIBQB")
+
+STREAM_MAGIC = b"PPMS"
+STREAM_VERSION = 1
+STREAM_HEADER = struct.Struct(">" + PREFIX.format[1:] + PARAMETERS.format[1:] + "QI8s")
+UNKNOWN_SIZE = (1 << 64) - 1
+NO_SNAPSHOT = bytes(8)  # The snapshot id of a stream whose model started empty
+
+MAGIC = b"PPMB"
+VERSION = 1
+HEADER = struct.Struct(">" + PREFIX.format[1:] + PARAMETERS.format[1:] + "IQ")
+INDEX_ENTRY = struct.Struct(">QQQI")
+FOOTER = struct.Struct(">QI4s")
+INDEX_MAGIC = b"PPMI"
+
+
+def is_container(prefix):
+    """
+    Returns True if the given first bytes of a file are the start of a block mode file.
+    """
+    return prefix[:len(MAGIC)] == MAGIC
+
+
+def is_stream(prefix):
+    """
+    Returns True if the given first bytes of a file are the start of a stream file with a header.
+    """
+    return prefix[:len(STREAM_MAGIC)] == STREAM_MAGIC
+
+
+def _pack_parameters(params):
+    """
+    Returns the header fields of the given parameters, in the order of PARAMETERS.
+    """
+    if params.budget_policy not in BUDGET_POLICIES:
+        raise ValueError("Unknown budget policy {}".format(params.budget_policy))
+    if params.coder not in CODERS:
+        raise ValueError("Unknown coder {}".format(params.coder))
+    if params.max_total is None:
+        raise ValueError("Maximum total must be set, the counts of a coded stream must be halved")
+    return (params.order, params.numbits, params.symbol_limit, params.escape_symbol, params.max_contexts or 0,
+            BUDGET_POLICIES.index(params.budget_policy), params.max_total, CODERS.index(params.coder))
+
+
+def _unpack_parameters(fields):
+    """
+    Returns the parameters stored in the given header fields, in the order of PARAMETERS.
+    """
+    order, numbits, symbol_limit, escape_symbol, max_contexts, policy, max_total, coder = fields
+    if policy >= len(BUDGET_POLICIES):
+        raise ValueError("Unknown budget policy {} in the PPM header".format(policy))
+    if coder >= len(CODERS):
+        raise ValueError("Unknown coder {} in the PPM header".format(coder))
+    return Parameters(order, numbits, symbol_limit, escape_symbol, max_contexts or None, BUDGET_POLICIES[policy],
+                      max_total, CODERS[coder])
+
+
+def _read_exactly(inp, size, what):
+    """
+    Reads size bytes, raising an error that names the kind of file if the file ends before.
+    """
+    data = inp.read(size)
+    if len(data) != size:
+        raise ValueError("File is too short to be a {}".format(what))
+    return data
+
+
+def write_stream_header(out, params, original_size, crc, snapshot_id=NO_SNAPSHOT):
+    """
+    Writes the header of a stream file.
+    """
+    out.write(STREAM_HEADER.pack(STREAM_MAGIC, STREAM_VERSION, *_pack_parameters(params), original_size, crc,
+                                 snapshot_id))
+
+
+def read_stream_header(inp):
+    """
+    Reads the header of a stream file and returns the parameters, the original size, the CRC-32 of the original data
+    and the id of the snapshot the model started from.
+    """
+    magic, version = PREFIX.unpack(_read_exactly(inp, PREFIX.size, "PPM stream file"))
+    if magic != STREAM_MAGIC:
+        raise ValueError("Not a PPM stream file")
+    if version != STREAM_VERSION:
+        raise ValueError("Unsupported PPM stream version {}".format(version))
+    rest = _read_exactly(inp, STREAM_HEADER.size - PREFIX.size, "PPM stream file")
+    fields = STREAM_HEADER.unpack(PREFIX.pack(magic, version) + rest)
+    return _unpack_parameters(fields[2:-3]), fields[-3], fields[-2], fields[-1]
+
+
+def write_header(out, params, block_size, original_size):
+    """
+    Writes the header of a block mode file.
+    """
+    out.write(HEADER.pack(MAGIC, VERSION, *_pack_parameters(params), block_size, original_size))
+
+
+def read_header(inp):
+    """
+    Reads the header of a block mode file and returns the parameters, the block size and the original size.
+    """
+    magic, version = PREFIX.unpack(_read_exactly(inp, PREFIX.size, "PPM block mode file"))
+    if magic != MAGIC:
+        raise ValueError("Not a PPM block mode file")
+    if version != VERSION:
+        raise ValueError("Unsupported PPM block mode version {}".format(version))
+    rest = _read_exactly(inp, HEADER.size - PREFIX.size, "PPM block mode file")
+    fields = HEADER.unpack(PREFIX.pack(magic, version) + rest)
+    return _unpack_parameters(fields[2:-2]), fields[-2], fields[-1]
+
+
+def write_index(out, index):
+    """
+    Writes the index of the blocks, a list of (offset, compressed size, decoded size, CRC-32), and the footer after
+    the blocks.
+    """
+    index_offset = out.tell()
+    for entry in index:
+        out.write(INDEX_ENTRY.pack(*entry))
+    out.write(FOOTER.pack(index_offset, len(index), INDEX_MAGIC))
+
+
+def read_index(inp, original_size):
+    """
+    Reads the index of the blocks from the end of a block mode file, and checks it against the original size.
+    Returns a list of (offset, compressed size, decoded size, CRC-32).
+    """
+    inp.seek(-FOOTER.size, 2)
+    index_offset, count, magic = FOOTER.unpack(inp.read(FOOTER.size))
+    if magic != INDEX_MAGIC:
+        raise ValueError("Block index of the PPM file is missing")
+    inp.seek(index_offset)
+    index = list(INDEX_ENTRY.iter_unpack(inp.read(count * INDEX_ENTRY.size)))
+    if len(index) != count or sum(entry[2] for entry in index) != original_size:
+        raise ValueError("Block index of the PPM file is corrupt")
+    return index
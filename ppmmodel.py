@@ -3,59 +3,195 @@ PPM (prediction by partial matching) model using arithmetic coding. Full explana
 can be found in the pdf file that is in our github page.
 """
 
+import sys
 import arithmeticcoding
 
+# Policies for a model that outgrows its budget of contexts. RESTART throws the whole model away and starts again
+# from an empty one. PRUNE removes the contexts that were used the least, until half of the budget is left.
+RESTART = "restart"
+PRUNE = "prune"
+
 
 class PpmModel(object):
     """
     Main class to implement out PPM model.
     """
 
-    def __init__(self, order, symbollimit, escapesymbol):
+    # A context's sparse frequency table is replaced by a dense Fenwick table once it holds more distinct symbols
+    # than this, because scanning a long sparse table costs more than the dense table's logarithmic lookups.
+    DENSE_THRESHOLD = 48
+
+    def __init__(self, order, symbollimit, escapesymbol, maxcontexts=None, budgetpolicy=RESTART, maxtotal=None):
         # order must be at least -1, symbol limit must be at least 0, and the escape symbol must be a positive value
         # and smaller than symbol limit
         if order < -1 or symbollimit <= 0 or not (0 <= escapesymbol < symbollimit):
             raise ValueError()
+        # pruning down to half the budget must leave room for the contexts it keeps: the active contexts and the
+        # contexts on their paths from the root, at most 1 + 1 + 2 + ... + order of them, and at least one more
+        if (maxcontexts is not None and maxcontexts < 2 * (order * (order + 1) // 2 + 2)) or \
+                budgetpolicy not in (RESTART, PRUNE):
+            raise ValueError()
+        # halving a total just above the limit must bring it below the limit, even if every symbol was seen
+        if maxtotal is not None and maxtotal < 2 * symbollimit:
+            raise ValueError()
         self.model_order = order  # order of the model
         self.symbol_limit = symbollimit  # symbol limit
         self.escape_symbol = escapesymbol  # escape symbol
+        self.max_contexts = maxcontexts  # budget of contexts, None for no limit
+        self.budget_policy = budgetpolicy  # what to do when the budget is exceeded
+        self.max_total = maxtotal  # frequency total at which a context's counts are halved, None for never
 
         # building frequency table
-        if order >= 0:
-            self.root_context = PpmModel.Context(symbollimit, order >= 1)
-            self.root_context.frequencies.increment(escapesymbol)
+        self._reset()
+        self.order_minus1_freqs = arithmeticcoding.FlatFrequencyTable(symbollimit)
+
+    def _reset(self):
+        """
+        Empties the model, leaving only the escape symbol in the root context.
+        """
+        if self.model_order >= 0:
+            self.root_context = PpmModel.Context(self.symbol_limit)
+            self.root_context.frequencies.increment(self.escape_symbol)
+            # active_contexts[i] is the context of the last i coded symbols, for every order i up to the model order
+            # (fewer at the start of the stream)
+            self.active_contexts = [self.root_context]
+            self.num_contexts = 1  # number of contexts in the tree
         else:
             self.root_context = None
-        self.order_minus1_freqs = arithmeticcoding.FlatFrequencyTable(symbollimit)
+            self.active_contexts = []
+            self.num_contexts = 0
 
-    def increment_contexts(self, history, symbol):
+    def update(self, symbol):
+        """
+        Increments the frequency of the given symbol in all the active contexts, and then moves the active contexts
+        forward by that symbol. The context of the last i+1 symbols is the subcontext, for the new symbol, of the
+        context of the i symbols before it, so the new active contexts are found in O(order) steps without walking
+        the tree from the root.
+        """
         if self.model_order == -1:
             return
-        # if the length of the history bytes is bigger than the model's order or if the symbol is bigger than the
-        # symbol limit raise an error
-        if len(history) > self.model_order or not (0 <= symbol < self.symbol_limit):
+        if not (0 <= symbol < self.symbol_limit):
             raise ValueError()
 
-        ctx = self.root_context
-        # increments the frequency of the given symbol.
-        ctx.frequencies.increment(symbol)
-        for (i, sym) in enumerate(history):
+        contexts = self.active_contexts
+        for ctx in contexts:
+            if ctx.frequencies.get_total() == 0:
+                # first use of the context, add the escape symbol to the frequency table
+                ctx.frequencies.increment(self.escape_symbol)
+            # increment the symbol to the frequency table
+            self._increment(ctx, symbol)
+
+        newcontexts = [self.root_context]
+        for ctx in contexts[: self.model_order]:
             subctxs = ctx.subcontexts
-            assert subctxs is not None
+            if subctxs is None:
+                subctxs = ctx.subcontexts = {}
+            child = subctxs.get(symbol)
+            if child is None:
+                child = subctxs[symbol] = PpmModel.Context(self.symbol_limit)
+                self.num_contexts += 1
+            newcontexts.append(child)
+        self.active_contexts = newcontexts
 
-            if subctxs[sym] is None:
-                # rebuild the context
-                subctxs[sym] = PpmModel.Context(self.symbol_limit, i + 1 < self.model_order)
-                # add the escape symbol to the frequency table
-                subctxs[sym].frequencies.increment(self.escape_symbol)
-            ctx = subctxs[sym]
-            # increment rhe symbol to the frequency table
-            ctx.frequencies.increment(symbol)
+        if self.max_contexts is not None and self.num_contexts > self.max_contexts:
+            self._enforce_budget()
+
+    def _enforce_budget(self):
+        """
+        Brings the number of contexts back within the budget with the budget policy. This only depends on the
+        symbols coded so far, so the encoder and the decoder do exactly the same.
+        """
+        if self.budget_policy == RESTART:
+            self._reset()
+            return
+
+        # Prune the contexts with the smallest totals first, doubling the threshold until half the budget is left.
+        # No context has a larger total than the root, so once the threshold passes it only the active contexts and
+        # the contexts on their paths remain.
+        active = set(map(id, self.active_contexts))
+        threshold = 2
+        while self.num_contexts > self.max_contexts // 2 and threshold <= 2 * self.root_context.frequencies.get_total():
+            self._prune(self.root_context, threshold, active)
+            threshold *= 2
+
+    def _prune(self, ctx, threshold, active):
+        """
+        Removes the subcontexts below ctx whose frequency total is smaller than the threshold, together with their
+        own subcontexts, except those that are active or lead to an active context. Returns True if ctx is active
+        or leads to an active context.
+        """
+        keep = id(ctx) in active
+        subctxs = ctx.subcontexts
+        if subctxs is not None:
+            for symbol in list(subctxs):
+                child = subctxs[symbol]
+                if self._prune(child, threshold, active):
+                    keep = True
+                elif child.frequencies.get_total() < threshold:
+                    del subctxs[symbol]
+                    self.num_contexts -= PpmModel._count_contexts(child)
+            if not subctxs:
+                ctx.subcontexts = None
+        return keep
+
+    @staticmethod
+    def _count_contexts(ctx):
+        """
+        Returns the number of contexts in the subtree rooted at ctx.
+        """
+        result = 1
+        if ctx.subcontexts is not None:
+            for child in ctx.subcontexts.values():
+                result += PpmModel._count_contexts(child)
+        return result
+
+    def get_memory_usage(self):
+        """
+        Returns the approximate number of bytes that the contexts of the model take, by adding up the sizes of their
+        objects. This walks the whole tree, so it is meant for reporting only.
+        """
+        result = 0
+        stack = [self.root_context] if self.root_context is not None else []
+        while stack:
+            ctx = stack.pop()
+            freqs = ctx.frequencies
+            result += sys.getsizeof(ctx) + sys.getsizeof(freqs)
+            if type(freqs) is arithmeticcoding.SparseFrequencyTable:
+                result += sys.getsizeof(freqs.symbols) + sys.getsizeof(freqs.counts)
+            else:
+                result += sys.getsizeof(freqs.__dict__) + sys.getsizeof(freqs.frequencies) + \
+                    sys.getsizeof(freqs.tree)
+            if ctx.subcontexts is not None:
+                result += sys.getsizeof(ctx.subcontexts)
+                stack.extend(ctx.subcontexts.values())
+        return result
+
+    def _increment(self, ctx, symbol):
+        """
+        Increments the given symbol in the context's frequency table, halving its frequencies when their total passes
+        the limit and switching the table to the dense layout when it stops being sparse.
+        """
+        freqs = ctx.frequencies
+        freqs.increment(symbol)
+        if self.max_total is not None and freqs.get_total() > self.max_total:
+            freqs.halve()
+        if type(freqs) is arithmeticcoding.SparseFrequencyTable and \
+                freqs.get_distinct_count() > PpmModel.DENSE_THRESHOLD:
+            ctx.frequencies = arithmeticcoding.FenwickFrequencyTable(freqs)
 
     class Context(object):
         """
-        An internal class to help us implement the PPM model.
+        An internal class to help us implement the PPM model. Only the symbols that were actually seen are stored:
+        the frequency table is sparse and the subcontexts are a dictionary from symbol to context, which stays None
+        until the first subcontext is created. The subcontext for a symbol is the context extended by that symbol,
+        so the path from the root spells a context from its oldest symbol to its newest one. A context is created
+        when it becomes active, and its frequency table stays empty until it is updated for the first time: until
+        then it is skipped when coding, as if it did not exist.
         """
-        def __init__(self, symbols, hassubctx):
-            self.frequencies = arithmeticcoding.SimpleFrequencyTable([0] * symbols)  # frequencies table
-            self.subcontexts = ([None] * symbols) if hassubctx else None
+
+        __slots__ = ("frequencies", "subcontexts")
+
+        def __init__(self, symbols, frequencies=None):
+            # frequencies table, an empty one unless it is given
+            self.frequencies = arithmeticcoding.SparseFrequencyTable(symbols) if frequencies is None else frequencies
+            self.subcontexts = None
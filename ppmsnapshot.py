@@ -0,0 +1,264 @@
+"""
+Pre-trained PPM models. Every PPM stream starts from an empty model, so a short message is coded before the model
+has learned anything about the data, and compresses badly. A model trained on a dictionary corpus that resembles the
+data can be saved as a snapshot, which the encoder and the decoder both load as the state their model starts from.
+
+To train a snapshot on a corpus please run in the terminal:
+    python ppmsnapshot.py Corpus SnapshotFile [--order N] [--max-total N] [--coder range]
+and then compress and decompress with it:
+    python ppm_compress.py InputFile OutputFile --snapshot SnapshotFile
+    python ppm_decompress.py OutputFile DecompressedFile --snapshot SnapshotFile
+The model order and the maximum total of the stream must be the ones the snapshot was trained with. The id of the
+snapshot, the first 8 bytes of the SHA-256 of its file, is recorded in the header of the stream (see
+ppmcontainer.py), so the decoder refuses a stream that was compressed with another snapshot.
+
+A snapshot is not a pickle of the contexts but three flat arrays, which are read at once from the memory-mapped file
+(see mmapio.py) when it is loaded, and cut into a frequency table for every context. Priming a model then only
+creates the contexts with copies of those tables, so a loaded snapshot is the cheap shared starting state of every
+stream of a process. The layout of a snapshot file is:
+    header:   magic "PPMD", version (1 byte), model order (1 byte, signed), symbol limit (2 bytes), escape symbol
+              (2 bytes), the frequency total at which counts are halved (8 bytes, 0 for never), number of contexts
+              (4 bytes) and number of stored frequencies (4 bytes)
+    contexts: for every context in depth-first order, the symbol that leads to it from its parent (0 for the root),
+              its number of subcontexts and its number of symbols with a non-zero frequency (2 bytes each)
+    symbols:  those symbols of every context, in the same order and in increasing order in a context (2 bytes each)
+    counts:   their frequencies (4 bytes each)
+All the numbers are big endian. The active contexts of the trained model are not saved: a primed model starts at the
+root context, like a new stream. A model with a budget of contexts and the restart policy restarts from an empty model,
+not from the snapshot.
+"""
+
+import argparse
+import array
+import hashlib
+import struct
+import sys
+import arithmeticcoding
+import mmapio
+import ppmcontainer
+import ppmmodel
+
+MAGIC = b"PPMD"
+VERSION = 1
+HEADER = struct.Struct(">4sBbHHQII")
+ID_SIZE = len(ppmcontainer.NO_SNAPSHOT)
+
+# Number of entries of the contexts array for every context.
+CONTEXT_FIELDS = 3
+
+
+def _array(typecode, data):
+    """
+    Returns an array of the given type code (of 2 or 4 byte items) with the big endian numbers of data.
+    """
+    result = array.array(typecode)
+    result.frombytes(data)
+    if sys.byteorder == "little":
+        result.byteswap()
+    return result
+
+
+def _bytes(typecode, values):
+    """
+    Returns the given numbers as big endian numbers of the size of the given type code.
+    """
+    result = array.array(typecode, values)
+    if sys.byteorder == "little":
+        result.byteswap()
+    return result.tobytes()
+
+
+def train(data, params=ppmcontainer.DEFAULT_PARAMETERS):
+    """
+    Returns a PPM model with the given ppmcontainer.Parameters, trained on the given bytes (or iterable of byte
+    chunks) as if they were coded.
+    """
+    model = ppmmodel.PpmModel(params.order, params.symbol_limit, params.escape_symbol, params.max_contexts,
+                              params.budget_policy, params.max_total)
+    for chunk in ([data] if isinstance(data, (bytes, bytearray, memoryview)) else data):
+        for symbol in chunk:
+            model.update(symbol)
+    return model
+
+
+def dumps(model):
+    """
+    Returns the snapshot of the given model, as the bytes of a snapshot file.
+    """
+    contexts = []
+    symbols = []
+    counts = []
+    stack = [(0, model.root_context)] if model.root_context is not None else []
+    while stack:
+        symbol, ctx = stack.pop()
+        freqs = ctx.frequencies
+        if type(freqs) is arithmeticcoding.SparseFrequencyTable:
+            ctx_symbols, ctx_counts = freqs.symbols, freqs.counts
+        else:
+            ctx_symbols = [sym for (sym, freq) in enumerate(freqs.frequencies) if freq]
+            ctx_counts = [freqs.frequencies[sym] for sym in ctx_symbols]
+        subctxs = ctx.subcontexts or {}
+        contexts += (symbol, len(subctxs), len(ctx_symbols))
+        symbols += ctx_symbols
+        counts += ctx_counts
+        # Pushed in reverse, so that they are popped and saved in the order of the dictionary
+        stack.extend(reversed(list(subctxs.items())))
+    if counts and max(counts) >= 1 << 32:
+        raise ValueError("Frequencies are too large for a snapshot, train with a maximum total")
+    header = HEADER.pack(MAGIC, VERSION, model.model_order, model.symbol_limit, model.escape_symbol,
+                         model.max_total or 0, len(contexts) // CONTEXT_FIELDS, len(symbols))
+    return header + _bytes("H", contexts) + _bytes("H", symbols) + _bytes("I", counts)
+
+
+def save(model, path):
+    """
+    Writes the snapshot of the given model to the file at path.
+    """
+    with open(path, "wb") as out:
+        out.write(dumps(model))
+
+
+def load(path):
+    """
+    Reads the snapshot file at path, memory-mapped, and returns it as a Snapshot.
+    """
+    with mmapio.open_input(path) as inp:
+        return Snapshot(inp.read())
+
+
+class Snapshot(object):
+    """
+    A loaded snapshot of a PPM model, which primes new models with its contexts. It holds the shape of the tree and
+    a frequency table for every context, which are copied into the models it primes and never changed.
+    """
+
+    def __init__(self, data):
+        if len(data) < HEADER.size:
+            raise ValueError("File is too short to be a PPM snapshot")
+        magic, version, order, symbol_limit, escape_symbol, max_total, num_contexts, num_symbols = \
+            HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a PPM snapshot")
+        if version != VERSION:
+            raise ValueError("Unsupported PPM snapshot version {}".format(version))
+        contexts_end = HEADER.size + 2 * CONTEXT_FIELDS * num_contexts
+        symbols_end = contexts_end + 2 * num_symbols
+        if len(data) != symbols_end + 4 * num_symbols:
+            raise ValueError("PPM snapshot is truncated or corrupt")
+        self.id = hashlib.sha256(data).digest()[:ID_SIZE]  # The snapshot id recorded in the stream headers
+        self.order = order
+        self.symbol_limit = symbol_limit
+        self.escape_symbol = escape_symbol
+        self.max_total = max_total or None
+        self.num_contexts = num_contexts
+        contexts = _array("H", data[HEADER.size:contexts_end])
+        symbols = _array("H", data[contexts_end:symbols_end])
+        counts = _array("I", data[symbols_end:])
+        if sum(contexts[2::CONTEXT_FIELDS]) != num_symbols or \
+                sum(contexts[1::CONTEXT_FIELDS]) != max(num_contexts - 1, 0):
+            raise ValueError("PPM snapshot is truncated or corrupt")
+
+        # For every context in depth-first order: its symbol, its number of subcontexts and its frequency table
+        self.nodes = []
+        position = 0
+        for i in range(0, len(contexts), CONTEXT_FIELDS):
+            end = position + contexts[i + 2]
+            table = arithmeticcoding.SparseFrequencyTable(symbol_limit)
+            table.assign(symbols[position:end], counts[position:end])
+            self.nodes.append((contexts[i], contexts[i + 1], table))
+            position = end
+
+    def check(self, model):
+        """
+        Raises an error if the given model cannot start from this snapshot, because its parameters differ from the
+        ones the snapshot was trained with, or because its budget is smaller than the snapshot.
+        """
+        if (model.model_order, model.symbol_limit, model.escape_symbol, model.max_total) != \
+                (self.order, self.symbol_limit, self.escape_symbol, self.max_total):
+            raise ValueError("The snapshot was trained with order {} and maximum total {}, not {} and {}".format(
+                self.order, self.max_total, model.model_order, model.max_total))
+        if model.max_contexts is not None and self.num_contexts > model.max_contexts:
+            raise ValueError("The snapshot has {} contexts, more than the budget of {}".format(
+                self.num_contexts, model.max_contexts))
+
+    def prime(self, model):
+        """
+        Replaces the contexts of the given new model with the contexts of the snapshot, leaving it at the root
+        context. The frequency tables are rebuilt in the layout the model would have given them.
+        """
+        self.check(model)
+        if model.model_order < 0:
+            return
+        context = ppmmodel.PpmModel.Context
+        dense = arithmeticcoding.FenwickFrequencyTable
+        dense_threshold = model.DENSE_THRESHOLD
+        symbol_limit = self.symbol_limit
+
+        root = None
+        parents = []  # The contexts whose subcontexts are being read, and how many of them are left
+        for (symbol, num_subcontexts, table) in self.nodes:
+            if table.get_distinct_count() > dense_threshold:
+                ctx = context(symbol_limit, dense(table))
+            else:
+                ctx = context(symbol_limit, table.copy())
+            if parents:
+                parent = parents[-1]
+                parent[0].subcontexts[symbol] = ctx
+                parent[1] -= 1
+                if parent[1] == 0:
+                    parents.pop()
+            else:
+                root = ctx
+            if num_subcontexts:
+                ctx.subcontexts = {}
+                parents.append([ctx, num_subcontexts])
+
+        model.root_context = root
+        model.active_contexts = [root]
+        model.num_contexts = self.num_contexts
+
+
+def match(snapshot, snapshot_id):
+    """
+    Returns the snapshot that a stream with the given snapshot id (from its header) must be decoded with: None if the
+    stream started from an empty model, or the given snapshot if it has that id. Raises an error otherwise.
+    """
+    if snapshot_id == ppmcontainer.NO_SNAPSHOT:
+        return None
+    if snapshot is None:
+        raise ValueError("The stream was compressed with a snapshot, which must be given to decompress it")
+    if snapshot.id != snapshot_id:
+        raise ValueError("The stream was compressed with another snapshot")
+    return snapshot
+
+
+def final_function(args):
+    """
+    Final function to train a snapshot on the given corpus.
+    """
+    # Handle command line arguments
+    parser = argparse.ArgumentParser(prog="ppmsnapshot.py", description="PPM model snapshot training")
+    parser.add_argument("corpus")
+    parser.add_argument("snapshotfile")
+    parser.add_argument("--order", type=int, default=ppmcontainer.DEFAULT_PARAMETERS.order,
+                        help="model order, at least -1")
+    parser.add_argument("--max-total", type=int, default=None,
+                        help="frequency total at which the counts of a context are halved (default: the largest "
+                             "total the coder accepts)")
+    parser.add_argument("--coder", choices=ppmcontainer.CODERS, default=arithmeticcoding.ARITHMETIC,
+                        help="coder the snapshot is used with, which gives the default maximum total")
+    args = parser.parse_args(args)
+    max_total = args.max_total
+    if max_total is None:
+        max_total = arithmeticcoding.RANGE_MAX_TOTAL if args.coder == arithmeticcoding.RANGE else \
+            ppmcontainer.DEFAULT_PARAMETERS.max_total
+    params = ppmcontainer.DEFAULT_PARAMETERS._replace(order=args.order, max_total=max_total, coder=args.coder)
+
+    with mmapio.open_input(args.corpus) as inp:
+        model = train(iter(lambda: inp.read(arithmeticcoding.BUFFER_SIZE), b""), params)
+    save(model, args.snapshotfile)
+    print("{} contexts".format(model.num_contexts), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    final_function(sys.argv[1:])
@@ -0,0 +1,214 @@
+"""
+Optional instrumentation of the PPM codec, to see why a run is slow or compresses badly and to tune the model order
+and the memory settings on real data. Pass a PpmStats object to compress or decompress (ppm_compress.py and
+ppm_decompress.py, or their --stats option) and it is filled with:
+    symbols             number of bytes coded, and the EOF symbol
+    coded, escaped      per order (from -1 up to the model order), how many symbols were coded in a context of that
+                        order and how many escape symbols were coded there
+    bits                per order, the information content of those symbols and escapes, the sum of
+                        log2(total / frequency), which is what the arithmetic coder spends on them within 2 bits
+    shifts, underflows  calls of ArithmeticCoderBase.shift and underflow (only counted with the arithmetic coder)
+    contexts_created    context nodes created by PpmModel.update
+    budget_enforcements times the context budget was exceeded (see ppmmodel.RESTART and PRUNE)
+    dense_promotions    sparse frequency tables replaced by dense Fenwick tables
+    halvings            frequency tables halved because their total passed the maximum total
+The counters can be dumped as JSON with to_json.
+
+Without a PpmStats object, the codec runs the plain classes and functions, so the instrumentation costs nothing. With
+one, it runs the counting subclasses below instead. They always take the checked path of the coder, since the fast
+path inlines the shifts and underflows, so an instrumented run is slower.
+"""
+
+import json
+import math
+import arithmeticcoding
+import ppmcodec
+import ppmmodel
+
+
+class PpmStats(object):
+    """
+    Counters of one compression or decompression, see the module documentation.
+    """
+
+    def __init__(self):
+        self.model_order = None  # Set when the model is created
+        self.symbols = 0
+        self.coded = []  # coded[i] is the number of symbols coded at order i-1
+        self.escaped = []
+        self.bits = []
+        self.shifts = 0
+        self.underflows = 0
+        self.contexts_created = 0
+        self.budget_enforcements = 0
+        self.dense_promotions = 0
+        self.halvings = 0
+
+    def new_encoder(self, params, bitout):
+        """
+        Returns the encoder of the given parameters, an arithmetic encoder that counts its shifts and underflows or a
+        checked range encoder.
+        """
+        if params.coder == arithmeticcoding.RANGE:
+            return ppmcodec.new_encoder(params, bitout, arithmeticcoding.CHECKED)
+        return CountingEncoder(params.numbits, bitout, self)
+
+    def new_decoder(self, params, bitin):
+        """
+        Returns the decoder of the given parameters, an arithmetic decoder that counts its shifts and underflows or a
+        checked range decoder.
+        """
+        if params.coder == arithmeticcoding.RANGE:
+            return ppmcodec.new_decoder(params, bitin, arithmeticcoding.CHECKED)
+        return CountingDecoder(params.numbits, bitin, self)
+
+    def new_model(self, params, coder, snapshot=None):
+        """
+        Returns a PPM model for the given parameters that counts its contexts and table changes, primed with the
+        given ppmsnapshot.Snapshot, if any.
+        """
+        model = ppmcodec.new_model(params, coder, lambda *args: CountingPpmModel(self, *args), snapshot)
+        self.model_order = model.model_order
+        levels = model.model_order + 2
+        self.coded = [0] * levels
+        self.escaped = [0] * levels
+        self.bits = [0.0] * levels
+        return model
+
+    def encode_symbol(self, model, symbol, enc):
+        """
+        Same as ppmcodec.encode_symbol, counting the symbols and escapes coded at every order.
+        """
+        self.symbols += 1
+        contexts = model.active_contexts
+        for order in range(len(contexts) - 1, -1, -1):
+            freqs = contexts[order].frequencies
+            if freqs.get_total() == 0:  # The context was never updated, so it does not exist yet
+                continue
+            if symbol != 256 and freqs.get(symbol) > 0:
+                self._count(self.coded, order + 1, freqs, symbol)
+                enc.write(freqs, symbol)
+                return
+            self._count(self.escaped, order + 1, freqs, 256)
+            enc.write(freqs, 256)
+        self._count(self.coded, 0, model.order_minus1_freqs, symbol)
+        enc.write(model.order_minus1_freqs, symbol)
+
+    def decode_symbol(self, dec, model):
+        """
+        Same as ppmcodec.decode_symbol, counting the symbols and escapes decoded at every order.
+        """
+        self.symbols += 1
+        contexts = model.active_contexts
+        for order in range(len(contexts) - 1, -1, -1):
+            freqs = contexts[order].frequencies
+            if freqs.get_total() == 0:  # The context was never updated, so it does not exist yet
+                continue
+            symbol = dec.read(freqs)
+            if symbol < 256:
+                self._count(self.coded, order + 1, freqs, symbol)
+                return symbol
+            self._count(self.escaped, order + 1, freqs, 256)
+        symbol = dec.read(model.order_minus1_freqs)
+        self._count(self.coded, 0, model.order_minus1_freqs, symbol)
+        return symbol
+
+    def _count(self, counters, level, freqs, symbol):
+        """
+        Counts one symbol at the given level (order + 1) and adds its information content to the bits of the level.
+        """
+        counters[level] += 1
+        self.bits[level] += math.log2(freqs.get_total() / freqs.get(symbol))
+
+    def to_dict(self):
+        """
+        Returns the counters as a dictionary, with the per order counters keyed by order.
+        """
+        orders = range(-1, len(self.coded) - 1)
+        return {
+            "model_order": self.model_order,
+            "symbols": self.symbols,
+            "coded": {str(order): count for (order, count) in zip(orders, self.coded)},
+            "escaped": {str(order): count for (order, count) in zip(orders, self.escaped)},
+            "bits": {str(order): round(bits, 3) for (order, bits) in zip(orders, self.bits)},
+            "shifts": self.shifts,
+            "underflows": self.underflows,
+            "contexts_created": self.contexts_created,
+            "budget_enforcements": self.budget_enforcements,
+            "dense_promotions": self.dense_promotions,
+            "halvings": self.halvings,
+        }
+
+    def to_json(self):
+        """
+        Returns the counters as a JSON string.
+        """
+        return json.dumps(self.to_dict(), indent=2)
+
+
+class CountingEncoder(arithmeticcoding.ArithmeticEncoder):
+    """
+    An arithmetic encoder that counts its shifts and underflows in a PpmStats object.
+    """
+
+    def __init__(self, numbits, bitout, stats):
+        super(CountingEncoder, self).__init__(numbits, bitout, arithmeticcoding.CHECKED)
+        self.stats = stats
+
+    def shift(self):
+        self.stats.shifts += 1
+        super(CountingEncoder, self).shift()
+
+    def underflow(self):
+        self.stats.underflows += 1
+        super(CountingEncoder, self).underflow()
+
+
+class CountingDecoder(arithmeticcoding.ArithmeticDecoder):
+    """
+    An arithmetic decoder that counts its shifts and underflows in a PpmStats object.
+    """
+
+    def __init__(self, numbits, bitin, stats):
+        super(CountingDecoder, self).__init__(numbits, bitin, arithmeticcoding.CHECKED)
+        self.stats = stats
+
+    def shift(self):
+        self.stats.shifts += 1
+        super(CountingDecoder, self).shift()
+
+    def underflow(self):
+        self.stats.underflows += 1
+        super(CountingDecoder, self).underflow()
+
+
+class CountingPpmModel(ppmmodel.PpmModel):
+    """
+    A PPM model that counts the contexts it creates and the changes of its frequency tables in a PpmStats object.
+    """
+
+    def __init__(self, stats, *args):
+        self.stats = stats
+        self.removed = 0  # Contexts removed by the budget during the current update
+        super(CountingPpmModel, self).__init__(*args)
+
+    def update(self, symbol):
+        before = self.num_contexts
+        self.removed = 0
+        super(CountingPpmModel, self).update(symbol)
+        self.stats.contexts_created += self.num_contexts - before + self.removed
+
+    def _enforce_budget(self):
+        before = self.num_contexts
+        super(CountingPpmModel, self)._enforce_budget()
+        self.stats.budget_enforcements += 1
+        self.removed += before - self.num_contexts
+
+    def _increment(self, ctx, symbol):
+        freqs = ctx.frequencies
+        total = freqs.get_total()
+        super(CountingPpmModel, self)._increment(ctx, symbol)
+        if ctx.frequencies is not freqs:
+            self.stats.dense_promotions += 1
+        if ctx.frequencies.get_total() <= total:
+            self.stats.halvings += 1
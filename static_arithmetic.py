@@ -0,0 +1,228 @@
+"""
+Compression with static order-0 arithmetic coding: every byte is coded with the same frequency table, the frequencies
+of the bytes in the whole file. Like Huffman coding it needs two passes over the file and no model updates, so it is
+much faster than PPM, but it is not limited to codes of a whole number of bits, so it gets closer to the order-0
+entropy of the data than Huffman coding does (which matters most when some bytes are very frequent).
+
+To compress a file please run in the terminal:
+    python static_arithmetic.py compress InputFile OutputFile [--scale-bits N]
+To decompress it please run in the terminal:
+    python static_arithmetic.py decompress InputFile OutputFile
+
+The first pass counts the bytes (with NumPy when it is installed) and scales the counts to a total of 2^scale-bits
+(2^15 by default), keeping every byte that occurs at a frequency of at least 1. The second pass codes the bytes with
+the scaled table, whose cumulative frequencies are computed once, and the decoder finds every byte with a lookup
+table indexed by the scaled value instead of a search. A larger scale gets closer to the real frequencies but makes
+the lookup table larger.
+
+The compressed file starts with a header:
+    magic "STAC", version (1 byte), coder width in bits (1 byte), scale bits (1 byte), original size (8 bytes),
+    CRC-32 of the original data (4 bytes), a bitmap of the byte values that occur (32 bytes, byte value 0 in the
+    most significant bit), and the scaled frequency of each byte value that occurs, in increasing order (2 bytes each)
+followed by the arithmetic-coded stream, padded to a whole byte. All the numbers are big endian. The stream has no
+EOF symbol, since the decoder knows the original size from the header.
+"""
+
+import argparse
+import collections
+import struct
+import sys
+import zlib
+import arithmeticcoding
+import checksum
+import mmapio
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Whether the bytes are counted with NumPy. It is used when it is installed, set to False to use the pure Python code.
+USE_NUMPY = numpy is not None
+
+# Number of different symbols, the scaled frequency of each one is stored in the header.
+NUM_SYMBOLS = 256
+
+# Width of the arithmetic coder.
+NUM_BITS = 32
+
+# Default number of bits of the total of the scaled frequencies. It must leave room for every byte value to have a
+# frequency of at least 1, and the frequencies are stored in 2 bytes.
+SCALE_BITS = 15
+MIN_SCALE_BITS = 8
+MAX_SCALE_BITS = 15
+
+MAGIC = b"STAC"
+VERSION = 1
+HEADER = struct.Struct(">4sBBBQI{}s".format(NUM_SYMBOLS // 8))
+FREQUENCY = struct.Struct(">H")
+
+
+def count_bytes(inp):
+    """
+    Reads the input to its end and returns the count of every byte value, the number of bytes and their CRC-32.
+    """
+    counts = numpy.zeros(NUM_SYMBOLS, dtype=numpy.int64) if USE_NUMPY else collections.Counter()
+    size = 0
+    crc = 0
+    while True:
+        data = inp.read(arithmeticcoding.BUFFER_SIZE)
+        if len(data) == 0:
+            break
+        if USE_NUMPY:
+            counts += numpy.bincount(numpy.frombuffer(data, dtype=numpy.uint8), minlength=NUM_SYMBOLS)
+        else:
+            counts.update(data)
+        size += len(data)
+        crc = zlib.crc32(data, crc)
+    return [int(counts[symbol]) for symbol in range(NUM_SYMBOLS)], size, crc
+
+
+def scale_counts(counts, scale_bits=SCALE_BITS):
+    """
+    Returns the counts scaled to a total of exactly 2^scale_bits, where every symbol with a non-zero count keeps a
+    frequency of at least 1. All zero counts stay all zero.
+    """
+    total = 1 << scale_bits
+    size = sum(counts)
+    if size == 0:
+        return [0] * len(counts)
+    if sum(1 for count in counts if count) > total:
+        raise ValueError("Too many distinct symbols for a total of {}".format(total))
+    scaled = [max(count * total // size, 1) if count else 0 for count in counts]
+    # Rounding down leaves some of the total to hand out, and the minimum of 1 may take too much of it. Give the rest
+    # to the most frequent symbol, or take the excess from the symbols with the largest frequencies.
+    excess = sum(scaled) - total
+    if excess < 0:
+        scaled[max(range(len(counts)), key=counts.__getitem__)] -= excess
+    else:
+        for symbol in sorted(range(len(counts)), key=scaled.__getitem__, reverse=True):
+            if excess == 0:
+                break
+            taken = min(excess, scaled[symbol] - 1)
+            scaled[symbol] -= taken
+            excess -= taken
+    return scaled
+
+
+def pack_frequencies(freqs):
+    """
+    Returns the bitmap of the symbols with a non-zero frequency and their packed frequencies, as in the header.
+    """
+    bitmap = bytearray(NUM_SYMBOLS // 8)
+    packed = bytearray()
+    for (symbol, freq) in enumerate(freqs):
+        if freq:
+            bitmap[symbol >> 3] |= 0x80 >> (symbol & 7)
+            packed += FREQUENCY.pack(freq)
+    return bytes(bitmap), bytes(packed)
+
+
+def read_frequencies(inp, bitmap):
+    """
+    Reads the frequencies of the symbols in the bitmap of the header and returns the frequencies of all the symbols.
+    """
+    present = [symbol for symbol in range(NUM_SYMBOLS) if bitmap[symbol >> 3] & (0x80 >> (symbol & 7))]
+    packed = inp.read(len(present) * FREQUENCY.size)
+    if len(packed) != len(present) * FREQUENCY.size:
+        raise ValueError("File is too short to be a static arithmetic coded file")
+    freqs = [0] * NUM_SYMBOLS
+    for (symbol, (freq,)) in zip(present, FREQUENCY.iter_unpack(packed)):
+        freqs[symbol] = freq
+    return freqs
+
+
+def compress(inp, bitout, table):
+    """
+    Codes all the bytes of the input with the static frequency table, which must give a non-zero frequency to each of
+    them. The coded stream is written without a header and flushed.
+    """
+    enc = arithmeticcoding.ArithmeticEncoder(NUM_BITS, bitout, arithmeticcoding.FAST)
+    write = enc.write
+    while True:
+        # Read and encode the bytes, a buffer at a time
+        data = inp.read(arithmeticcoding.BUFFER_SIZE)
+        if len(data) == 0:
+            break
+        for symbol in data:
+            write(table, symbol)
+    enc.finish()
+    bitout.flush()
+
+
+def decompress(bitin, out, table, original_size):
+    """
+    Decodes original_size bytes coded with the static frequency table and writes them to the output.
+    """
+    dec = arithmeticcoding.ArithmeticDecoder(NUM_BITS, bitin, arithmeticcoding.FAST)
+    read = dec.read
+    sink = arithmeticcoding.ByteSink(out)
+    for _ in range(original_size):
+        sink.write(read(table))
+    sink.flush()
+
+
+def compress_file(inputfile, outputfile, scale_bits=SCALE_BITS):
+    """
+    Compresses the input file in two passes: the bytes are counted first, and the header with the scaled frequencies
+    is written before the bytes are coded. Both files are memory-mapped (see mmapio.py).
+    """
+    if not (MIN_SCALE_BITS <= scale_bits <= MAX_SCALE_BITS):
+        raise ValueError("Scale bits must be between {} and {}".format(MIN_SCALE_BITS, MAX_SCALE_BITS))
+    with mmapio.open_input(inputfile) as inp, mmapio.open_output(outputfile) as out:
+        counts, original_size, crc = count_bytes(inp)
+        freqs = scale_counts(counts, scale_bits)
+        bitmap, packed = pack_frequencies(freqs)
+        out.write(HEADER.pack(MAGIC, VERSION, NUM_BITS, scale_bits, original_size, crc, bitmap) + packed)
+        if original_size > 0:
+            inp.seek(0)
+            compress(inp, arithmeticcoding.BitOutputStream(out), arithmeticcoding.StaticFrequencyTable(freqs))
+
+
+def decompress_file(inputfile, outputfile):
+    """
+    Decompresses a file written by compress_file and checks it against the original size and CRC-32 of the header.
+    The output file is mapped at its final size.
+    """
+    with mmapio.open_input(inputfile) as inp:
+        header = inp.read(HEADER.size)
+        if len(header) != HEADER.size:
+            raise ValueError("File is too short to be a static arithmetic coded file")
+        magic, version, numbits, scale_bits, original_size, crc, bitmap = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError("Not a static arithmetic coded file")
+        if version != VERSION:
+            raise ValueError("Unsupported static arithmetic coding version {}".format(version))
+        freqs = read_frequencies(inp, bitmap)
+        if numbits != NUM_BITS or sum(freqs) != (1 << scale_bits if original_size else 0):
+            raise ValueError("Header of the static arithmetic coded file is corrupt")
+        with mmapio.open_output(outputfile, original_size) as out:
+            writer = checksum.ChecksumWriter(out)
+            if original_size > 0:
+                decompress(arithmeticcoding.BitInputStream(inp), writer, arithmeticcoding.StaticFrequencyTable(freqs),
+                           original_size)
+    if writer.crc != crc:
+        raise ValueError("Decompressed data does not match its CRC-32")
+
+
+def final_function(args):
+    """
+    Final function to compress or decompress the given file with static order-0 arithmetic coding.
+    """
+    # Handle command line arguments
+    parser = argparse.ArgumentParser(prog="static_arithmetic.py", description="Static order-0 arithmetic coding")
+    parser.add_argument("command", choices=["compress", "decompress"])
+    parser.add_argument("inputfile")
+    parser.add_argument("outputfile")
+    parser.add_argument("--scale-bits", type=int, default=SCALE_BITS,
+                        help="number of bits of the total of the scaled frequencies ({} to {})".format(
+                            MIN_SCALE_BITS, MAX_SCALE_BITS))
+    args = parser.parse_args(args)
+    if args.command == "compress":
+        compress_file(args.inputfile, args.outputfile, args.scale_bits)
+    else:
+        decompress_file(args.inputfile, args.outputfile)
+
+
+if __name__ == "__main__":
+    final_function(sys.argv[1:])
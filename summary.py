@@ -0,0 +1,18 @@
+"""
+The summary that the Huffman and rANS scripts print after compressing a file.
+"""
+
+import os
+import time
+
+
+def print_summary(filename, compressedfile, start):
+    """
+    Print how many percents the size of the compressed file is from the original file, and how long it took
+    """
+    get_original_filesize = os.path.getsize(filename)
+    get_compressed_filesize = os.path.getsize(compressedfile)
+    percentage = (get_compressed_filesize / get_original_filesize) * 100 if get_original_filesize else 100.0
+    print(round(percentage, 3), "%")
+    end = time.time()
+    print(round((end - start), 3), "s")
@@ -0,0 +1,66 @@
+"""
+Round-trip tests of the asyncio stream adapters, on connections that stay open after the compressed streams.
+
+To run the tests please run in the terminal:
+    python -m unittest test_asyncstreams
+"""
+
+import asyncio
+import random
+import unittest
+import asyncstreams
+
+# Data that is long enough to be coded in several batches, with repeated words for the models to learn.
+WORDS = [b"compression", b"stream", b"model", b"context", b"the", b"of", b"a", b"\n"]
+DATA = b" ".join(random.Random(1).choice(WORDS) for _ in range(20000))
+TRAILER = b"end of message"
+
+
+class AsyncStreamsTest(unittest.IsolatedAsyncioTestCase):
+
+    async def round_trip(self, writer_class, reader_class, payloads):
+        """
+        Sends every payload as a compressed stream on one connection, followed by TRAILER, without closing the
+        connection, and returns what the server decompressed and the bytes it read after the streams.
+        """
+        received = asyncio.get_running_loop().create_future()
+
+        async def handle(reader, writer):
+            chunks = []
+            for _ in payloads:
+                chunks.append(b"".join([chunk async for chunk in reader_class(reader)]))
+            received.set_result((chunks, await reader.readexactly(len(TRAILER))))
+            writer.close()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        async with server:
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            for payload in payloads:
+                stream = writer_class(writer, batch_size=5000)
+                for i in range(0, len(payload), 3000):
+                    await stream.write(payload[i:i + 3000])
+                await stream.finish()
+            writer.write(TRAILER)
+            await writer.drain()
+            result = await asyncio.wait_for(received, 60)
+            writer.close()
+        return result
+
+    async def test_ppm_open_connection(self):
+        payloads = [DATA, b"", DATA[:1000]]
+        chunks, trailer = await self.round_trip(asyncstreams.PpmCompressWriter, asyncstreams.PpmDecompressReader,
+                                                payloads)
+        self.assertEqual(chunks, payloads)
+        self.assertEqual(trailer, TRAILER)
+
+    async def test_huffman_open_connection(self):
+        payloads = [DATA, b"", DATA[:1000]]
+        chunks, trailer = await self.round_trip(asyncstreams.HuffmanCompressWriter,
+                                                asyncstreams.HuffmanDecompressReader, payloads)
+        self.assertEqual(chunks, payloads)
+        self.assertEqual(trailer, TRAILER)
+
+
+if __name__ == "__main__":
+    unittest.main()